@@ -23,8 +23,8 @@ import tkinter as tk
 from tkinter import scrolledtext, ttk, Spinbox, LabelFrame, filedialog
 import subprocess
 import os
-import time
 import threading
+import time
 import ast
 from cam_ops import (
     detect_camera as cam_detect_camera,
@@ -33,168 +33,50 @@ from cam_ops import (
     set_shutter_speed as cam_set_shutter_speed,
     set_aperture as cam_set_aperture,
     capture_image as cam_capture_image,
-    list_files as cam_list_files,
     download_files as cam_download_files,
+    set_session,
+    get_session,
+)
+from cam_session import GPhotoSession
+from cam_config import (
+    load_config, apply_simulator_config, apply_metrics_config,
+    default_bulb_close_command, default_bulb_open_command, default_bulb_seconds,
+    default_calibration_method, default_calibration_sigma, default_capture_filename_template,
+    default_exposure_stats, default_ffmpeg_path, default_file_extensions,
+    default_file_list_page_size, default_focus_method, default_focus_roi,
+    default_intervalometer_overrun_policy, default_live_stack_align, default_live_stack_mode,
+    default_liveview_fps, default_liveview_mode, default_output_log_file,
+    default_output_log_flush_ms, default_output_log_max_lines, default_persistent_session,
+    default_pipelined_capture, default_shutter_speed_mapping, default_thumbnail_cache_dir,
+    default_thumbnail_cache_mb, default_video_fps, default_video_size,
+)
+from cam_sim import simulator_enabled
+from cam_scheduler import IntervalScheduler
+from cam_pipeline import CapturePipeline, burst_capture as cam_burst_capture
+from cam_naming import FileNamer
+from cam_dispatch import CommandDispatcher
+from cam_log import OutputLog
+from cam_sync import sync_camera, verify_synced
+from cam_files import FileListCache, format_record, camera_path
+from cam_thumbs import ThumbnailCache, fetch_thumbnails
+from cam_liveview import LiveView, LIVEVIEW_MODES
+from cam_focus import FocusMeter, FOCUS_METHODS
+from cam_exposure import ExposureAnalyzer
+from cam_bulb import BulbController
+from cam_calib import (
+    CalibrationSession, Calibrator, CalibrationWorker, FRAME_TYPES, COMBINE_METHODS,
 )
+from cam_stack import LiveStacker, STACK_MODES
+from cam_render import TimeLapseRenderer, iter_frames, format_stats as format_render_stats
 import webbrowser
 
+try:
+    from PIL import Image, ImageTk
+except ImportError:  # Thumbnails are listed by name only
+    Image = ImageTk = None
+
 success_color = "green"
 
-# Default shutter speed mapping (fallback if config file is missing or invalid)
-default_shutter_speed_mapping = {
-    "0.5000s": "1/2",
-    "0.3333s": "1/3",
-    "0.2500s": "1/4",
-    "0.2000s": "1/5",
-    "0.1666s": "1/6",
-    "0.1250s": "1/8",
-    "0.1000s": "1/10",
-    "0.0666s": "1/15",
-    "0.0500s": "1/20",
-    "0.0333s": "1/30",
-    "0.0250s": "1/40",
-    "0.0166s": "1/60",
-    "0.0111s": "1/90",
-    "0.0100s": "1/100",
-    "0.0080s": "1/125",
-    "0.0063s": "1/160",
-    "0.0050s": "1/200",
-    "0.0040s": "1/250",
-    "0.0031s": "1/320",
-    "0.0025s": "1/400",
-    "0.0020s": "1/500",
-    "0.0016s": "1/640",
-    "0.0013s": "1/800",
-    "0.0010s": "1/1000",
-    "0.0008s": "1/1250",
-    "0.0006s": "1/1600",
-    "0.0005s": "1/2000",
-    "0.0004s": "1/2500",
-    "0.0003s": "1/3200",
-    "0.0002s": "1/4000",
-    "1.0000s": '1"',
-    "1.5000s": '1.5"',
-    "2.0000s": '2"',
-    "3.0000s": '3"',
-    "4.0000s": '4"',
-    "5.0000s": '5"',
-    "6.0000s": '6"',
-    "8.0000s": '8"',
-    "10.0000s": '10"',
-    "15.0000s": '15"',
-    "20.0000s": '20"',
-    "25.0000s": '25"',
-    "30.0000s": '30"',
-}
-
-# Default file extensions to look for after capture
-default_file_extensions = [".jpg", ".nef", ".cr2", ".arw", ".raf", ".orf", ".rw2", ".dng", ".3fr", ".pef", ".tif", ".tiff", ".fits", ".fit"]
-
-
-def load_config():
-    """Load configuration from config.py file. Creates default file if missing."""
-    # Get the directory where this script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(script_dir, "config.py")
-    
-    # Default config content
-    default_config_content = '''# Camera Control Configuration
-# Edit this file to customize camera settings
-
-# Shutter speed mapping for display
-# Maps camera values (keys) to display values (values)
-shutter_speed_mapping = {
-    "0.5000s": "1/2",
-    "0.3333s": "1/3",
-    "0.2500s": "1/4",
-    "0.2000s": "1/5",
-    "0.1666s": "1/6",
-    "0.1250s": "1/8",
-    "0.1000s": "1/10",
-    "0.0666s": "1/15",
-    "0.0500s": "1/20",
-    "0.0333s": "1/30",
-    "0.0250s": "1/40",
-    "0.0166s": "1/60",
-    "0.0111s": "1/90",
-    "0.0100s": "1/100",
-    "0.0080s": "1/125",
-    "0.0063s": "1/160",
-    "0.0050s": "1/200",
-    "0.0040s": "1/250",
-    "0.0031s": "1/320",
-    "0.0025s": "1/400",
-    "0.0020s": "1/500",
-    "0.0016s": "1/640",
-    "0.0013s": "1/800",
-    "0.0010s": "1/1000",
-    "0.0008s": "1/1250",
-    "0.0006s": "1/1600",
-    "0.0005s": "1/2000",
-    "0.0004s": "1/2500",
-    "0.0003s": "1/3200",
-    "0.0002s": "1/4000",
-    "1.0000s": '1"',
-    "1.5000s": '1.5"',
-    "2.0000s": '2"',
-    "3.0000s": '3"',
-    "4.0000s": '4"',
-    "5.0000s": '5"',
-    "6.0000s": '6"',
-    "8.0000s": '8"',
-    "10.0000s": '10"',
-    "15.0000s": '15"',
-    "20.0000s": '20"',
-    "25.0000s": '25"',
-    "30.0000s": '30"',
-}
-
-# File extensions to look for after capture
-# Add extensions for your camera's RAW format if needed
-# Common formats: .nef (Nikon), .cr2 (Canon), .arw (Sony), .raf (Fuji), 
-#                 .orf (Olympus), .rw2 (Panasonic), .dng (Adobe/Leica), 
-#                 .3fr (Hasselblad), .pef (Pentax/Ricoh)
-# Professional/Astro: .tif, .tiff, .fits, .fit
-file_extensions = [".jpg", ".nef", ".cr2", ".arw", ".raf", ".orf", ".rw2", ".dng", ".3fr", ".pef", ".tif", ".tiff", ".fits", ".fit"]
-
-'''
-    
-    # Create config file if it doesn't exist
-    if not os.path.exists(config_path):
-        try:
-            with open(config_path, 'w') as f:
-                f.write(default_config_content)
-        except Exception as e:
-            print(f"Warning: Could not create config file: {e}")
-            return {
-                "shutter_speed_mapping": default_shutter_speed_mapping,
-                "file_extensions": default_file_extensions
-            }
-    
-    # Load config from file
-    try:
-        # Create a restricted namespace for safe execution
-        config_namespace = {}
-        with open(config_path, 'r') as f:
-            config_code = f.read()
-        exec(compile(config_code, config_path, 'exec'), config_namespace)
-        
-        # Extract config values from the namespace
-        config = {
-            "shutter_speed_mapping": config_namespace.get(
-                "shutter_speed_mapping", default_shutter_speed_mapping
-            ),
-            "file_extensions": config_namespace.get(
-                "file_extensions", default_file_extensions
-            )
-        }
-        return config
-    except Exception as e:
-        print(f"Warning: Error loading config file: {e}. Using defaults.")
-        return {
-            "shutter_speed_mapping": default_shutter_speed_mapping,
-            "file_extensions": default_file_extensions
-        }
 
 
 # Load configuration at startup
@@ -202,6 +84,95 @@ config = load_config()
 shutter_speed_mapping = config.get("shutter_speed_mapping", default_shutter_speed_mapping)
 file_extensions = config.get("file_extensions", default_file_extensions)
 
+intervalometer_overrun_policy = config.get(
+    "intervalometer_overrun_policy", default_intervalometer_overrun_policy
+)
+pipelined_capture = config.get("pipelined_capture", default_pipelined_capture)
+
+try:
+    file_namer = FileNamer(config.get("capture_filename_template", default_capture_filename_template))
+except (KeyError, ValueError, IndexError) as e:
+    print(f"Warning: Invalid capture_filename_template: {e}. Using default.")
+    file_namer = FileNamer(default_capture_filename_template)
+
+output_log_max_lines = config.get("output_log_max_lines", default_output_log_max_lines)
+output_log_flush_ms = config.get("output_log_flush_ms", default_output_log_flush_ms)
+try:
+    output_log = OutputLog(output_log_max_lines, config.get("output_log_file", default_output_log_file))
+except OSError as e:
+    print(f"Warning: Could not open output log file: {e}")
+    output_log = OutputLog(output_log_max_lines)
+
+file_list_page_size = config.get("file_list_page_size", default_file_list_page_size)
+file_cache = FileListCache()
+file_page_offset = 0
+try:
+    thumbnail_cache = ThumbnailCache(
+        config.get("thumbnail_cache_dir", default_thumbnail_cache_dir),
+        config.get("thumbnail_cache_mb", default_thumbnail_cache_mb) * 1024 * 1024,
+    )
+except OSError as e:
+    print(f"Warning: Could not create thumbnail cache: {e}")
+    thumbnail_cache = None
+browser_window = None
+browser_grid = None
+
+liveview_mode = config.get("liveview_mode", default_liveview_mode)
+if liveview_mode not in LIVEVIEW_MODES:
+    print(f"Warning: Invalid liveview_mode '{liveview_mode}'. Using '{default_liveview_mode}'.")
+    liveview_mode = default_liveview_mode
+liveview = None
+liveview_photo = None
+LIVEVIEW_SIZE = (720, 480)
+
+focus_method = config.get("focus_method", default_focus_method)
+if focus_method not in FOCUS_METHODS:
+    print(f"Warning: Invalid focus_method '{focus_method}'. Using '{default_focus_method}'.")
+    focus_method = default_focus_method
+focus_roi = config.get("focus_roi", default_focus_roi)
+focus_meter = None
+focus_plotted = None
+
+exposure_analyzer = None
+if config.get("exposure_stats", default_exposure_stats):
+    exposure_analyzer = ExposureAnalyzer()
+
+bulb_open_command = config.get("bulb_open_command", default_bulb_open_command)
+bulb_close_command = config.get("bulb_close_command", default_bulb_close_command)
+
+calibration_method = config.get("calibration_method", default_calibration_method)
+if calibration_method not in COMBINE_METHODS:
+    print(f"Warning: Invalid calibration_method '{calibration_method}'. Using '{default_calibration_method}'.")
+    calibration_method = default_calibration_method
+calibration_sigma = config.get("calibration_sigma", default_calibration_sigma)
+calibration_worker = None
+# Time lapse or calibration series running on its own dispatcher thread
+sequence_task = None
+
+live_stack_mode = config.get("live_stack_mode", default_live_stack_mode)
+if live_stack_mode not in STACK_MODES:
+    print(f"Warning: Invalid live_stack_mode '{live_stack_mode}'. Using '{default_live_stack_mode}'.")
+    live_stack_mode = default_live_stack_mode
+live_stack_align = config.get("live_stack_align", default_live_stack_align)
+live_stacker = None
+stack_window = None
+stack_label = None
+stack_info_label = None
+stack_photo = None
+STACK_PREVIEW_SIZE = (600, 400)
+
+video_fps = config.get("video_fps", default_video_fps)
+video_size = config.get("video_size", default_video_size)
+ffmpeg_path = config.get("ffmpeg_path", default_ffmpeg_path)
+browser_cells = {}
+
+# Must be set before any gphoto2 command is run
+apply_simulator_config(config)
+apply_metrics_config(config)
+
+if config.get("persistent_session", default_persistent_session):
+    set_session(GPhotoSession())
+
 # default save path
 save_path = os.path.join(os.getcwd(), "captures")
 os.makedirs(save_path, exist_ok=True)
@@ -209,10 +180,42 @@ delay = 1.0  # default
 auto_open_images = False  # Auto-open captured images
 
 
-def update_camera_settings_to_show():
-    """Update UI with current camera settings."""
-    settings = get_camera_settings(shutter_speed_mapping)
-    
+def set_status(msg, color):
+    """Show a status message. Must run on the Tk thread."""
+    status_label.config(text=msg, fg=color)
+
+
+def status_cb(msg, color):
+    """Status callback for camera operations; safe to call from workers."""
+    dispatcher.post(set_status, msg, color)
+
+
+def output_cb(text):
+    """Output callback for camera operations; safe to call from workers."""
+    if text == "":  # Clear output
+        output_log.clear()
+    else:
+        output_log.append(text)
+
+
+def flush_output_log():
+    """Move buffered output into the CLI Output tab, trimming the oldest lines."""
+    cleared, text, dropped = output_log.drain()
+    if cleared:
+        output_text.delete(1.0, tk.END)
+    if dropped:
+        output_text.insert(tk.END, f"[... {dropped} line(s) dropped ...]\n")
+    if text:
+        output_text.insert(tk.END, text)
+    if text or dropped:
+        lines = int(output_text.index("end-1c").split(".")[0])
+        if lines > output_log_max_lines:
+            output_text.delete(1.0, f"{lines - output_log_max_lines + 1}.0")
+    root.after(output_log_flush_ms, flush_output_log)
+
+
+def show_camera_settings(settings):
+    """Update UI with camera settings read by read_camera_settings()."""
     # Handle errors
     if settings["errors"]:
         for error in settings["errors"]:
@@ -235,6 +238,17 @@ def update_camera_settings_to_show():
         aperture_message.config(text=f"Aperture: {settings['aperture']}")
 
 
+def read_camera_settings():
+    """Read camera settings on a worker and hand them to the UI."""
+    settings = get_camera_settings(shutter_speed_mapping)
+    dispatcher.post(show_camera_settings, settings)
+
+
+def update_camera_settings_to_show():
+    """Update UI with current camera settings."""
+    dispatcher.submit(read_camera_settings, name="Reading camera settings")
+
+
 def set_delay():
     global delay
     try:
@@ -252,45 +266,36 @@ def set_delay_value(value):
 
 def set_iso(value):
     """Wrapper for setting ISO with UI callbacks."""
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
-    
-    cam_set_iso(value, status_callback=status_cb, update_callback=update_camera_settings_to_show)
+    dispatcher.submit(
+        cam_set_iso, value, status_callback=status_cb, update_callback=read_camera_settings,
+        name="Setting ISO",
+    )
 
 
 def set_shutter_speed(value):
     """Wrapper for setting shutter speed with UI callbacks."""
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
-    
-    cam_set_shutter_speed(value, status_callback=status_cb, update_callback=update_camera_settings_to_show)
+    dispatcher.submit(
+        cam_set_shutter_speed, value, status_callback=status_cb,
+        update_callback=read_camera_settings, name="Setting shutter speed",
+    )
 
 
 def set_aperture(value):
     """Wrapper for setting aperture with UI callbacks."""
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
-    
-    cam_set_aperture(value, status_callback=status_cb, update_callback=update_camera_settings_to_show)
+    dispatcher.submit(
+        cam_set_aperture, value, status_callback=status_cb, update_callback=read_camera_settings,
+        name="Setting aperture",
+    )
 
 
 def capture_image_worker():
-    """Worker function for capturing image in a thread."""
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
-    status_label.update_idletasks()
-
-    def output_cb(text):
-        if text == "":  # Clear output
-            output_text.delete(1.0, tk.END)
-        else:
-            output_text.insert(tk.END, text)
-    
+    """Worker function for capturing an image; returns the saved files."""
     files_saved = cam_capture_image(
         save_path,
         file_extensions,
         status_callback=status_cb,
         output_callback=output_cb,
+        namer=file_namer,
     )
     
     # Auto-open image if enabled
@@ -302,69 +307,817 @@ def capture_image_worker():
         elif files_saved:
             # Open the first file (RAW)
             open_image_file(files_saved[0])
+    
+    process_capture(files_saved)
+    
+    # Focus assist also measures full captures, at live view scale so the
+    # values compare
+    jpg_files = [f for f in files_saved if f.lower().endswith(('.jpg', '.jpeg'))]
+    meter = focus_meter
+    if meter is not None and Image is not None and jpg_files:
+        try:
+            with Image.open(jpg_files[0]) as image:
+                image.draft("RGB", LIVEVIEW_SIZE)
+                image = image.convert("RGB")
+                image.thumbnail(LIVEVIEW_SIZE)
+                meter.measure(image)
+            dispatcher.post(draw_focus_plot)
+        except OSError as e:
+            status_cb(f"Focus assist: could not read {jpg_files[0]}: {e}", "orange")
+    
+    return files_saved
+
+
+def process_capture(files):
+    """Hand a new light frame to the background analysis and calibration."""
+    analyze_exposure(files)
+    worker = calibration_worker
+    if worker is not None and files:
+        worker.submit(files)
+    stacker = live_stacker
+    if stacker is not None and files:
+        stacker.submit(files)
+
+
+def analyze_exposure(files):
+    """Compute the exposure statistics of a capture; safe from any thread."""
+    if exposure_analyzer is not None and files:
+        exposure_analyzer.submit(files, dispatcher.ui_callback(show_exposure_stats))
+
+
+def show_exposure_stats(stats, error):
+    """Draw the histogram of a capture and its clipping in the Capture panel."""
+    histogram_canvas.delete("all")
+    if stats is None:
+        exposure_message.config(text=f"No histogram: {error}", fg="gray")
+        return
+    
+    width = int(histogram_canvas["width"])
+    height = int(histogram_canvas["height"])
+    peak = max(max(channel.histogram[2:-2] or [1]) for channel in stats.channels) or 1
+    colors = {"R": "red", "G": "green", "B": "blue"}
+    for channel in stats.channels:
+        points = []
+        for value, count in enumerate(channel.histogram):
+            points.append(value * (width - 1) / 255)
+            points.append(height - 1 - min(count / peak, 1.0) * (height - 2))
+        histogram_canvas.create_line(*points, fill=colors.get(channel.name, "black"))
+    
+    names = "/".join(channel.name for channel in stats.channels)
+    medians = "/".join(str(channel.median) for channel in stats.channels)
+    high = "/".join(f"{channel.clipped_high:.1f}" for channel in stats.channels)
+    low = "/".join(f"{channel.clipped_low:.1f}" for channel in stats.channels)
+    clipped = any(channel.clipped_high >= 1.0 for channel in stats.channels)
+    exposure_message.config(
+        text=f"{stats.source.upper()} {names} median {medians}\n"
+        f"clipped high {high}% low {low}%",
+        fg="red" if clipped else "black",
+    )
 
 
 def capture_image():
-    """Start image capture in a separate thread."""
-    t = threading.Thread(target=capture_image_worker, daemon=True)
-    t.start()
+    """Queue an image capture on the camera worker."""
+    dispatcher.submit(capture_image_worker, name="Capture")
+
+
+def burst_capture_worker(count, task):
+    """Worker function for burst capture."""
+    output_cb("")
+    result = cam_burst_capture(
+        count, save_path, namer=file_namer, file_extensions=file_extensions,
+        status_callback=status_cb, output_callback=output_cb, cancel_event=task.cancel_event,
+    )
+    output_cb(result["stats"].format() + "\n")
+
+    latency = result["latency"]
+    if not result["frames"] or latency is None:
+        status_cb("Error: burst captured no frames", "red")
+        return
+    status_cb(
+        f"Burst: {result['frames']} frames in {result['seconds']:.1f}s "
+        f"({result['fps']:.2f} fps), frame latency p50 {latency['p50'] * 1000:.0f}ms "
+        f"p95 {latency['p95'] * 1000:.0f}ms max {latency['max'] * 1000:.0f}ms; "
+        f"{len(result['files'])} file(s) saved",
+        "green",
+    )
+
+
+def burst_capture():
+    """Queue a burst capture on the camera worker."""
+    try:
+        count = int(burst_spinbox.get())
+    except ValueError:
+        set_status("Invalid input for burst.", "red")
+        return
+    dispatcher.submit(burst_capture_worker, count, name="Burst", with_task=True)
+
+
+def list_files_worker(offset, extensions, task):
+    """Worker function for listing one page of camera files, with progress."""
+    def progress_cb(count):
+        status_cb(f"Listing files... {count} found", "blue")
+    
+    page, stderr = file_cache.query(
+        extensions=extensions, offset=offset, limit=file_list_page_size,
+        cancel_event=task.cancel_event, progress_callback=progress_cb,
+    )
+    output_cb("")
+    if stderr:
+        output_cb(stderr)
+        status_cb(f"Error: {stderr.strip()}", "red")
+        return page
+    
+    for record in page.records:
+        output_cb(format_record(record) + "\n")
+    if page.total:
+        status_cb(
+            f"Files {page.offset + 1}-{page.offset + len(page.records)} of {page.total}", "green"
+        )
+    else:
+        status_cb("No files found", "green")
+    return page
+
+
+def show_file_page(offset):
+    """List the page of camera files starting at offset."""
+    def done(page):
+        global file_page_offset
+        file_page_offset = page.offset
+        prev_page_button.config(state=tk.NORMAL if page.offset > 0 else tk.DISABLED)
+        more = page.offset + len(page.records) < page.total
+        next_page_button.config(state=tk.NORMAL if more else tk.DISABLED)
+    
+    dispatcher.submit(
+        list_files_worker, max(0, offset), file_filter_entry.get(),
+        name="Listing files", with_task=True, on_done=done,
+    )
 
 
 def list_files():
     """List files on camera."""
-    def output_cb(text):
-        if text == "":  # Clear output
-            output_text.delete(1.0, tk.END)
-        else:
-            output_text.insert(tk.END, text)
-    
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
+    show_file_page(0)
+
+
+def previous_file_page():
+    show_file_page(file_page_offset - file_list_page_size)
+
+
+def next_file_page():
+    show_file_page(file_page_offset + file_list_page_size)
+
+
+def download_files_worker(task):
+    """Worker function for downloading all camera files, with progress."""
+    def progress_cb(count):
+        status_cb(f"Downloading... {count} file(s) done", "blue")
     
-    cam_list_files(output_callback=output_cb, status_callback=status_cb)
+    cam_download_files(
+        output_callback=output_cb, status_callback=status_cb,
+        cancel_event=task.cancel_event, progress_callback=progress_cb, save_path=save_path,
+    )
 
 
 def download_files():
     """Download all files from camera."""
-    def output_cb(text):
-        if text == "":  # Clear output
-            output_text.delete(1.0, tk.END)
+    dispatcher.submit(download_files_worker, name="Downloading files", with_task=True)
+
+
+def sync_files_worker(task, records=None):
+    """Worker function for copying new camera files to the output path."""
+    output_cb("")
+    sync_camera(
+        save_path, status_callback=status_cb, output_callback=output_cb,
+        cancel_event=task.cancel_event, records=records,
+    )
+
+
+def sync_files():
+    """Download camera files that are not in the output path yet."""
+    dispatcher.submit(sync_files_worker, name="Syncing files", with_task=True)
+
+
+def browse_card_worker(offset, extensions, task):
+    """Worker function for fetching the thumbnails of one page of camera files."""
+    page, stderr = file_cache.query(
+        extensions=extensions, offset=offset, limit=file_list_page_size,
+        cancel_event=task.cancel_event,
+    )
+    if stderr:
+        status_cb(f"Error: {stderr.strip()}", "red")
+        return
+    dispatcher.post(show_browser_page, page)
+    fetch_thumbnails(
+        page.records, thumbnail_cache,
+        thumb_callback=dispatcher.ui_callback(show_thumbnail),
+        status_callback=status_cb, cancel_event=task.cancel_event,
+    )
+
+
+def browse_card():
+    """Open the card browser on the current page of camera files."""
+    if thumbnail_cache is None:
+        set_status("Thumbnail cache is not available.", "red")
+        return
+    dispatcher.submit(
+        browse_card_worker, file_page_offset, file_filter_entry.get(),
+        name="Fetching thumbnails", with_task=True,
+    )
+
+
+def show_browser_page(page):
+    """Open or reset the card browser window with an empty cell per file."""
+    global browser_window, browser_grid
+    if browser_window is None or not browser_window.winfo_exists():
+        browser_window = tk.Toplevel(root)
+        browser_window.geometry("760x560")
+
+        canvas = tk.Canvas(browser_window)
+        scrollbar = tk.Scrollbar(browser_window, orient="vertical", command=canvas.yview)
+        browser_grid = tk.Frame(canvas)
+        browser_grid.bind(
+            "<Configure>", lambda event: canvas.configure(scrollregion=canvas.bbox("all"))
+        )
+        canvas.create_window((0, 0), window=browser_grid, anchor="nw")
+        canvas.configure(yscrollcommand=scrollbar.set)
+
+        buttons = tk.Frame(browser_window)
+        buttons.pack(side="bottom", fill="x", padx=5, pady=5)
+        tk.Button(buttons, text="Download selected", command=download_selected).pack(side="left")
+        tk.Button(buttons, text="Select all", command=lambda: select_all_thumbnails(True)).pack(
+            side="left", padx=5
+        )
+        tk.Button(buttons, text="Select none", command=lambda: select_all_thumbnails(False)).pack(
+            side="left"
+        )
+        if Image is None:
+            tk.Label(buttons, text="Install Pillow to see thumbnails", fg="gray").pack(side="right")
+        scrollbar.pack(side="right", fill="y")
+        canvas.pack(side="left", fill="both", expand=True)
+
+    last = page.offset + len(page.records)
+    browser_window.title(f"Camera files {page.offset + 1}-{last} of {page.total}")
+    for child in browser_grid.winfo_children():
+        child.destroy()
+    browser_cells.clear()
+    for index, record in enumerate(page.records):
+        cell = tk.Frame(browser_grid, relief="groove", borderwidth=1)
+        cell.grid(row=index // 4, column=index % 4, padx=3, pady=3, sticky="n")
+        image_label = tk.Label(cell, text="...", width=20, height=6)
+        image_label.pack()
+        selected = tk.BooleanVar(value=False)
+        tk.Checkbutton(cell, text=record.name, variable=selected).pack()
+        browser_cells[camera_path(record)] = (record, selected, image_label)
+
+
+def show_thumbnail(record, path):
+    """Put a fetched thumbnail in its cell of the card browser."""
+    cell = browser_cells.get(camera_path(record))
+    if cell is None:
+        return  # The browser moved to another page
+    image_label = cell[2]
+    if path is None:
+        image_label.config(text="no thumbnail")
+    elif Image is None:
+        image_label.config(text=record.mime or "")
+    else:
+        try:
+            image = Image.open(path)
+            image.thumbnail((160, 120))
+            photo = ImageTk.PhotoImage(image)
+        except OSError:
+            image_label.config(text="bad thumbnail")
+            return
+        image_label.config(image=photo, text="", width=160, height=120)
+        image_label.image = photo  # Keep a reference, Tk does not
+
+
+def select_all_thumbnails(value):
+    for _, selected, _ in browser_cells.values():
+        selected.set(value)
+
+
+def download_selected():
+    """Download the full-size files ticked in the card browser."""
+    records = [record for record, selected, _ in browser_cells.values() if selected.get()]
+    if not records:
+        set_status("No files selected.", "orange")
+        return
+    dispatcher.submit(
+        sync_files_worker, name="Downloading selected files", with_task=True, records=records
+    )
+
+
+def toggle_liveview():
+    """Start or stop live view."""
+    global liveview
+    if liveview is not None:
+        stop_liveview()
+        return
+    try:
+        fps = float(liveview_fps_spinbox.get())
+    except ValueError:
+        set_status("Invalid input for live view FPS.", "red")
+        return
+    liveview = LiveView(
+        liveview_mode, fps, LIVEVIEW_SIZE, status_callback=status_cb, frame_callback=measure_focus
+    )
+    liveview.start()
+    liveview_button.config(text="Stop")
+    set_status(f"Live view started ({liveview_mode})", "blue")
+    update_liveview()
+
+
+def stop_liveview():
+    global liveview, liveview_photo
+    if liveview is None:
+        return
+    liveview.stop()
+    liveview = None
+    liveview_photo = None
+    liveview_button.config(text="Start")
+    liveview_label.config(image="", text="Live view is off")
+
+
+def set_liveview_fps():
+    if liveview is not None:
+        try:
+            liveview.set_target_fps(float(liveview_fps_spinbox.get()))
+        except ValueError:
+            pass
+
+
+def update_liveview():
+    """Show the newest live view frame and the frame rates."""
+    global liveview_photo
+    if liveview is None:
+        return
+    frame = liveview.take_frame()
+    if frame is not None and ImageTk is not None:
+        # Paste into the existing image rather than allocating one per frame
+        if liveview_photo is None or (liveview_photo.width(), liveview_photo.height()) != frame.size:
+            liveview_photo = ImageTk.PhotoImage(frame)
+            liveview_label.config(image=liveview_photo, text="")
         else:
-            output_text.insert(tk.END, text)
+            liveview_photo.paste(frame)
+    elif frame is not None:
+        liveview_label.config(text="Install Pillow to see live view frames")
+    stats = liveview.stats()
+    liveview_stats_label.config(
+        text=f"Target {stats['target_fps']:g} fps | camera {stats['camera_fps']:.1f} fps | "
+        f"shown {stats['shown_fps']:.1f} fps | dropped {stats['dropped']}"
+    )
+    draw_focus_plot()
+    if not liveview.running():
+        stop_liveview()
+        return
+    root.after(max(15, int(500 / liveview.target_fps)), update_liveview)
+
+
+def measure_focus(image):
+    """Live view frame callback; runs on the decoder thread."""
+    meter = focus_meter
+    if meter is not None:
+        meter.measure(image)
+
+
+def toggle_focus_assist():
+    """Turn focus assist on or off."""
+    global focus_meter, focus_plotted
+    if not focus_assist_var.get():
+        focus_meter = None
+        focus_label.config(text="Focus assist is off")
+        focus_canvas.delete("all")
+        return
+    try:
+        focus_meter = FocusMeter(focus_method_var.get(), focus_roi)
+    except (RuntimeError, ValueError) as e:
+        focus_assist_var.set(False)
+        set_status(f"Focus assist: {e}", "red")
+        return
+    focus_plotted = None
+    focus_label.config(text="Waiting for a frame...")
+
+
+def reset_focus_assist():
+    """Start a new focus run, with the selected method."""
+    if focus_assist_var.get():
+        toggle_focus_assist()
+        focus_canvas.delete("all")
+
+
+def draw_focus_plot():
+    """Plot the focus metric over time and show the latest and best values."""
+    global focus_plotted
+    meter = focus_meter
+    if meter is None:
+        return
+    history = meter.history()
+    if not history or history[-1] is focus_plotted:
+        return
+    focus_plotted = history[-1]
     
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
+    latest, best = history[-1], meter.best()
+    if meter.method == "hfr":
+        text = "HFR: no stars found" if latest.value is None else (
+            f"HFR {latest.value:.2f} px ({latest.stars} stars)"
+        )
+        if best is not None:
+            text += f" | best {best.value:.2f}"
+    else:
+        text = f"Contrast {latest.value:.1f} | best {best.value:.1f}"
+    focus_label.config(text=text + f" | {latest.seconds * 1000:.0f} ms")
     
-    cam_download_files(output_callback=output_cb, status_callback=status_cb)
+    width = int(focus_canvas["width"])
+    height = int(focus_canvas["height"])
+    values = [r.value for r in history if r.value is not None][-(width // 2):]
+    focus_canvas.delete("all")
+    if len(values) < 2:
+        return
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    step = (width - 10) / (len(values) - 1)
+    points = []
+    for index, value in enumerate(values):
+        points.append(5 + index * step)
+        points.append(height - 5 - (value - low) / span * (height - 10))
+    focus_canvas.create_line(*points, fill="green", width=2)
+    focus_canvas.create_text(5, 5, anchor="nw", text=f"{high:.4g}", fill="gray")
+    focus_canvas.create_text(5, height - 5, anchor="sw", text=f"{low:.4g}", fill="gray")
+
+
+def verify_files_worker():
+    """Worker function for checking synced files against their checksums."""
+    output_cb("")
+    status_cb("Verifying synced files...", "blue")
+    verify_synced(save_path, status_callback=status_cb, output_callback=output_cb)
+
+
+def verify_files():
+    """Check that files synced to the output path are unchanged."""
+    dispatcher.submit(verify_files_worker, name="Verifying files")
+
+
+def new_bulb_controller():
+    return BulbController(
+        open_command=bulb_open_command, close_command=bulb_close_command,
+        file_extensions=file_extensions, namer=file_namer,
+        status_callback=status_cb, output_callback=output_cb,
+    )
 
 
-def start_time_lapse_worker():
+def bulb_exposure_worker(seconds, task):
+    """Worker function for a single bulb exposure."""
+    output_cb("")
+    controller = new_bulb_controller()
+    try:
+        frame = controller.expose(seconds, save_path, cancel_event=task.cancel_event)
+    finally:
+        controller.close()
+    process_capture(frame.files)
+    return frame.files
+
+
+def bulb_exposure():
+    """Take one bulb exposure of the time in the bulb spinbox."""
+    try:
+        seconds = float(bulb_spinbox.get())
+    except ValueError:
+        set_status("Invalid input for bulb exposure.", "red")
+        return
+    dispatcher.submit(bulb_exposure_worker, seconds, name="Bulb exposure", with_task=True)
+
+
+def start_time_lapse_worker(shots, interval, task, bulb_seconds=None, stacker=None, render=False):
+    global live_stacker
+
+    def log_cb(message):
+        output_cb(message + "\n")
+
+    if stacker is not None:
+        stacker.start()
+        live_stacker = stacker
+
+    # Started after the stacking process is forked, which would otherwise
+    # hold ffmpeg's input open
+    render_thread = None
+    pipeline = None
+    bulb = None
+    files_saved = None
+    try:
+        if render:
+            # Encodes the frames as they are saved, finishing after the last one
+            follow_event = threading.Event()
+            render_thread = threading.Thread(
+                target=render_video_worker, name="render", daemon=True,
+                kwargs={"directory": save_path, "since": time.time(), "follow_event": follow_event},
+            )
+            render_thread.start()
+
+        if bulb_seconds:
+            bulb = new_bulb_controller()
+        elif pipelined_capture:
+            pipeline = CapturePipeline(
+                save_path, namer=file_namer, file_extensions=file_extensions,
+                status_callback=status_cb, output_callback=output_cb, saved_callback=process_capture,
+            )
+            pipeline.start()
+
+        def take_frame(index):
+            if bulb is not None:
+                frame = bulb.expose(bulb_seconds, save_path, cancel_event=task.cancel_event)
+                process_capture(frame.files)
+                return bool(frame.files)
+            if pipeline is not None:
+                return bool(pipeline.capture())
+            return bool(capture_image_worker())
+
+        scheduler = IntervalScheduler(
+            interval, shots, policy=intervalometer_overrun_policy, log_callback=log_cb
+        )
+        scheduler.run(take_frame, stop_event=task.cancel_event)
+    finally:
+        # Also on errors: the pipeline thread, the stacking process and
+        # ffmpeg would otherwise outlive the time lapse
+        if bulb is not None:
+            bulb.close()
+        if pipeline is not None:
+            status_cb("Downloading remaining frames...", "blue")
+            files_saved = pipeline.stop()
+            log_cb(pipeline.stats.format())
+        if stacker is not None:
+            # Frames still being downloaded or stacked are included
+            live_stacker = None
+            stacker.stop(os.path.join(save_path, "stacks", time.strftime("stack_%Y%m%d_%H%M%S.npy")))
+        if render_thread is not None:
+            follow_event.set()
+            render_thread.join()
+    if files_saved is not None:
+        status_cb(f"Time lapse done: {len(files_saved)} file(s) saved", "green")
+    if task.cancelled():
+        status_cb(f"Time lapse stopped after {len(scheduler.timings)} frame(s)", "orange")
+    elif scheduler.overruns:
+        status_cb(
+            f"Time lapse done: {scheduler.overruns} frame(s) overran the {interval}s interval",
+            "orange",
+        )
+
+
+def sequence_running():
+    """Return True, and say so, while a time lapse or calibration series runs."""
+    if sequence_task is not None and not sequence_task.done():
+        set_status(f"{sequence_task.name} is still running.", "orange")
+        return True
+    return False
+
+
+def start_time_lapse():
+    global sequence_task
+    if sequence_running():
+        return
     try:
         shots = int(time_lapse_spinbox.get())
         set_delay()
-        for _ in range(shots):
-            capture_image_worker()
-            if "Error:" in status_label.cget("text"):
-                break
-            time.sleep(delay)
+        bulb_seconds = float(bulb_spinbox.get()) if bulb_time_lapse_var.get() else None
     except ValueError:
         status_label.config(text="Invalid input for time lapse.", fg="red")
+        return
+    if bulb_seconds and bulb_seconds >= delay:
+        set_status(f"Delay must be longer than the {bulb_seconds:g}s bulb exposure.", "red")
+        return
+    stacker = None
+    if live_stack_var.get():
+        try:
+            stacker = LiveStacker(
+                live_stack_mode, live_stack_align, STACK_PREVIEW_SIZE,
+                result_callback=dispatcher.ui_callback(show_stack_result),
+            )
+        except (RuntimeError, ValueError) as e:
+            set_status(f"Live stack: {e}", "red")
+            return
+        show_stack_window()
+    sequence_task = dispatcher.submit(
+        start_time_lapse_worker, shots, delay, name="Time lapse", with_task=True, dedicated=True,
+        bulb_seconds=bulb_seconds, stacker=stacker, render=render_video_var.get(),
+    )
 
 
-def start_time_lapse():
-    t = threading.Thread(target=start_time_lapse_worker, daemon=True)
-    t.start()
+def render_video_worker(directory, task=None, since=None, follow_event=None):
+    """
+    Worker function for encoding the JPEGs in directory into a video.
+
+    With follow_event it runs alongside a time lapse and keeps encoding
+    new frames until the event is set.
+    """
+    output = os.path.join(directory, time.strftime("timelapse_%Y%m%d_%H%M%S.mp4"))
+    renderer = TimeLapseRenderer(output, video_fps, video_size, ffmpeg_path)
+
+    def progress_cb(count, path):
+        # While capturing, the capture status matters more
+        if follow_event is None:
+            status_cb(f"Rendering video... {count} frame(s)", "blue")
+
+    stats = renderer.render(
+        iter_frames(directory, since=since, follow_event=follow_event),
+        cancel_event=task.cancel_event if task is not None else None,
+        progress_callback=progress_cb,
+    )
+    output_cb(format_render_stats(stats) + "\n")
+    status_cb(format_render_stats(stats), "red" if stats.error else "green")
+
+
+def render_video():
+    """Encode all JPEGs in the output path into a time-lapse video."""
+    dispatcher.submit(render_video_worker, save_path, name="Rendering video", with_task=True)
+
+
+def show_stack_window():
+    """Open or reset the live stack window."""
+    global stack_window, stack_label, stack_info_label, stack_photo
+    if stack_window is None or not stack_window.winfo_exists():
+        stack_window = tk.Toplevel(root)
+        stack_window.title("Live stack")
+        stack_label = tk.Label(stack_window, bg="black", fg="gray")
+        stack_label.pack(padx=5, pady=5)
+        stack_info_label = tk.Label(stack_window, text="", anchor="w")
+        stack_info_label.pack(fill="x", padx=5, pady=(0, 5))
+    stack_photo = None
+    stack_label.config(image="", text="Waiting for the first frame...")
+    stack_info_label.config(text="")
+
+
+def show_stack_result(result):
+    """Show the preview of the live stack after each frame, and the saved stack."""
+    global stack_photo
+    if result.error:
+        set_status(f"Live stack: {result.error}", "orange")
+    if result.path:
+        set_status(f"Live stack of {result.frames} frame(s) saved to {result.path}", "green")
+    if stack_window is None or not stack_window.winfo_exists():
+        return
+    if result.preview is not None:
+        if ImageTk is not None:
+            stack_photo = ImageTk.PhotoImage(Image.fromarray(result.preview))
+            stack_label.config(image=stack_photo, text="")
+        else:
+            stack_label.config(text="Install Pillow to see the live stack")
+    dy, dx = result.shift
+    text = f"{result.frames} frame(s) stacked, {result.rejected} rejected"
+    if result.path:
+        text += f" | saved to {result.path}"
+    elif result.seconds:
+        text += f" | last shift {dy:+d},{dx:+d} px | {result.seconds * 1000:.0f} ms per frame"
+    stack_info_label.config(text=text)
+
+
+def calibration_session():
+    return CalibrationSession(os.path.join(save_path, "calibration"))
+
+
+def capture_calibration_worker(frame_type, count, bulb_seconds, task):
+    """Worker function for capturing a set of calibration frames."""
+    directory = calibration_session().frame_dir(frame_type)
+    output_cb("")
+    bulb = new_bulb_controller() if bulb_seconds else None
+    taken = 0
+    try:
+        for index in range(count):
+            if task.cancelled():
+                break
+            status_cb(f"{frame_type.capitalize()} frame {index + 1}/{count}...", "blue")
+            if bulb is not None:
+                files = bulb.expose(bulb_seconds, directory, cancel_event=task.cancel_event).files
+                if task.cancelled():
+                    # A shortened dark would spoil the master
+                    for path in files:
+                        os.remove(path)
+                    break
+            else:
+                files = cam_capture_image(
+                    directory, file_extensions, status_callback=status_cb,
+                    output_callback=output_cb, namer=file_namer,
+                )
+            if not files:
+                break
+            taken += 1
+            analyze_exposure(files)
+    finally:
+        if bulb is not None:
+            bulb.close()
+    dispatcher.post(show_calibration_frames)
+    status_cb(
+        f"{taken} of {count} {frame_type} frame(s) saved to {directory}",
+        "green" if taken == count else "orange",
+    )
+
+
+def capture_calibration():
+    """Capture the chosen number of frames of the chosen calibration type."""
+    global sequence_task
+    if sequence_running():
+        return
+    try:
+        count = int(calibration_count_spinbox.get())
+        bulb_seconds = float(bulb_spinbox.get()) if calibration_bulb_var.get() else None
+    except ValueError:
+        set_status("Invalid input for calibration frames.", "red")
+        return
+    frame_type = calibration_type_var.get()
+    sequence_task = dispatcher.submit(
+        capture_calibration_worker, frame_type, count, bulb_seconds,
+        name=f"Capturing {frame_type} frames", with_task=True, dedicated=True,
+    )
+
+
+def build_masters_worker(method, task):
+    """Worker function for combining the calibration frames into masters."""
+    session = calibration_session()
+    try:
+        built = session.build_masters(
+            method, calibration_sigma, progress_callback=lambda message: status_cb(message, "blue"),
+            cancel_event=task.cancel_event,
+        )
+        # New captures are calibrated with the new masters from now on
+        worker = calibration_worker
+        if built and worker is not None:
+            worker.calibrator = Calibrator(session)
+    except (RuntimeError, ValueError, OSError) as e:
+        status_cb(f"Building masters failed: {e}", "red")
+        return
+    finally:
+        dispatcher.post(show_calibration_frames)
+    if task.cancelled():
+        status_cb("Building masters cancelled", "orange")
+    elif not built:
+        status_cb(f"No calibration frames in {session.directory}", "orange")
+    else:
+        status_cb(f"Master {', '.join(built)} built in {session.masters_dir}", "green")
+
+
+def build_masters():
+    """Combine the calibration frames into master frames."""
+    dispatcher.submit(
+        build_masters_worker, calibration_method_var.get(), name="Building masters", with_task=True
+    )
+
+
+def calibrated(path, error):
+    """Calibration worker callback; runs on the calibration thread."""
+    if error:
+        status_cb(f"Calibration failed: {error}", "red")
+    else:
+        output_cb(f"Calibrated: {path}\n")
+
+
+def toggle_calibration():
+    """Turn calibration of new captures on or off."""
+    global calibration_worker
+    if not calibrate_lights_var.get():
+        if calibration_worker is not None:
+            # Finishes the frames already queued
+            calibration_worker.stop()
+            calibration_worker = None
+        set_status("Calibration of new captures is off", "green")
+        return
+    try:
+        calibrator = Calibrator(calibration_session())
+    except (RuntimeError, ValueError, OSError) as e:
+        calibrate_lights_var.set(False)
+        set_status(f"Calibration: {e}", "red")
+        return
+    out_dir = os.path.join(save_path, "calibrated")
+    calibration_worker = CalibrationWorker(calibrator, out_dir, done_callback=calibrated)
+    set_status(
+        f"Calibrating new captures with master {', '.join(calibrator.masters)} into {out_dir}",
+        "green",
+    )
+
+
+def show_calibration_frames():
+    """Show how many calibration frames and which masters there are."""
+    session = calibration_session()
+    counts = ", ".join(f"{t} {len(session.frames(t))}" for t in FRAME_TYPES)
+    masters = ", ".join(session.masters()) or "none"
+    calibration_status_label.config(
+        text=f"{session.directory}\nFrames: {counts}\nMasters: {masters}"
+    )
 
 
 def detect_camera():
     """Detect connected camera."""
-    def output_cb(text):
-        output_text.insert(tk.END, text)
-    
-    def status_cb(msg, color):
-        status_label.config(text=msg, fg=color)
-    
-    cam_detect_camera(output_callback=output_cb, status_callback=status_cb)
+    # The camera may have been swapped or its card changed
+    file_cache.invalidate()
+    dispatcher.submit(
+        cam_detect_camera, output_callback=output_cb, status_callback=status_cb,
+        name="Detecting camera",
+    )
+
+
+def cancel_operations():
+    """Cancel the running camera operation and any queued ones."""
+    tasks = dispatcher.active_tasks()
+    if tasks:
+        dispatcher.cancel_all()
+        set_status(f"Cancelling {tasks[0].name.lower()}...", "orange")
 
 
 def select_output_folder():
@@ -373,6 +1126,7 @@ def select_output_folder():
     if folder_selected:
         save_path = folder_selected
         output_path_label.config(text=f"{save_path}")
+        show_calibration_frames()
 
 
 def open_output_folder():
@@ -409,15 +1163,19 @@ def toggle_auto_open():
 
 # GUI
 root = tk.Tk()
-root.title("CamCtrl 0.4")
+root.title("CamCtrl 0.4 (simulated camera)" if simulator_enabled() else "CamCtrl 0.4")
 root.geometry("940x640")
 root.resizable(False, False)
 
 tabs = ttk.Notebook(root)
 tab_control = ttk.Frame(tabs)
+tab_liveview = ttk.Frame(tabs)
+tab_calibration = ttk.Frame(tabs)
 tab_output = ttk.Frame(tabs)
 tab_info = ttk.Frame(tabs)
 tabs.add(tab_control, text="Control")
+tabs.add(tab_liveview, text="Live View")
+tabs.add(tab_calibration, text="Calibration")
 tabs.add(tab_output, text="CLI Output")
 tabs.add(tab_info, text="Info")
 tabs.grid(row=0, column=0, sticky="nsew")
@@ -425,6 +1183,9 @@ tabs.grid(row=0, column=0, sticky="nsew")
 root.grid_rowconfigure(0, weight=1)
 root.grid_columnconfigure(0, weight=1)
 
+# Camera operations run on a worker; results come back through root.after
+dispatcher = CommandDispatcher(root)
+
 # frames top
 frames_container = tk.Frame(tab_control)
 frames_container.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
@@ -454,6 +1215,10 @@ status_label = tk.Message(
 )
 status_label.grid(row=0, column=0, sticky="nsew")
 
+cancel_button = tk.Button(status_frame, text="Cancel", command=cancel_operations)
+cancel_button.grid(row=0, column=1, padx=2, sticky="ne")
+status_frame.grid_columnconfigure(0, weight=1)
+
 capture_button = tk.Button(
     capture_frame, text="Capture", command=capture_image, width=20, height=4,
     font=("Arial", 10, "bold"),
@@ -477,6 +1242,22 @@ aperture_message = tk.Message(
 )
 aperture_message.grid(row=2, column=1, padx=2, pady=2, sticky="n")
 
+# Exposure of the last capture
+histogram_canvas = tk.Canvas(capture_frame, width=128, height=48, bg="white")
+histogram_canvas.grid(row=0, column=3, rowspan=2, padx=2, pady=2, sticky="n")
+exposure_message = tk.Message(capture_frame, text="", width=200, font=("Arial", 8))
+exposure_message.grid(row=2, column=3, padx=2, pady=2, sticky="n")
+
+# Burst
+burst_frame = tk.Frame(capture_frame)
+burst_frame.grid(row=0, column=2, rowspan=3, padx=2, pady=2, sticky="n")
+
+burst_spinbox = Spinbox(burst_frame, from_=2, to=100, width=4)
+burst_spinbox.grid(row=0, column=0, padx=2)
+
+burst_button = tk.Button(burst_frame, text="Burst", command=burst_capture, width=6)
+burst_button.grid(row=1, column=0, padx=2, pady=2)
+
 # Shutter frame
 shutter_labelframe = LabelFrame(tab_control, text="Shutter speed")
 shutter_labelframe.grid(row=1, column=0, pady=5, padx=5, sticky="nsew")
@@ -496,6 +1277,21 @@ for index, value in enumerate(
     btn = tk.Button(shutter_frame, text=value, command=lambda v=value: set_shutter_speed(v), width=3)
     btn.grid(row=1, column=index, padx=1)
 
+bulb_frame = tk.Frame(shutter_labelframe)
+bulb_frame.grid(row=0, column=1, padx=10, pady=5, sticky="n")
+
+tk.Button(
+    bulb_frame, text="B", command=lambda: set_shutter_speed("bulb"), width=3
+).grid(row=0, column=0, padx=1)
+tk.Label(bulb_frame, text="Bulb (sec)").grid(row=0, column=1, padx=2)
+bulb_spinbox = Spinbox(bulb_frame, from_=1, to=3600, width=5)
+bulb_spinbox.delete(0, tk.END)
+bulb_spinbox.insert(0, str(config.get("bulb_seconds", default_bulb_seconds)))
+bulb_spinbox.grid(row=0, column=2, padx=2)
+tk.Button(bulb_frame, text="Expose", command=bulb_exposure, width=6).grid(
+    row=1, column=0, columnspan=3, pady=2
+)
+
 # Aperture frame
 aperture_labelframe = LabelFrame(tab_control, text="Aperture")
 aperture_labelframe.grid(row=2, column=0, pady=5, padx=5, sticky="nsew")
@@ -538,6 +1334,21 @@ time_lapse_button = tk.Button(
 )
 time_lapse_button.grid(row=0, column=2, padx=5)
 
+bulb_time_lapse_var = tk.BooleanVar(value=False)
+tk.Checkbutton(time_lapse_frame, text="Bulb exposures", variable=bulb_time_lapse_var).grid(
+    row=0, column=3, padx=5
+)
+
+live_stack_var = tk.BooleanVar(value=False)
+tk.Checkbutton(time_lapse_frame, text="Live stack", variable=live_stack_var).grid(
+    row=0, column=4, padx=5
+)
+
+render_video_var = tk.BooleanVar(value=False)
+tk.Checkbutton(time_lapse_frame, text="Render video", variable=render_video_var).grid(
+    row=0, column=5, padx=5
+)
+
 # Delay
 delay_frame = tk.Frame(time_lapse_labelframe)
 delay_frame.grid(row=1, column=0, pady=5, sticky="nsew")
@@ -545,7 +1356,7 @@ delay_frame.grid(row=1, column=0, pady=5, sticky="nsew")
 delay_label = tk.Label(delay_frame, text="Delay (sec)")
 delay_label.grid(row=0, column=0, padx=5)
 
-delay_spinbox = Spinbox(delay_frame, from_=1, to=60, increment=0.5, width=5)
+delay_spinbox = Spinbox(delay_frame, from_=1, to=3600, increment=0.5, width=5)
 delay_spinbox.grid(row=0, column=1)
 
 delay_buttons_frame = tk.Frame(delay_frame)
@@ -555,6 +1366,9 @@ for index, (text, value) in enumerate([("3s", 3), ("5s", 5), ("10s", 10), ("20s"
     btn = tk.Button(delay_buttons_frame, text=text, command=lambda v=value: set_delay_value(v), width=5)
     btn.grid(row=0, column=index, padx=2)
 
+render_button = tk.Button(delay_frame, text="Render folder", command=render_video, width=12)
+render_button.grid(row=0, column=3, padx=5)
+
 # Output path
 output_path_labelframe = LabelFrame(tab_control, text="Output path")
 output_path_labelframe.grid(row=5, column=0, pady=5, padx=5, sticky="nsew")
@@ -587,6 +1401,135 @@ output_text.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
 
 tab_output.grid_rowconfigure(0, weight=1)
 tab_output.grid_columnconfigure(0, weight=1)
+root.after(output_log_flush_ms, flush_output_log)
+
+output_buttons_frame = tk.Frame(tab_output)
+output_buttons_frame.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+
+for index, (text, command) in enumerate(
+    [
+        ("Detect camera", detect_camera),
+        ("List files", list_files),
+        ("Sync new files", sync_files),
+        ("Download all", download_files),
+        ("Verify synced", verify_files),
+        ("Browse card", browse_card),
+    ]
+):
+    btn = tk.Button(output_buttons_frame, text=text, command=command, width=12)
+    btn.grid(row=0, column=index, padx=2)
+
+file_page_frame = tk.Frame(tab_output)
+file_page_frame.grid(row=2, column=0, padx=5, pady=(0, 5), sticky="w")
+
+tk.Label(file_page_frame, text="Extensions:").grid(row=0, column=0, padx=2)
+file_filter_entry = tk.Entry(file_page_frame, width=14)
+file_filter_entry.grid(row=0, column=1, padx=2)
+file_filter_entry.bind("<Return>", lambda event: list_files())
+
+prev_page_button = tk.Button(
+    file_page_frame, text="< Prev", command=previous_file_page, width=8, state=tk.DISABLED
+)
+prev_page_button.grid(row=0, column=2, padx=2)
+next_page_button = tk.Button(
+    file_page_frame, text="Next >", command=next_file_page, width=8, state=tk.DISABLED
+)
+next_page_button.grid(row=0, column=3, padx=2)
+
+# LIVE VIEW TAB
+liveview_label = tk.Label(tab_liveview, text="Live view is off", bg="black", fg="gray")
+liveview_label.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+tab_liveview.grid_rowconfigure(0, weight=1)
+tab_liveview.grid_columnconfigure(0, weight=1)
+
+liveview_controls = tk.Frame(tab_liveview)
+liveview_controls.grid(row=1, column=0, padx=5, pady=5, sticky="w")
+
+liveview_button = tk.Button(liveview_controls, text="Start", command=toggle_liveview, width=8)
+liveview_button.grid(row=0, column=0, padx=2)
+tk.Label(liveview_controls, text="Target FPS:").grid(row=0, column=1, padx=(10, 2))
+liveview_fps_spinbox = Spinbox(
+    liveview_controls, from_=1, to=30, width=4, command=set_liveview_fps
+)
+liveview_fps_spinbox.delete(0, tk.END)
+liveview_fps_spinbox.insert(0, str(config.get("liveview_fps", default_liveview_fps)))
+liveview_fps_spinbox.grid(row=0, column=2, padx=2)
+liveview_fps_spinbox.bind("<Return>", lambda event: set_liveview_fps())
+liveview_stats_label = tk.Label(liveview_controls, text="", fg="gray")
+liveview_stats_label.grid(row=0, column=3, padx=10)
+
+focus_frame = LabelFrame(tab_liveview, text="Focus assist", padx=5, pady=5)
+focus_frame.grid(row=0, column=1, rowspan=2, padx=5, pady=5, sticky="n")
+
+focus_assist_var = tk.BooleanVar(value=False)
+tk.Checkbutton(
+    focus_frame, text="On", variable=focus_assist_var, command=toggle_focus_assist
+).grid(row=0, column=0, sticky="w")
+focus_method_var = tk.StringVar(value=focus_method)
+for index, (text, method) in enumerate([("Stars (HFR)", "hfr"), ("Contrast", "contrast")]):
+    tk.Radiobutton(
+        focus_frame, text=text, variable=focus_method_var, value=method,
+        command=reset_focus_assist,
+    ).grid(row=0, column=index + 1, sticky="w")
+tk.Button(focus_frame, text="Reset", command=reset_focus_assist).grid(row=0, column=3, padx=5)
+
+focus_canvas = tk.Canvas(focus_frame, width=260, height=160, bg="white")
+focus_canvas.grid(row=1, column=0, columnspan=4, pady=5)
+focus_label = tk.Label(focus_frame, text="Focus assist is off", fg="gray", wraplength=260)
+focus_label.grid(row=2, column=0, columnspan=4, sticky="w")
+
+# CALIBRATION TAB
+calibration_frames_frame = LabelFrame(tab_calibration, text="Calibration frames", padx=5, pady=5)
+calibration_frames_frame.grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
+
+calibration_type_var = tk.StringVar(value="dark")
+for index, frame_type in enumerate(FRAME_TYPES):
+    tk.Radiobutton(
+        calibration_frames_frame, text=frame_type.capitalize(), variable=calibration_type_var,
+        value=frame_type,
+    ).grid(row=0, column=index, sticky="w")
+tk.Label(calibration_frames_frame, text="Frames:").grid(row=0, column=3, padx=(10, 2))
+calibration_count_spinbox = Spinbox(calibration_frames_frame, from_=1, to=200, width=4)
+calibration_count_spinbox.delete(0, tk.END)
+calibration_count_spinbox.insert(0, "20")
+calibration_count_spinbox.grid(row=0, column=4, padx=2)
+calibration_bulb_var = tk.BooleanVar(value=False)
+tk.Checkbutton(
+    calibration_frames_frame, text="Bulb exposures", variable=calibration_bulb_var
+).grid(row=0, column=5, padx=5)
+tk.Button(
+    calibration_frames_frame, text="Capture set", command=capture_calibration, width=12
+).grid(row=0, column=6, padx=5)
+tk.Label(
+    calibration_frames_frame, fg="gray", justify="left", anchor="w",
+    text="Bias: shortest shutter speed, lens capped. Dark: the exposure, ISO and temperature "
+    "of the lights, lens capped.\nFlat: evenly lit target, same focus and aperture as the lights.",
+).grid(row=1, column=0, columnspan=7, pady=(5, 0), sticky="w")
+
+calibration_masters_frame = LabelFrame(tab_calibration, text="Master frames", padx=5, pady=5)
+calibration_masters_frame.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+
+calibration_method_var = tk.StringVar(value=calibration_method)
+for index, (text, method) in enumerate([("Median", "median"), ("Sigma clip", "sigma_clip")]):
+    tk.Radiobutton(
+        calibration_masters_frame, text=text, variable=calibration_method_var, value=method,
+    ).grid(row=0, column=index, sticky="w")
+tk.Button(
+    calibration_masters_frame, text="Build masters", command=build_masters, width=12
+).grid(row=0, column=2, padx=5)
+
+calibration_lights_frame = LabelFrame(tab_calibration, text="Light frames", padx=5, pady=5)
+calibration_lights_frame.grid(row=2, column=0, padx=5, pady=5, sticky="nsew")
+
+calibrate_lights_var = tk.BooleanVar(value=False)
+tk.Checkbutton(
+    calibration_lights_frame, text="Calibrate new captures (saved to calibrated/ as .npy)",
+    variable=calibrate_lights_var, command=toggle_calibration,
+).grid(row=0, column=0, sticky="w")
+
+calibration_status_label = tk.Label(tab_calibration, text="", justify="left", anchor="w")
+calibration_status_label.grid(row=3, column=0, padx=10, pady=5, sticky="w")
+show_calibration_frames()
 
 # TAB 3
 info_text = """CamCtrl 0.4
@@ -595,13 +1538,16 @@ OVERVIEW
 CamCtrl is a cross-platform desktop UI application for remote control of DSLR and mirrorless cameras via USB connection. Built with Python and Tkinter, it provides an intuitive graphical interface for camera operations using the gphoto2 library.
 
 INTERFACE SECTIONS
-• Capture - The main capture button allows you to take a single photograph. The current camera settings (ISO, shutter speed, and aperture) are displayed next to the button for quick reference.
-• Status - Shows status messages and feedback from camera operations.
-• Shutter Speed -  Control panel with buttons for all available shutter speeds.
+• Capture - The main capture button allows you to take a single photograph. The current camera settings (ISO, shutter speed, and aperture) are displayed next to the button for quick reference. "Burst" takes the chosen number of frames back to back as fast as the camera allows and reports the frame rate achieved. After each capture the panel shows the histogram of the image and the percentage of pixels clipped in the highlights and shadows per channel (in red when highlights clip); it is computed in the background and does not slow down captures.
+• Status - Shows status messages and feedback from camera operations. Camera operations run in the background, so the window stays responsive; "Cancel" stops the running operation (time lapse, burst, file listing or download).
+• Shutter Speed -  Control panel with buttons for all available shutter speeds. For exposures longer than 30", set the camera to bulb ("B"), enter the time and click "Expose": the computer opens and closes the shutter, timed to a few milliseconds, and the CLI Output tab logs when the shutter opened and closed and the exposure achieved.
 • Aperture: Control panel with buttons for various aperture values (f-stops) from f/1.4 to f/22.
 • ISO: Control panel with buttons for ISO sensitivity values.
-• Intervalometer: Automated time-lapse photography tool. Set the number of captures (1-100) and the delay between shots (1-60 seconds). Use preset delay buttons (3s, 5s, 10s, 20s) or enter a custom value. Click "Start" to begin the sequence.
+• Intervalometer: Automated time-lapse photography tool. Set the number of captures (1-100) and the delay between the start of each shot (1-3600 seconds); the cadence is kept fixed however long a capture takes. With "Bulb exposures" ticked every frame is a bulb exposure of the time set in the Shutter speed panel. Use preset delay buttons (3s, 5s, 10s, 20s) or enter a custom value. Click "Start" to begin the sequence. With "Live stack" ticked each frame is added to a running average (aligned to the first frame) in a separate process, whose preview is shown in its own window as the sequence runs; the stack is saved as a NumPy array in "stacks" in the output path at the end. Needs NumPy. With "Render video" ticked the frames are also encoded into an H.264 video (timelapse_<date>_<time>.mp4 in the output path) while they are captured, so the video is ready right after the last frame; "Render folder" makes a video of all JPEGs in the output path, oldest first. Frames are resized one at a time, so any number of frames can be rendered. Needs ffmpeg.
+• Live View: Streams preview frames from the camera, e.g. for focusing. Set the target frame rate; the rate the camera delivers, the rate shown and the frames dropped to keep up are displayed. Needs Pillow to show the frames. "Focus assist" measures the centre of every frame (and of each capture) and plots it: half-flux radius of the stars for astro (lower is sharper) or contrast for daylight subjects (higher is sharper). Needs NumPy.
+• Calibration: Captures sets of bias, dark and flat frames (into "calibration" in the output path, with the current camera settings or as bulb exposures), combines each set into a master frame by median or sigma clipping, and optionally calibrates every new capture with the masters in the background: (light - dark) / flat, saved as a NumPy array in "calibrated". RAW files are calibrated on the sensor data (needs rawpy), JPEGs per colour channel. Masters are combined from files on disk a strip at a time, so large sets do not need much memory. Needs NumPy.
 • Output Path: Manage where captured images are saved. The "Auto Open" button toggles automatic opening of captured images in your default viewer.
+• CLI Output: gphoto2 output, plus buttons to detect the camera and list its files. "List files" shows the camera files a page at a time, optionally only some extensions (e.g. "jpg, cr2"); the listing is kept until files are captured or the camera is detected again, so paging and filtering do not re-read the card. "Sync new files" copies only the camera files not yet in the output path (an interrupted sync resumes where it stopped), checking each file's size and recording its SHA-256 checksum; "Verify synced" re-checks the copied files against those checksums; "Browse card" shows the thumbnails of the listed page of files (kept in a cache, so browsing again does not re-read them), from which only the selected full-size files are downloaded; "Download all" copies the whole card into the output path.
 
 REQUIREMENTS
 • gphoto2: Required for camera communication
@@ -610,9 +1556,12 @@ REQUIREMENTS
   - macOS: brew install gphoto2
   - Linux: sudo apt-get install gphoto2 (or use your distribution's package manager)
   - Windows: Download from gphoto2 website
+• ffmpeg: Optional, to render time-lapse videos
+  - macOS: brew install ffmpeg
+  - Linux: sudo apt-get install ffmpeg
 
 CONFIGURATION
-Settings can be customized by editing the config.py file in the application directory."""
+Settings can be customized by editing the config.py file in the application directory. Set "simulator" there (or the CAMCTRL_SIMULATOR environment variable) to use a simulated camera instead of gphoto2, e.g. to try CamCtrl without a camera. Set "metrics_log" and "metrics_port" to record how long each camera operation takes, phase by phase."""
 info_label = tk.Text(
     tab_info,
     wrap=tk.WORD,
@@ -653,3 +1602,15 @@ exit_button.grid(row=1, column=0, sticky="se", padx=5, pady=5)
 update_camera_settings_to_show()
 
 root.mainloop()
+
+stop_liveview()
+if exposure_analyzer is not None:
+    exposure_analyzer.shutdown()
+if calibration_worker is not None:
+    calibration_worker.stop()
+dispatcher.shutdown()
+output_log.close()
+
+# Release the camera held by the persistent session
+if get_session() is not None:
+    get_session().close()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Benchmarks for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Latency and throughput benchmarks of the camera operations.
+
+Runs the cam_ops operations the GUI uses against the connected camera or
+the simulator (cam_sim.py) and writes the results as JSON, so runs before
+and after a change can be compared:
+
+    python3 cam_bench.py --simulator --output before.json
+    ... change cam_ops.py ...
+    python3 cam_bench.py --simulator --output after.json
+    python3 cam_bench.py --compare before.json after.json
+
+With a real camera, captures are taken and the whole card is downloaded
+(--only leaves benchmarks out), into a temporary directory that is
+deleted afterwards unless --save-path is given.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import cam_ops
+from cam_pipeline import CapturePipeline, percentile
+from cam_scheduler import IntervalScheduler, OVERRUN_POLICIES
+from cam_session import GPhotoSession, SessionError
+from cam_sim import SIMULATOR_ENV, parse_options, simulator_enabled
+
+BENCHMARKS = ("settings", "set", "capture", "download", "intervalometer")
+
+# Two values each set_* benchmark alternates between, so every call
+# really changes the setting
+SET_VALUES = {
+    "iso": ("400", "800"),
+    "shutter_speed": ("1/125", "1/250"),
+    "aperture": ("f/5.6", "f/8"),
+}
+
+# Results compared by --compare: (benchmark, key path, higher is better)
+COMPARED = (
+    ("latency", "p50", False),
+    ("latency", "p95", False),
+    ("latency", "p99", False),
+    ("frames_per_minute", None, True),
+    ("mb_per_s", None, True),
+    ("jitter", "p95", False),
+)
+
+
+def summarize(values):
+    """
+    Summarize durations in seconds.
+
+    Returns:
+        Dictionary with 'count', 'mean', 'min', 'p50', 'p95', 'p99' and
+        'max', in milliseconds (None values if there are none)
+    """
+    if not values:
+        return {"count": 0, "mean": None, "min": None, "p50": None, "p95": None, "p99": None, "max": None}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) * 1000,
+        "min": min(values) * 1000,
+        "p50": percentile(values, 50) * 1000,
+        "p95": percentile(values, 95) * 1000,
+        "p99": percentile(values, 99) * 1000,
+        "max": max(values) * 1000,
+    }
+
+
+def time_calls(function, runs, warmup=1):
+    """
+    Call function(index) runs times, after warmup untimed calls.
+
+    The warm-up calls take the one-off costs, such as starting the gphoto2
+    shell, out of the figures. They get negative indexes.
+
+    Returns:
+        Tuple (list of durations in seconds, number of calls that returned
+        a false value)
+    """
+    durations = []
+    errors = 0
+    for index in range(-warmup, runs):
+        started = time.perf_counter()
+        ok = function(index)
+        if index < 0:
+            continue
+        durations.append(time.perf_counter() - started)
+        if not ok:
+            errors += 1
+    return durations, errors
+
+
+def bench_settings(runs):
+    """Read ISO, shutter speed and aperture, as the GUI does after every change."""
+    durations, errors = time_calls(
+        lambda index: not cam_ops.get_camera_settings({})["errors"], runs
+    )
+    return {"runs": runs, "errors": errors, "latency": summarize(durations)}
+
+
+def bench_set(runs):
+    """Change each setting back and forth with the set_* functions."""
+    functions = {
+        "iso": cam_ops.set_iso,
+        "shutter_speed": cam_ops.set_shutter_speed,
+        "aperture": cam_ops.set_aperture,
+    }
+    results = {}
+    for name, function in functions.items():
+        values = SET_VALUES[name]
+        durations, errors = time_calls(
+            lambda index: not function(values[index % 2])[1], runs
+        )
+        results[f"set_{name}"] = {"runs": runs, "errors": errors, "latency": summarize(durations)}
+    return results
+
+
+def bench_capture(runs, save_path):
+    """Capture and download single frames back to back with capture_image()."""
+    durations, errors = time_calls(
+        lambda index: bool(cam_ops.capture_image(save_path, [])), runs
+    )
+    total = sum(durations)
+    return {
+        "runs": runs,
+        "errors": errors,
+        "latency": summarize(durations),
+        "frames_per_minute": (runs - errors) / total * 60 if total else None,
+    }
+
+
+def bench_download(runs, save_path):
+    """Download the whole card with download_files(), each run into an empty directory."""
+    durations = []
+    errors = 0
+    files = size = 0
+    for index in range(runs):
+        target = os.path.join(save_path, f"download_{index}")
+        os.makedirs(target)
+        started = time.perf_counter()
+        _, stderr = cam_ops.download_files(save_path=target)
+        durations.append(time.perf_counter() - started)
+        if stderr:
+            errors += 1
+        names = os.listdir(target)
+        files = len(names)
+        size = sum(os.path.getsize(os.path.join(target, name)) for name in names)
+        shutil.rmtree(target)
+    mean = sum(durations) / len(durations) if durations else 0
+    return {
+        "runs": runs,
+        "errors": errors,
+        "files": files,
+        "bytes": size,
+        "latency": summarize(durations),
+        "mb_per_s": size / mean / 1e6 if mean else None,
+    }
+
+
+def bench_intervalometer(frames, interval, save_path, policy="skip", pipelined=False):
+    """
+    Run an intervalometer sequence and measure its cadence.
+
+    Jitter is how late each frame started against its slot on the grid;
+    latency is how long each frame took.
+    """
+    pipeline = None
+    if pipelined:
+        pipeline = CapturePipeline(save_path)
+        pipeline.start()
+
+    def take_frame(index):
+        if pipeline is not None:
+            return bool(pipeline.capture())
+        return bool(cam_ops.capture_image(save_path, []))
+
+    scheduler = IntervalScheduler(interval, frames, policy=policy)
+    timings = scheduler.run(take_frame)
+    if pipeline is not None:
+        pipeline.stop()
+    taken = len(timings)
+    seconds = timings[-1].finished if timings else 0
+    gaps = [b.started - a.started for a, b in zip(timings, timings[1:])]
+    return {
+        "frames": frames,
+        "taken": taken,
+        "interval": interval,
+        "policy": policy,
+        "pipelined": pipelined,
+        "seconds": seconds,
+        "frames_per_minute": taken / seconds * 60 if seconds else None,
+        "overruns": scheduler.overruns,
+        "skipped": sum(t.skipped for t in timings),
+        "jitter": summarize([max(0.0, t.started - t.planned) for t in timings]),
+        "gap": summarize(gaps),
+        "latency": summarize([t.finished - t.started for t in timings]),
+    }
+
+
+def run_benchmarks(args, save_path):
+    """Run the selected benchmarks; return the results dictionary."""
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    results = {}
+    for name in selected:
+        name = name.strip()
+        started = time.perf_counter()
+        print(f"Running {name}...", file=sys.stderr)
+        if name == "settings":
+            results["get_camera_settings"] = bench_settings(args.runs)
+        elif name == "set":
+            results.update(bench_set(args.runs))
+        elif name == "capture":
+            results["capture_image"] = bench_capture(args.runs, save_path)
+        elif name == "download":
+            results["download_files"] = bench_download(args.download_runs, save_path)
+        elif name == "intervalometer":
+            results["intervalometer"] = bench_intervalometer(
+                args.frames, args.interval, save_path, args.policy, args.pipelined
+            )
+        else:
+            raise ValueError(f"Unknown benchmark {name!r}, expected one of {BENCHMARKS}")
+        print(f"  {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    return results
+
+
+def format_results(report):
+    """Return readable lines for a results report."""
+    lines = [f"{report['label']} ({report['camera']}, {'session' if report['session'] else 'one-shot'})"]
+    for name, result in report["benchmarks"].items():
+        latency = result["latency"]
+        line = f"{name:<22}"
+        if latency["count"]:
+            line += (
+                f" n={latency['count']:<4} p50={latency['p50']:8.1f}ms p95={latency['p95']:8.1f}ms "
+                f"p99={latency['p99']:8.1f}ms"
+            )
+        if result.get("errors"):
+            line += f" errors={result['errors']}"
+        if result.get("frames_per_minute") is not None:
+            line += f" {result['frames_per_minute']:.1f} frames/min"
+        if result.get("mb_per_s") is not None:
+            line += f" {result['mb_per_s']:.1f} MB/s"
+        if "jitter" in result and result["jitter"]["count"]:
+            line += (
+                f" jitter p95={result['jitter']['p95']:.1f}ms max={result['jitter']['max']:.1f}ms"
+                f" overruns={result['overruns']}"
+            )
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _metric(result, key, field):
+    value = result.get(key)
+    if field is not None:
+        value = value.get(field) if isinstance(value, dict) else None
+    return value
+
+
+def compare(before, after):
+    """Return readable lines comparing two results reports."""
+    lines = [f"{'':<22} {'metric':<20} {before['label']:>12} {after['label']:>12}   change"]
+    for name, old in before["benchmarks"].items():
+        new = after["benchmarks"].get(name)
+        if new is None:
+            continue
+        for key, field, higher_better in COMPARED:
+            a, b = _metric(old, key, field), _metric(new, key, field)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            better = (change > 0) == higher_better
+            verdict = "" if abs(change) < 5 else ("better" if better else "worse")
+            metric = f"{key}.{field}" if field else key
+            lines.append(f"{name:<22} {metric:<20} {a:12.1f} {b:12.1f} {change:+7.1f}% {verdict}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CamCtrl camera operations.")
+    parser.add_argument("--simulator", nargs="?", const="1", metavar="OPTIONS",
+                        help="use the simulated camera, optionally with options (see cam_sim.py)")
+    parser.add_argument("--only", help=f"comma separated benchmarks out of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--runs", type=int, default=20, help="calls per latency benchmark")
+    parser.add_argument("--download-runs", type=int, default=3, help="whole-card downloads")
+    parser.add_argument("--frames", type=int, default=10, help="intervalometer frames")
+    parser.add_argument("--interval", type=float, default=2.0, help="intervalometer delay in seconds")
+    parser.add_argument("--policy", choices=OVERRUN_POLICIES, default="skip")
+    parser.add_argument("--pipelined", action="store_true", help="pipelined intervalometer capture")
+    parser.add_argument("--no-session", action="store_true",
+                        help="run one gphoto2 process per operation instead of a shell session")
+    parser.add_argument("--save-path", help="keep the captures in this directory")
+    parser.add_argument("--label", default=None, help="name of this run in comparisons")
+    parser.add_argument("--output", help="JSON file to write (default bench_<date>_<time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as f:
+                reports.append(json.load(f))
+        print(compare(*reports))
+        return 0
+
+    temp_dir = tempfile.mkdtemp(prefix="camctrl-bench-")
+    if args.simulator is not None:
+        options = args.simulator
+        if "dir=" not in options:
+            # A fresh card, so every run starts from the same state
+            options = f"dir={os.path.join(temp_dir, 'camera')}" + ("" if options == "1" else f",{options}")
+        parse_options(options)
+        os.environ[SIMULATOR_ENV] = options
+    save_path = args.save_path or os.path.join(temp_dir, "captures")
+    os.makedirs(save_path, exist_ok=True)
+
+    session = None
+    if not args.no_session:
+        session = GPhotoSession()
+        cam_ops.set_session(session)
+        try:
+            # Started up front so no benchmark pays for it
+            session.open()
+        except SessionError:
+            pass  # Retried by the first command, which reports the error
+    try:
+        benchmarks = run_benchmarks(args, save_path)
+    finally:
+        if session is not None:
+            cam_ops.set_session(None)
+            session.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    report = {
+        "label": args.label or time.strftime("%Y%m%d_%H%M%S"),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "camera": "simulator" if simulator_enabled() else "gphoto2",
+        "simulator": os.environ.get(SIMULATOR_ENV) if simulator_enabled() else None,
+        "session": session is not None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": benchmarks,
+    }
+    output = args.output or time.strftime("bench_%Y%m%d_%H%M%S.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(format_results(report))
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
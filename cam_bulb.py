@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Bulb exposures for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module uses gphoto2 command-line tool, which is licensed under GPL-2.0.
+# gphoto2 is a command-line frontend to libgphoto2.
+# For more information, visit: http://www.gphoto.org/
+
+"""Host-timed bulb exposures over the persistent gphoto2 session."""
+
+import time
+from collections import namedtuple
+
+from cam_metrics import operation, phase
+from cam_ops import get_session, rename_saved_files, staging_dir, card_changed
+from cam_session import GPhotoSession, SessionError
+from cam_naming import FileNamer
+
+# Shell commands that open and close the shutter in bulb mode. Most
+# cameras use the `bulb` toggle; Canon EOS bodies want
+# ("set-config eosremoterelease=Press Full", "set-config eosremoterelease=Release Full").
+DEFAULT_OPEN_COMMAND = "set-config bulb=1"
+DEFAULT_CLOSE_COMMAND = "set-config bulb=0"
+
+# The last stretch before the close time is spun rather than slept, since
+# sleeps can overshoot by a scheduler tick
+SPIN_SECONDS = 0.02
+
+# Times are time.monotonic() except the *_wall fields (time.time(), for
+# logs). open_sent/open_acked bracket the open command, close_* the close
+# command; exposure is the time between the midpoints of the two.
+BulbFrame = namedtuple(
+    "BulbFrame",
+    [
+        "target", "open_sent", "open_acked", "close_sent", "close_acked",
+        "exposure", "open_wall", "close_wall", "files", "error",
+    ],
+)
+
+
+def wait_until(deadline, cancel_event=None, clock=time.monotonic):
+    """
+    Wait until clock() reaches deadline, within about a millisecond.
+
+    Returns:
+        False if cancel_event was set before the deadline, else True
+    """
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return True
+        if remaining > SPIN_SECONDS:
+            if cancel_event is not None:
+                if cancel_event.wait(remaining - SPIN_SECONDS):
+                    return False
+            else:
+                time.sleep(remaining - SPIN_SECONDS)
+        else:
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            time.sleep(0)
+
+
+class BulbController:
+    """
+    Takes bulb exposures timed by the host.
+
+    Each exposure runs on the calling worker thread, which sends the open
+    and close commands and waits in between, unaffected by the GUI. It
+    holds the session lock from opening the shutter until the frame is downloaded,
+    so no other download or command can be in flight on the USB link when
+    the shutter has to close. The camera must be set to bulb (shutter
+    speed "bulb" or manual mode B) beforehand.
+    """
+
+    def __init__(self, session=None, open_command=DEFAULT_OPEN_COMMAND,
+                 close_command=DEFAULT_CLOSE_COMMAND, file_extensions=(),
+                 namer=None, status_callback=None, output_callback=None,
+                 download_timeout=None):
+        """
+        Args:
+            session: GPhotoSession to use (default: the active session, or a
+                private one if none is active)
+            open_command: gphoto2 shell command that opens the shutter
+            close_command: gphoto2 shell command that closes the shutter
+            file_extensions: Known extensions, used to spell saved file names
+            namer: cam_naming.FileNamer giving the file names
+            status_callback: Function(status_message, color) to update status
+            output_callback: Function(output_text) to display gphoto2 output
+            download_timeout: Seconds to wait for the camera to write the
+                file (default: the exposure time plus max(60, exposure), as
+                long-exposure noise reduction takes a dark frame as long
+                as the exposure itself)
+        """
+        self.session = session or get_session()
+        self._own_session = self.session is None
+        if self._own_session:
+            self.session = GPhotoSession()
+        self.open_command = open_command
+        self.close_command = close_command
+        self.file_extensions = file_extensions
+        self.namer = namer or FileNamer()
+        self.status_callback = status_callback
+        self.output_callback = output_callback
+        self.download_timeout = download_timeout
+
+    def close(self):
+        """Close the private session, if one was opened."""
+        if self._own_session:
+            self.session.close()
+
+    def expose(self, seconds, save_path, cancel_event=None):
+        """
+        Take one bulb exposure and download it.
+
+        Cancelling closes the shutter early; the shortened frame is still
+        downloaded.
+
+        Args:
+            seconds: Exposure time
+            save_path: Directory to save the image to
+            cancel_event: Optional threading.Event that ends the exposure
+
+        Returns:
+            BulbFrame
+        """
+        timing = {}
+        stem = self.namer.next_stem(save_path)
+        if self.status_callback:
+            self.status_callback(f"Bulb exposure: {seconds:g}s...", "blue")
+        self._run(seconds, save_path, stem, cancel_event, timing)
+
+        files = timing.get("files", [])
+        error = timing.get("error", "")
+        frame = BulbFrame(
+            target=seconds,
+            open_sent=timing.get("open_sent"),
+            open_acked=timing.get("open_acked"),
+            close_sent=timing.get("close_sent"),
+            close_acked=timing.get("close_acked"),
+            exposure=timing.get("exposure"),
+            open_wall=timing.get("open_wall"),
+            close_wall=timing.get("close_wall"),
+            files=files,
+            error=error,
+        )
+        if self.output_callback:
+            self.output_callback(format_frame(frame) + "\n")
+        if self.status_callback:
+            if error:
+                self.status_callback(f"Bulb exposure failed: {error}", "red")
+            else:
+                self.status_callback(f"Bulb exposure saved: {', '.join(files)}", "green")
+        return frame
+
+    def _command(self, command):
+        stdout, stderr = self.session.shell([command])
+        if self.output_callback and stdout.strip():
+            self.output_callback(stdout)
+        return stderr.strip()
+
+    def _run(self, seconds, save_path, stem, cancel_event, timing):
+        """Open, wait, close, then download."""
+        with self.session.lock, operation("bulb_exposure") as op:
+            with phase("exposure"):
+                self._time_exposure(seconds, cancel_event, timing)
+            if "close_acked" in timing and "error" not in timing:
+                with phase("transfer"):
+                    timing["files"], error = self._download(save_path, stem, seconds)
+                if error:
+                    timing["error"] = error
+            if "error" in timing:
+                op.fail(timing["error"])
+
+    def _time_exposure(self, seconds, cancel_event, timing):
+        try:
+            # Start the shell first, so opening it is not part of the timing
+            self.session.open()
+            timing["open_wall"] = time.time()
+            timing["open_sent"] = time.monotonic()
+            error = self._command(self.open_command)
+            timing["open_acked"] = time.monotonic()
+            if error:
+                timing["error"] = f"opening the shutter: {error}"
+                return
+            # Time from when the shutter was commanded open, i.e. the middle
+            # of the open round trip, to the middle of the close round trip
+            opened = (timing["open_sent"] + timing["open_acked"]) / 2
+            # The close command takes about as long as the open one did
+            close_latency = (timing["open_acked"] - timing["open_sent"]) / 2
+            wait_until(opened + seconds - close_latency, cancel_event)
+            timing["close_sent"] = time.monotonic()
+            error = self._command(self.close_command)
+            timing["close_acked"] = time.monotonic()
+            timing["close_wall"] = time.time()
+            timing["exposure"] = (timing["close_sent"] + timing["close_acked"]) / 2 - opened
+            if error:
+                timing["error"] = f"closing the shutter: {error}"
+        except SessionError as e:
+            timing["error"] = str(e)
+
+    def _download(self, save_path, stem, seconds):
+        """Wait for the camera to store the frame and download it."""
+        timeout = self.download_timeout
+        if timeout is None:
+            timeout = seconds + max(60, seconds)
+        download_dir = staging_dir(save_path)
+        try:
+            # The first file ends the wait; a RAW+JPEG pair's second file
+            # follows right after
+            stdout, stderr = self.session.shell(
+                ["wait-event-and-download FILEADDED", "wait-event-and-download 2s"],
+                cwd=download_dir, timeout=timeout,
+            )
+        except SessionError as e:
+            return [], str(e)
+        card_changed()
+        if self.output_callback:
+            self.output_callback(stdout)
+        try:
+            files = rename_saved_files(
+                stdout, save_path, stem, self.file_extensions, download_dir=download_dir
+            )
+        except OSError as e:
+            return [], f"renaming files: {e}"
+        if not files:
+            return [], stderr.strip() or "the camera stored no file"
+        return files, ""
+
+
+def format_frame(frame):
+    """Return a log line with the timing of a BulbFrame."""
+    if frame.exposure is None:
+        return f"Bulb {frame.target:g}s: {frame.error}"
+    opened = time.strftime("%H:%M:%S", time.localtime(frame.open_wall))
+    closed = time.strftime("%H:%M:%S", time.localtime(frame.close_wall))
+    open_ms = (frame.open_acked - frame.open_sent) * 1000
+    close_ms = (frame.close_acked - frame.close_sent) * 1000
+    error_ms = (frame.exposure - frame.target) * 1000
+    return (
+        f"Bulb {frame.target:g}s: open {opened}, closed {closed}, "
+        f"exposure {frame.exposure:.3f}s ({error_ms:+.1f} ms), "
+        f"command round trips {open_ms:.1f}/{close_ms:.1f} ms"
+    )
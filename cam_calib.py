@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Calibration frames for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Bias, dark and flat master frames, and calibration of light frames."""
+
+import os
+import queue
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # Calibration is unavailable
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import rawpy
+except ImportError:
+    rawpy = None
+
+from cam_exposure import JPEG_EXTENSIONS, RAW_EXTENSIONS
+
+FRAME_TYPES = ("bias", "dark", "flat")
+COMBINE_METHODS = ("median", "sigma_clip")
+
+# Masters are combined a band of rows at a time; a band of the whole stack
+# is kept below this many bytes
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("calibration needs NumPy (pip install numpy)")
+
+
+def load_frame(path):
+    """
+    Read an image as a float32 array.
+
+    RAW files give the undemosaiced sensor data (2D), which is what
+    calibration should work on; JPEGs give an RGB array (3D).
+
+    Raises:
+        ValueError: If the format is not supported (or its optional
+            library is not installed)
+    """
+    require_numpy()
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path).astype(np.float32, copy=False)
+    if ext in RAW_EXTENSIONS and rawpy is not None:
+        with rawpy.imread(path) as raw:
+            return raw.raw_image_visible.astype(np.float32)
+    if ext in JPEG_EXTENSIONS and Image is not None:
+        with Image.open(path) as image:
+            return np.asarray(image.convert("RGB"), dtype=np.float32)
+    raise ValueError(f"Cannot load {os.path.basename(path)} for calibration")
+
+
+def pick_frame_file(paths):
+    """
+    Choose the file of a capture to calibrate: the RAW if there is one.
+
+    Arrays saved as .npy (e.g. frames calibrated earlier) are accepted too.
+    """
+    groups = (
+        (RAW_EXTENSIONS, rawpy is not None),
+        (JPEG_EXTENSIONS, Image is not None),
+        ((".npy",), True),
+    )
+    for group, available in groups:
+        if available:
+            for path in paths:
+                if os.path.splitext(path)[1].lower() in group:
+                    return path
+    return None
+
+
+def _frame_median(frame):
+    # A subsample is plenty for a normalisation factor
+    return float(np.median(frame[::8, ::8]))
+
+
+def combine(stack, method="median", sigma=3.0):
+    """
+    Combine a (frames, ...) array along the first axis.
+
+    sigma_clip averages the values within sigma robust standard
+    deviations (from the median absolute deviation) of the median.
+    """
+    median = np.median(stack, axis=0)
+    if method == "median":
+        return median
+    spread = np.median(np.abs(stack - median), axis=0) * 1.4826
+    keep = np.abs(stack - median) <= sigma * np.maximum(spread, 1e-6)
+    count = keep.sum(axis=0)
+    total = np.where(keep, stack, 0).sum(axis=0)
+    return np.where(count > 0, total / np.maximum(count, 1), median)
+
+
+def build_master(paths, out_path, method="median", sigma=3.0, subtract=None,
+                 normalize=False, progress_callback=None, cancel_event=None):
+    """
+    Combine calibration frames into a master frame, saved as .npy.
+
+    The frames are first copied one by one into a memory-mapped stack on
+    disk next to out_path, then combined a band of rows at a time into a
+    memory-mapped master. Only one frame and one band are ever in memory,
+    so the stack size is limited by disk space rather than RAM.
+
+    Args:
+        paths: Frame files, all the same size
+        out_path: .npy file to write
+        method: One of COMBINE_METHODS
+        sigma: Clipping threshold for sigma_clip
+        subtract: Optional array subtracted from every frame (e.g. the
+            master bias, for flats)
+        normalize: Scale every frame to a median of 1 (for flats)
+        progress_callback: Optional function(message) for progress
+        cancel_event: Optional threading.Event that aborts the build
+
+    Returns:
+        out_path, or None if cancelled
+
+    Raises:
+        ValueError: If there are no frames or their sizes differ
+    """
+    require_numpy()
+    if method not in COMBINE_METHODS:
+        raise ValueError(f"Unknown combine method {method!r}, expected one of {COMBINE_METHODS}")
+    if not paths:
+        raise ValueError("No frames to combine")
+
+    first = load_frame(paths[0])
+    shape = first.shape
+    stack_path = out_path + ".stack.npy"
+    stack = np.lib.format.open_memmap(
+        stack_path, mode="w+", dtype=np.float32, shape=(len(paths),) + shape
+    )
+    try:
+        for index, path in enumerate(paths):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            frame = first if index == 0 else load_frame(path)
+            if frame.shape != shape:
+                raise ValueError(f"{os.path.basename(path)} is {frame.shape}, expected {shape}")
+            if subtract is not None:
+                frame = frame - subtract
+            if normalize:
+                frame = frame / max(_frame_median(frame), 1e-6)
+            stack[index] = frame
+            if progress_callback:
+                progress_callback(f"Loaded {index + 1}/{len(paths)}: {os.path.basename(path)}")
+        first = frame = None
+        stack.flush()
+
+        # Written aside and moved into place, so a Calibrator still mapping
+        # the previous master is not pulled out from under
+        temp_path = out_path + ".tmp.npy"
+        master = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=shape)
+        row_bytes = stack[:, :1].nbytes
+        rows = max(1, CHUNK_BYTES // row_bytes)
+        for start in range(0, shape[0], rows):
+            if cancel_event is not None and cancel_event.is_set():
+                del master
+                os.remove(temp_path)
+                return None
+            master[start:start + rows] = combine(stack[:, start:start + rows], method, sigma)
+            if progress_callback:
+                done = min(shape[0], start + rows)
+                progress_callback(f"Combining rows {done}/{shape[0]}")
+        master.flush()
+        del master
+        os.replace(temp_path, out_path)
+    finally:
+        del stack
+        os.remove(stack_path)
+    return out_path
+
+
+class CalibrationSession:
+    """
+    Calibration frames and masters kept under one directory.
+
+    Layout: <directory>/bias, dark and flat hold the captured frames;
+    <directory>/masters holds master_bias.npy, master_dark.npy and
+    master_flat.npy. Darks are expected at the exposure and temperature
+    of the lights, so the master dark includes the bias; flats are bias
+    subtracted and normalised to 1.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.masters_dir = os.path.join(directory, "masters")
+
+    def frame_dir(self, frame_type):
+        """Return (and create) the directory frames of a type are captured to."""
+        if frame_type not in FRAME_TYPES:
+            raise ValueError(f"Unknown frame type {frame_type!r}, expected one of {FRAME_TYPES}")
+        path = os.path.join(self.directory, frame_type)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def frames(self, frame_type):
+        """Return the loadable frames of a type, one file per capture."""
+        directory = os.path.join(self.directory, frame_type)
+        if not os.path.isdir(directory):
+            return []
+        by_stem = {}
+        for name in sorted(os.listdir(directory)):
+            by_stem.setdefault(os.path.splitext(name)[0], []).append(os.path.join(directory, name))
+        return [path for path in map(pick_frame_file, by_stem.values()) if path]
+
+    def master_path(self, frame_type):
+        return os.path.join(self.masters_dir, f"master_{frame_type}.npy")
+
+    def masters(self):
+        """Return the frame types that have a master."""
+        return [t for t in FRAME_TYPES if os.path.exists(self.master_path(t))]
+
+    def build_masters(self, method="median", sigma=3.0, progress_callback=None, cancel_event=None):
+        """
+        Build a master for every frame type that has frames.
+
+        Returns:
+            List of frame types built
+        """
+        require_numpy()
+        os.makedirs(self.masters_dir, exist_ok=True)
+        built = []
+        bias = None
+        for frame_type in FRAME_TYPES:
+            paths = self.frames(frame_type)
+            if not paths:
+                continue
+            if progress_callback:
+                progress_callback(f"Building master {frame_type} from {len(paths)} frame(s)")
+
+            def report(message, frame_type=frame_type):
+                if progress_callback:
+                    progress_callback(f"{frame_type}: {message}")
+
+            flat = frame_type == "flat"
+            result = build_master(
+                paths, self.master_path(frame_type), method, sigma,
+                subtract=bias if flat else None, normalize=flat,
+                progress_callback=report, cancel_event=cancel_event,
+            )
+            if result is None:
+                break
+            built.append(frame_type)
+            if frame_type == "bias":
+                bias = np.load(result, mmap_mode="r")
+        return built
+
+
+class Calibrator:
+    """
+    Applies the masters of a CalibrationSession to light frames:
+    (light - dark) / flat, or light - bias when there is no dark.
+    """
+
+    def __init__(self, session):
+        require_numpy()
+        self.masters = {
+            frame_type: np.load(session.master_path(frame_type), mmap_mode="r")
+            for frame_type in session.masters()
+        }
+        if not self.masters:
+            raise ValueError("No master frames; build them first")
+
+    def calibrate(self, frame):
+        """Return a calibrated copy of a float32 frame array."""
+        offset = self.masters.get("dark", self.masters.get("bias"))
+        if offset is not None:
+            self._check(frame, offset)
+            frame = frame - offset
+        flat = self.masters.get("flat")
+        if flat is not None:
+            self._check(frame, flat)
+            frame = np.divide(frame, flat, out=np.zeros_like(frame), where=flat > 1e-3)
+        return frame
+
+    def calibrate_file(self, path, out_dir):
+        """
+        Calibrate an image file and save it as <out_dir>/<name>.npy.
+
+        Returns:
+            Path of the calibrated frame
+        """
+        frame = self.calibrate(load_frame(path))
+        os.makedirs(out_dir, exist_ok=True)
+        out_path = os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0] + ".npy")
+        np.save(out_path, frame.astype(np.float32, copy=False))
+        return out_path
+
+    @staticmethod
+    def _check(frame, master):
+        if frame.shape != master.shape:
+            raise ValueError(f"Frame is {frame.shape} but the masters are {master.shape}")
+
+
+class CalibrationWorker:
+    """
+    Calibrates lights on a background thread as they are captured.
+
+    submit() only queues the files, so it never delays the next capture.
+    """
+
+    def __init__(self, calibrator, out_dir, done_callback=None):
+        """
+        Args:
+            calibrator: Calibrator
+            out_dir: Directory calibrated frames are written to
+            done_callback: Optional function(calibrated path or None, error)
+                called on the worker thread after each frame
+        """
+        self.calibrator = calibrator
+        self.out_dir = out_dir
+        self.done_callback = done_callback
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="calibration", daemon=True)
+        self._thread.start()
+
+    def submit(self, paths):
+        """Queue the files of one capture (e.g. a RAW+JPEG pair)."""
+        path = pick_frame_file(paths)
+        if path is not None:
+            self._queue.put(path)
+
+    def stop(self):
+        """Finish the queued frames and stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                break
+            try:
+                result, error = self.calibrator.calibrate_file(path, self.out_dir), ""
+            except (OSError, ValueError) as e:
+                result, error = None, f"{os.path.basename(path)}: {e}"
+            if self.done_callback:
+                self.done_callback(result, error)
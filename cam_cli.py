@@ -0,0 +1,472 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Headless command line and daemon for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Camera operations without the GUI, e.g. on a headless Raspberry Pi.
+
+Reads the same config.py as camCtrl.py but never imports Tkinter, so it
+starts in a fraction of a second. Run one command and exit:
+
+    python3 cam_cli.py capture --count 3
+    python3 cam_cli.py set --iso 800 --shutter 1/125
+    python3 cam_cli.py intervalometer --interval 10 --frames 360
+    python3 cam_cli.py --dir ~/Pictures/night1 sync
+
+or keep the camera session open and take commands, one per line, from
+standard input or a named pipe:
+
+    python3 cam_cli.py daemon --fifo /tmp/camctrl.fifo
+    echo "intervalometer --interval 30 --frames 1000" > /tmp/camctrl.fifo
+    echo "stop" > /tmp/camctrl.fifo
+"""
+
+import argparse
+import os
+import shlex
+import signal
+import sys
+import threading
+
+from cam_config import (
+    load_config, apply_simulator_config, apply_metrics_config,
+    default_capture_filename_template,
+)
+from cam_ops import (
+    detect_camera, get_camera_settings, set_iso, set_shutter_speed, set_aperture,
+    capture_image, set_session, get_session,
+)
+from cam_bulb import BulbController
+from cam_naming import FileNamer
+from cam_pipeline import CapturePipeline
+from cam_scheduler import IntervalScheduler, OVERRUN_POLICIES
+from cam_session import GPhotoSession, SessionError
+from cam_sync import sync_camera
+
+
+class Shutdown(Exception):
+    """Raised by the signal handler to leave the daemon's read loop."""
+
+
+class HeadlessCamera:
+    """
+    The camera operations of the GUI, reporting to the terminal.
+
+    Status messages go to stderr and results to stdout, so the output of
+    a command can be piped on.
+    """
+
+    def __init__(self, config, save_path, verbose=False):
+        """
+        Args:
+            config: Configuration dictionary from load_config()
+            save_path: Directory captures and synced files are saved to
+            verbose: Also print the gphoto2 output
+        """
+        self.config = config
+        self.save_path = save_path
+        self.verbose = verbose
+        self.file_extensions = config["file_extensions"]
+        self.shutter_speed_mapping = config["shutter_speed_mapping"]
+        try:
+            self.namer = FileNamer(config["capture_filename_template"])
+        except (KeyError, ValueError, IndexError) as e:
+            self.status(f"Warning: Invalid capture_filename_template: {e}. Using default.")
+            self.namer = FileNamer(default_capture_filename_template)
+        # Set to stop a running intervalometer after the current frame
+        self.stop_event = threading.Event()
+        self.frames_taken = 0
+        self._intervalometer = None
+
+    def status(self, message, color=None):
+        """status_callback for cam_ops: one line on stderr."""
+        if message:
+            print(message, file=sys.stderr, flush=True)
+
+    def output(self, text):
+        """output_callback for cam_ops: the gphoto2 output, with --verbose."""
+        if self.verbose and text:
+            print(text, end="" if text.endswith("\n") else "\n", file=sys.stderr, flush=True)
+
+    def saved(self, files):
+        """Called with the files of each capture: prints them on stdout."""
+        for path in files:
+            print(path, flush=True)
+
+    def busy(self):
+        """Return True while an intervalometer runs in the background."""
+        return self._intervalometer is not None and self._intervalometer.is_alive()
+
+    def detect(self):
+        stdout, stderr = detect_camera(output_callback=self.output)
+        if stdout.strip():
+            print(stdout.rstrip())
+        if stderr:
+            self.status(f"Error: {stderr.strip()}", "red")
+        return not stderr
+
+    def settings(self):
+        """Print ISO, shutter speed and aperture."""
+        settings = get_camera_settings(self.shutter_speed_mapping)
+        for error in settings["errors"]:
+            self.status(error, "red")
+        shutter = settings["shutter"]
+        print(f"iso: {settings['iso'] or '?'}")
+        print(f"shutter: {shutter['display'] if shutter else '?'}")
+        print(f"aperture: {settings['aperture'] or '?'}")
+        return not settings["errors"]
+
+    def shutter_value(self, text):
+        """Return the camera value of a shutter speed given as shown ("1/125") or as is."""
+        if text in self.shutter_speed_mapping:
+            return text
+        for value, display in self.shutter_speed_mapping.items():
+            if display == text:
+                return value
+        return text
+
+    def set(self, iso=None, shutter=None, aperture=None):
+        """Change the given settings; return True if all were accepted."""
+        ok = True
+        if iso:
+            ok = not set_iso(iso, self.status)[1] and ok
+        if shutter:
+            ok = not set_shutter_speed(self.shutter_value(shutter), self.status)[1] and ok
+        if aperture:
+            ok = not set_aperture(aperture, self.status)[1] and ok
+        return ok
+
+    def capture(self, count=1):
+        """
+        Take count pictures one after another, stopping at the first error.
+
+        Returns:
+            List of saved files; frames_taken has the number of pictures
+        """
+        os.makedirs(self.save_path, exist_ok=True)
+        self.frames_taken = 0
+        saved_files = []
+        for _ in range(count):
+            if self.stop_event.is_set():
+                break
+            files = capture_image(
+                self.save_path, self.file_extensions, status_callback=self.status,
+                output_callback=self.output, namer=self.namer,
+            )
+            if not files:
+                break
+            self.saved(files)
+            saved_files.extend(files)
+            self.frames_taken += 1
+        return saved_files
+
+    def intervalometer(self, interval, frames, bulb_seconds=None, pipelined=None, policy=None):
+        """
+        Take frames at a fixed interval, like the GUI's time lapse.
+
+        Args:
+            interval: Seconds between the starts of frames
+            frames: Number of frames
+            bulb_seconds: Bulb exposure of each frame, or None for the
+                camera's shutter speed
+            pipelined: Download in the background (default: the
+                pipelined_capture setting); ignored for bulb frames
+            policy: Overrun policy (default: the configured one)
+
+        Returns:
+            True if every frame was taken
+        """
+        if bulb_seconds and bulb_seconds >= interval:
+            self.status(f"Interval must be longer than the {bulb_seconds:g}s bulb exposure.", "red")
+            return False
+        if pipelined is None:
+            pipelined = self.config["pipelined_capture"]
+        os.makedirs(self.save_path, exist_ok=True)
+        self.stop_event.clear()
+        self.frames_taken = 0
+
+        bulb = pipeline = None
+        if bulb_seconds:
+            bulb = BulbController(
+                open_command=self.config["bulb_open_command"],
+                close_command=self.config["bulb_close_command"],
+                file_extensions=self.file_extensions, namer=self.namer,
+                status_callback=self.status, output_callback=self.output,
+            )
+        elif pipelined:
+            pipeline = CapturePipeline(
+                self.save_path, namer=self.namer, file_extensions=self.file_extensions,
+                status_callback=self.status, output_callback=self.output, saved_callback=self.saved,
+            )
+            pipeline.start()
+
+        def take_frame(index):
+            if bulb is not None:
+                files = bulb.expose(bulb_seconds, self.save_path, cancel_event=self.stop_event).files
+                self.saved(files)
+            elif pipeline is not None:
+                files = pipeline.capture()
+            else:
+                files = capture_image(
+                    self.save_path, self.file_extensions, status_callback=self.status,
+                    output_callback=self.output, namer=self.namer,
+                )
+                self.saved(files)
+            if files:
+                self.frames_taken += 1
+            return bool(files)
+
+        scheduler = IntervalScheduler(
+            interval, frames, policy=policy or self.config["intervalometer_overrun_policy"],
+            log_callback=self.status,
+        )
+        try:
+            scheduler.run(take_frame, stop_event=self.stop_event)
+        finally:
+            if bulb is not None:
+                bulb.close()
+            if pipeline is not None:
+                self.status("Downloading remaining frames...", "blue")
+                pipeline.stop()
+                self.status(pipeline.stats.format(), "blue")
+        if self.stop_event.is_set():
+            self.status(f"Intervalometer stopped after {self.frames_taken} frame(s)", "orange")
+        else:
+            self.status(
+                f"Intervalometer done: {self.frames_taken}/{frames} frame(s), "
+                f"{scheduler.overruns} overrun(s)", "green",
+            )
+        return self.frames_taken == frames
+
+    def start_intervalometer(self, *args, **kwargs):
+        """Run intervalometer() on a background thread; see stop()."""
+        self._intervalometer = threading.Thread(
+            target=self.intervalometer, args=args, kwargs=kwargs, name="intervalometer",
+        )
+        self._intervalometer.start()
+
+    def stop(self, wait=True):
+        """Stop a running intervalometer or capture after the current frame."""
+        self.stop_event.set()
+        if wait and self._intervalometer is not None:
+            self._intervalometer.join()
+            self._intervalometer = None
+
+    def wait(self):
+        """Wait for a background intervalometer to finish."""
+        if self._intervalometer is not None:
+            self._intervalometer.join()
+
+    def sync(self):
+        """Copy the camera files that are not in the save path yet."""
+        os.makedirs(self.save_path, exist_ok=True)
+        result = sync_camera(
+            self.save_path, status_callback=self.status, output_callback=self.output,
+            cancel_event=self.stop_event,
+        )
+        self.saved(result["downloaded"])
+        return not result["failed"]
+
+
+def add_commands(subparsers):
+    """Add the camera commands, shared by the command line and the daemon."""
+    subparsers.add_parser("detect", help="list the connected cameras")
+    subparsers.add_parser("settings", help="print ISO, shutter speed and aperture")
+
+    set_parser = subparsers.add_parser("set", help="change camera settings")
+    set_parser.add_argument("--iso")
+    set_parser.add_argument("--shutter", help='camera value or as shown, e.g. 1/125 or 30"')
+    set_parser.add_argument("--aperture")
+
+    capture_parser = subparsers.add_parser("capture", help="take pictures and download them")
+    capture_parser.add_argument("--count", type=int, default=1)
+
+    interval_parser = subparsers.add_parser("intervalometer", help="take pictures at a fixed interval")
+    interval_parser.add_argument("--interval", type=float, required=True, help="seconds between frames")
+    interval_parser.add_argument("--frames", type=int, required=True)
+    interval_parser.add_argument("--bulb", type=float, metavar="SECONDS", help="bulb exposure of each frame")
+    interval_parser.add_argument("--policy", choices=OVERRUN_POLICIES,
+                                 help="what to do when a frame overruns (default: from config.py)")
+    interval_parser.add_argument("--pipelined", action="store_true", default=None,
+                                 help="download in the background while the next frame is taken")
+
+    subparsers.add_parser("sync", help="download the camera files not downloaded yet")
+
+
+def run_command(camera, args, background=False):
+    """
+    Run one parsed camera command.
+
+    Args:
+        camera: HeadlessCamera
+        args: Namespace from a parser made with add_commands()
+        background: Start the intervalometer on its own thread (daemon)
+
+    Returns:
+        True if the command succeeded
+    """
+    if args.command == "detect":
+        return camera.detect()
+    if args.command == "settings":
+        return camera.settings()
+    if args.command == "set":
+        return camera.set(args.iso, args.shutter, args.aperture)
+    if args.command == "capture":
+        camera.stop_event.clear()
+        camera.capture(args.count)
+        return camera.frames_taken == args.count
+    if args.command == "intervalometer":
+        kwargs = {"bulb_seconds": args.bulb, "pipelined": args.pipelined, "policy": args.policy}
+        if background:
+            camera.start_intervalometer(args.interval, args.frames, **kwargs)
+            return True
+        return camera.intervalometer(args.interval, args.frames, **kwargs)
+    if args.command == "sync":
+        camera.stop_event.clear()
+        return camera.sync()
+    raise ValueError(f"Unknown command {args.command}")
+
+
+def daemon_line(camera, parser, line):
+    """
+    Handle one line read by the daemon.
+
+    Returns:
+        False on "quit", True otherwise
+    """
+    words = shlex.split(line, comments=True)
+    if not words:
+        return True
+    if words[0] == "quit":
+        return False
+    if words[0] == "stop":
+        camera.stop()
+        return True
+    if words[0] == "status":
+        state = "running" if camera.busy() else "idle"
+        print(f"intervalometer {state}, {camera.frames_taken} frame(s) taken", flush=True)
+        return True
+    if camera.busy():
+        camera.status(f"Busy: the intervalometer is running; send 'stop' first ({line.strip()})", "red")
+        return True
+    try:
+        args = parser.parse_args(words)
+    except SystemExit:  # argparse has printed the problem
+        return True
+    try:
+        run_command(camera, args, background=True)
+    except SessionError as e:
+        camera.status(f"Error: {e}", "red")
+    return True
+
+
+def run_daemon(camera, parser, fifo=None):
+    """
+    Take commands until "quit", the end of standard input, or SIGTERM.
+
+    Args:
+        camera: HeadlessCamera
+        parser: Parser of one command line (see add_commands())
+        fifo: Named pipe to read commands from instead of standard input;
+            created if missing, and reopened after each writer closes it
+    """
+    def shutdown(signum, frame):
+        raise Shutdown()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    if fifo and not os.path.exists(fifo):
+        os.mkfifo(fifo)
+    camera.status(f"Ready for commands on {fifo or 'standard input'}", "green")
+    try:
+        running = True
+        while running:
+            # Opening a named pipe waits for a writer
+            source = open(fifo) if fifo else sys.stdin
+            with source:
+                for line in source:
+                    running = daemon_line(camera, parser, line)
+                    if not running:
+                        break
+            if not fifo:
+                # End of input: let a running intervalometer finish
+                camera.wait()
+                break
+    except Shutdown:
+        camera.status("Stopping...", "orange")
+    finally:
+        camera.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Control the camera without the CamCtrl window (same config.py)."
+    )
+    parser.add_argument("--dir", default=os.path.join(os.getcwd(), "captures"),
+                        help="directory captures and synced files are saved to (default ./captures)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print the gphoto2 output")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    add_commands(subparsers)
+    daemon_parser = subparsers.add_parser("daemon", help="keep the camera open and read commands")
+    daemon_parser.add_argument("--fifo", help="named pipe to read commands from (default standard input)")
+
+    args = parser.parse_args(argv)
+    config = load_config()
+    apply_simulator_config(config)
+    apply_metrics_config(config)
+    camera = HeadlessCamera(config, os.path.expanduser(args.dir), verbose=args.verbose)
+
+    if config["persistent_session"]:
+        set_session(GPhotoSession())
+    try:
+        if args.command == "daemon":
+            command_parser = argparse.ArgumentParser(prog="", add_help=False)
+            add_commands(command_parser.add_subparsers(dest="command", required=True))
+            try:
+                if get_session() is not None:
+                    # Ready before the first command arrives
+                    get_session().open()
+            except SessionError as e:
+                camera.status(f"Warning: {e}", "orange")
+            run_daemon(camera, command_parser, args.fifo)
+            return 0
+        def interrupt(signum, frame):
+            # The first Ctrl+C ends a capture series or intervalometer after
+            # the current frame, a second one right away
+            if camera.stop_event.is_set():
+                raise KeyboardInterrupt()
+            camera.status("Stopping after the current frame (Ctrl+C again to abort)...", "orange")
+            camera.stop_event.set()
+
+        signal.signal(signal.SIGINT, interrupt)
+        try:
+            ok = run_command(camera, args)
+        except SessionError as e:
+            camera.status(f"Error: {e}", "red")
+            ok = False
+        return 0 if ok else 1
+    finally:
+        if get_session() is not None:
+            get_session().close()
+            set_session(None)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Configuration loading for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Configuration defaults and loading of config.py.
+
+Kept free of Tkinter so the GUI and the headless tools (cam_cli.py) read
+the same settings the same way.
+"""
+
+import os
+
+from cam_bulb import DEFAULT_OPEN_COMMAND, DEFAULT_CLOSE_COMMAND
+from cam_metrics import metrics, start_server as start_metrics_server
+from cam_sim import SIMULATOR_ENV, parse_options as parse_simulator_options, simulator_enabled
+
+# Default shutter speed mapping (fallback if config file is missing or invalid)
+default_shutter_speed_mapping = {
+    "0.5000s": "1/2",
+    "0.3333s": "1/3",
+    "0.2500s": "1/4",
+    "0.2000s": "1/5",
+    "0.1666s": "1/6",
+    "0.1250s": "1/8",
+    "0.1000s": "1/10",
+    "0.0666s": "1/15",
+    "0.0500s": "1/20",
+    "0.0333s": "1/30",
+    "0.0250s": "1/40",
+    "0.0166s": "1/60",
+    "0.0111s": "1/90",
+    "0.0100s": "1/100",
+    "0.0080s": "1/125",
+    "0.0063s": "1/160",
+    "0.0050s": "1/200",
+    "0.0040s": "1/250",
+    "0.0031s": "1/320",
+    "0.0025s": "1/400",
+    "0.0020s": "1/500",
+    "0.0016s": "1/640",
+    "0.0013s": "1/800",
+    "0.0010s": "1/1000",
+    "0.0008s": "1/1250",
+    "0.0006s": "1/1600",
+    "0.0005s": "1/2000",
+    "0.0004s": "1/2500",
+    "0.0003s": "1/3200",
+    "0.0002s": "1/4000",
+    "1.0000s": '1"',
+    "1.5000s": '1.5"',
+    "2.0000s": '2"',
+    "3.0000s": '3"',
+    "4.0000s": '4"',
+    "5.0000s": '5"',
+    "6.0000s": '6"',
+    "8.0000s": '8"',
+    "10.0000s": '10"',
+    "15.0000s": '15"',
+    "20.0000s": '20"',
+    "25.0000s": '25"',
+    "30.0000s": '30"',
+}
+
+# Default file extensions to look for after capture
+default_file_extensions = [".jpg", ".nef", ".cr2", ".arw", ".raf", ".orf", ".rw2", ".dng", ".3fr", ".pef", ".tif", ".tiff", ".fits", ".fit"]
+
+# Keep one gphoto2 shell open instead of starting a process per operation
+default_persistent_session = True
+
+# Intervalometer behaviour when a frame takes longer than the delay
+default_intervalometer_overrun_policy = "skip"
+
+# Intervalometer downloads in the background while the next frame is taken
+default_pipelined_capture = False
+
+# File name of captures, see cam_naming for the available fields
+default_capture_filename_template = "{date}_{time}_{ms}_{seq:04d}"
+
+# CLI Output tab: lines kept, refresh interval and optional full log file
+default_output_log_max_lines = 2000
+default_output_log_flush_ms = 200
+default_output_log_file = None
+
+# CLI Output tab: camera files shown per page by "List files"
+default_file_list_page_size = 100
+
+# Card browser: thumbnail cache location (None: ~/.cache/camctrl/thumbs) and size
+default_thumbnail_cache_dir = None
+default_thumbnail_cache_mb = 200
+
+# Live view: "preview" (shares the session) or "movie" (faster stream), and frame rate
+default_liveview_mode = "preview"
+default_liveview_fps = 5
+
+# Focus assist: "hfr" (stars) or "contrast", and the central fraction measured
+default_focus_method = "hfr"
+default_focus_roi = 0.25
+
+# Capture panel: histogram and clipping of each capture
+default_exposure_stats = True
+
+# Bulb: exposure time and the gphoto2 shell commands opening/closing the shutter
+default_bulb_seconds = 60
+default_bulb_open_command = DEFAULT_OPEN_COMMAND
+default_bulb_close_command = DEFAULT_CLOSE_COMMAND
+
+# Calibration: how master frames are combined ("median" or "sigma_clip")
+default_calibration_method = "median"
+default_calibration_sigma = 3.0
+
+# Live stack of intervalometer frames: "mean" or "sum", and translation alignment
+default_live_stack_mode = "mean"
+default_live_stack_align = True
+
+# Time-lapse video: frame rate, size and the ffmpeg executable
+default_video_fps = 24
+default_video_size = (1920, 1080)
+default_ffmpeg_path = "ffmpeg"
+
+# Simulated camera (cam_sim.py) instead of gphoto2: False, True, or options
+default_simulator = False
+
+# Operation timing (cam_metrics.py): JSONL event log and Prometheus port
+default_metrics_log = None
+default_metrics_port = None
+
+# Network control API (cam_server.py): listen address, port and access token
+default_server_host = "127.0.0.1"
+default_server_port = 8765
+default_server_token = None
+
+
+def default_config():
+    """Return the configuration used when config.py is missing or incomplete."""
+    return {
+        "shutter_speed_mapping": default_shutter_speed_mapping,
+        "file_extensions": default_file_extensions,
+        "persistent_session": default_persistent_session,
+        "intervalometer_overrun_policy": default_intervalometer_overrun_policy,
+        "pipelined_capture": default_pipelined_capture,
+        "capture_filename_template": default_capture_filename_template,
+        "output_log_max_lines": default_output_log_max_lines,
+        "output_log_flush_ms": default_output_log_flush_ms,
+        "output_log_file": default_output_log_file,
+        "file_list_page_size": default_file_list_page_size,
+        "thumbnail_cache_dir": default_thumbnail_cache_dir,
+        "thumbnail_cache_mb": default_thumbnail_cache_mb,
+        "liveview_mode": default_liveview_mode,
+        "liveview_fps": default_liveview_fps,
+        "focus_method": default_focus_method,
+        "focus_roi": default_focus_roi,
+        "exposure_stats": default_exposure_stats,
+        "bulb_seconds": default_bulb_seconds,
+        "bulb_open_command": default_bulb_open_command,
+        "bulb_close_command": default_bulb_close_command,
+        "calibration_method": default_calibration_method,
+        "calibration_sigma": default_calibration_sigma,
+        "live_stack_mode": default_live_stack_mode,
+        "live_stack_align": default_live_stack_align,
+        "video_fps": default_video_fps,
+        "video_size": default_video_size,
+        "ffmpeg_path": default_ffmpeg_path,
+        "simulator": default_simulator,
+        "metrics_log": default_metrics_log,
+        "metrics_port": default_metrics_port,
+        "server_host": default_server_host,
+        "server_port": default_server_port,
+        "server_token": default_server_token,
+    }
+
+
+def load_config():
+    """Load configuration from config.py file. Creates default file if missing."""
+    # Get the directory where this script is located
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.path.join(script_dir, "config.py")
+    
+    # Default config content
+    default_config_content = '''# Camera Control Configuration
+# Edit this file to customize camera settings
+
+# Shutter speed mapping for display
+# Maps camera values (keys) to display values (values)
+shutter_speed_mapping = {
+    "0.5000s": "1/2",
+    "0.3333s": "1/3",
+    "0.2500s": "1/4",
+    "0.2000s": "1/5",
+    "0.1666s": "1/6",
+    "0.1250s": "1/8",
+    "0.1000s": "1/10",
+    "0.0666s": "1/15",
+    "0.0500s": "1/20",
+    "0.0333s": "1/30",
+    "0.0250s": "1/40",
+    "0.0166s": "1/60",
+    "0.0111s": "1/90",
+    "0.0100s": "1/100",
+    "0.0080s": "1/125",
+    "0.0063s": "1/160",
+    "0.0050s": "1/200",
+    "0.0040s": "1/250",
+    "0.0031s": "1/320",
+    "0.0025s": "1/400",
+    "0.0020s": "1/500",
+    "0.0016s": "1/640",
+    "0.0013s": "1/800",
+    "0.0010s": "1/1000",
+    "0.0008s": "1/1250",
+    "0.0006s": "1/1600",
+    "0.0005s": "1/2000",
+    "0.0004s": "1/2500",
+    "0.0003s": "1/3200",
+    "0.0002s": "1/4000",
+    "1.0000s": '1"',
+    "1.5000s": '1.5"',
+    "2.0000s": '2"',
+    "3.0000s": '3"',
+    "4.0000s": '4"',
+    "5.0000s": '5"',
+    "6.0000s": '6"',
+    "8.0000s": '8"',
+    "10.0000s": '10"',
+    "15.0000s": '15"',
+    "20.0000s": '20"',
+    "25.0000s": '25"',
+    "30.0000s": '30"',
+}
+
+# File extensions to look for after capture
+# Add extensions for your camera's RAW format if needed
+# Common formats: .nef (Nikon), .cr2 (Canon), .arw (Sony), .raf (Fuji), 
+#                 .orf (Olympus), .rw2 (Panasonic), .dng (Adobe/Leica), 
+#                 .3fr (Hasselblad), .pef (Pentax/Ricoh)
+# Professional/Astro: .tif, .tiff, .fits, .fit
+file_extensions = [".jpg", ".nef", ".cr2", ".arw", ".raf", ".orf", ".rw2", ".dng", ".3fr", ".pef", ".tif", ".tiff", ".fits", ".fit"]
+
+# Keep one gphoto2 shell open for all camera operations instead of starting
+# a new gphoto2 process (USB claim + PTP session) for every click or frame.
+# Set to False if another application needs to share the camera.
+persistent_session = True
+
+# Intervalometer: the delay is the time between the starts of two frames.
+# What to do when a frame (capture + download) takes longer than the delay:
+#   "skip"     - drop the missed frames and continue on the original cadence
+#   "catch_up" - take the missed frames back to back, then continue
+#   "stretch"  - take the next frame immediately and restart the cadence
+intervalometer_overrun_policy = "skip"
+
+# Pipelined intervalometer capture: frames stay on the camera card while the
+# next exposure is taken, and are downloaded in the background between
+# exposures. Useful for short delays with large RAW files. Always uses a
+# gphoto2 shell session, even if persistent_session is False.
+pipelined_capture = False
+
+# Name of captured files, without extension. Fields:
+#   {date} 20240131  {time} 213005  {ms} milliseconds, e.g. 042
+#   {seq}  frame counter of this session, e.g. {seq:04d} -> 0001
+# RAW+JPEG pairs share the name. Names are unique within a session even for
+# bursts and sub-second intervals.
+capture_filename_template = "{date}_{time}_{ms}_{seq:04d}"
+
+# CLI Output tab: number of lines kept on screen and how often (in ms) new
+# output is shown. Older lines are dropped from the screen; set
+# output_log_file to a path (e.g. "~/camctrl.log") to keep the full log.
+output_log_max_lines = 2000
+output_log_flush_ms = 200
+output_log_file = None
+
+# CLI Output tab: number of camera files shown per page by "List files"
+file_list_page_size = 100
+
+# Card browser: where thumbnails are cached (None: ~/.cache/camctrl/thumbs)
+# and how many MB the cache may use before the least recently viewed go
+thumbnail_cache_dir = None
+thumbnail_cache_mb = 200
+
+# Live view source: "preview" takes one preview frame at a time over the
+# persistent session, so settings can be changed while it runs; "movie"
+# streams the camera's movie feed, which is faster but blocks other
+# camera operations until live view is stopped.
+liveview_mode = "preview"
+# Frames per second requested from the camera and shown
+liveview_fps = 5
+
+# Focus assist metric: "hfr" (half-flux radius of stars, lower is sharper)
+# or "contrast" (Laplacian variance, higher is sharper), measured over the
+# central focus_roi fraction of each live view frame and capture
+focus_method = "hfr"
+focus_roi = 0.25
+
+# Show a histogram and the clipped highlights/shadows of each capture in
+# the Capture panel (computed in a background process; needs Pillow for
+# JPEG, or rawpy for RAW-only captures)
+exposure_stats = True
+
+# Bulb exposures: default exposure time in seconds, and the gphoto2 shell
+# commands that open and close the shutter. "set-config bulb=1"/"=0" works
+# for most cameras; Canon EOS bodies need
+# "set-config eosremoterelease=Press Full" / "set-config eosremoterelease=Release Full".
+bulb_seconds = 60
+bulb_open_command = "set-config bulb=1"
+bulb_close_command = "set-config bulb=0"
+
+# Calibration tab: how bias, dark and flat frames are combined into masters.
+# "median" is robust with few frames; "sigma_clip" averages the values within
+# calibration_sigma deviations of the median, which is less noisy with many
+# frames and still rejects satellite trails and cosmic rays. Needs NumPy.
+calibration_method = "median"
+calibration_sigma = 3.0
+
+# Intervalometer "Live stack": how frames are integrated ("mean", or "sum"
+# e.g. for star trails) and whether each frame is shifted to line up with
+# the first one (for an untracked mount or drift). Needs NumPy.
+live_stack_mode = "mean"
+live_stack_align = True
+
+# Time-lapse video ("Render video"): frames per second, (width, height) and
+# the ffmpeg executable used to encode it (H.264 .mp4). Captures are
+# letterboxed to the size.
+video_fps = 24
+video_size = (1920, 1080)
+ffmpeg_path = "ffmpeg"
+
+# Use a simulated camera instead of gphoto2, to try CamCtrl out or measure
+# it without a camera. True for the defaults, or options such as
+# "latency=0.05,mbps=20,raw_kb=25000,usb_errors=0.1" (see cam_sim.py).
+# The CAMCTRL_SIMULATOR environment variable takes precedence.
+simulator = False
+
+# Timing of camera operations (cam_metrics.py): a JSONL file that gets one
+# line per operation, with the time of each phase (process start, USB
+# claim, exposure, transfer, rename, retries), and a local port serving the
+# totals in Prometheus text format at http://127.0.0.1:<port>/metrics.
+# None turns either off.
+metrics_log = None
+metrics_port = None
+
+# Network control (cam_server.py): address and port of the HTTP/WebSocket
+# API, and a token every request must carry (None: no token). Use
+# server_host = "0.0.0.0" to reach the camera from other machines, and set
+# a token when you do.
+server_host = "127.0.0.1"
+server_port = 8765
+server_token = None
+
+'''
+    
+    # Create config file if it doesn't exist
+    if not os.path.exists(config_path):
+        try:
+            with open(config_path, 'w') as f:
+                f.write(default_config_content)
+        except Exception as e:
+            print(f"Warning: Could not create config file: {e}")
+            return default_config()
+    
+    # Load config from file
+    try:
+        # Create a restricted namespace for safe execution
+        config_namespace = {}
+        with open(config_path, 'r') as f:
+            config_code = f.read()
+        exec(compile(config_code, config_path, 'exec'), config_namespace)
+        
+        # Extract config values from the namespace, falling back to defaults
+        config = default_config()
+        for key in config:
+            config[key] = config_namespace.get(key, config[key])
+        return config
+    except Exception as e:
+        print(f"Warning: Error loading config file: {e}. Using defaults.")
+        return default_config()
+
+
+def apply_simulator_config(config):
+    """
+    Select the simulated camera if the configuration asks for it.
+
+    Must be called before any gphoto2 command is run. The
+    CAMCTRL_SIMULATOR environment variable takes precedence.
+    """
+    simulator = config.get("simulator", default_simulator)
+    if simulator and not os.environ.get(SIMULATOR_ENV):
+        os.environ[SIMULATOR_ENV] = "1" if simulator is True else str(simulator)
+    if simulator_enabled():
+        try:
+            parse_simulator_options(os.environ[SIMULATOR_ENV])
+        except ValueError as e:
+            print(f"Warning: {e}. Using the simulator defaults.")
+            os.environ[SIMULATOR_ENV] = "1"
+
+
+def apply_metrics_config(config):
+    """Open the metrics log and start the metrics endpoint, if configured."""
+    metrics_log = config.get("metrics_log", default_metrics_log)
+    if metrics_log:
+        try:
+            metrics.open_log(os.path.expanduser(metrics_log))
+        except OSError as e:
+            print(f"Warning: cannot open metrics log {metrics_log}: {e}")
+    metrics_port = config.get("metrics_port", default_metrics_port)
+    if metrics_port:
+        try:
+            start_metrics_server(int(metrics_port))
+        except (OSError, ValueError) as e:
+            print(f"Warning: cannot serve metrics on port {metrics_port}: {e}")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Background command dispatcher for the CamCtrl GUI
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Runs camera operations on a worker pool and hands results back to Tk."""
+
+import itertools
+import queue
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class Task:
+    """A submitted operation, with its cancel flag."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name):
+        self.id = next(self._ids)
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        """
+        Ask the operation to stop; it checks cancel_event when it can.
+
+        An operation that is still queued is dropped and never runs.
+        """
+        self.cancel_event.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class CommandDispatcher:
+    """
+    Runs functions on a worker pool so the Tk main loop never blocks.
+
+    Workers never touch widgets. Anything that has to run on the Tk thread
+    (completion handlers, status and output callbacks) is put on a queue
+    that the main loop drains every poll_ms with root.after().
+
+    The pool has one worker by default: the camera executes one command at
+    a time, and queued operations then simply run in submission order.
+    Long sequences (time lapses, calibration series) are submitted with
+    dedicated=True and get a thread of their own, so single commands keep
+    flowing between frames; the gphoto2 session lock serializes the camera.
+    """
+
+    def __init__(self, root, max_workers=1, poll_ms=50):
+        """
+        Args:
+            root: Tk root window
+            max_workers: Number of worker threads
+            poll_ms: Interval at which results are handed to Tk
+        """
+        self.root = root
+        self.poll_ms = poll_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._ui_queue = queue.Queue()
+        self._tasks = []
+        self._lock = threading.Lock()
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, name=None, on_done=None, on_error=None, with_task=False,
+               dedicated=False, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker.
+
+        Args:
+            fn: Function to run
+            name: Description shown for the running task
+            on_done: Function(result) called on the Tk thread when fn returns
+            on_error: Function(exception) called on the Tk thread if fn raises
+            with_task: Pass the Task as keyword argument `task`, so fn can
+                check task.cancel_event
+            dedicated: Run fn on its own thread instead of queueing it behind
+                the pool's workers
+
+        Returns:
+            Task
+        """
+        task = Task(name or getattr(fn, "__name__", "task"))
+        if with_task:
+            kwargs["task"] = task
+
+        def run():
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                traceback.print_exc()
+                if on_error:
+                    self.post(on_error, e)
+                return None
+            if on_done:
+                self.post(on_done, result)
+            return result
+
+        with self._lock:
+            self._tasks.append(task)
+        if dedicated:
+            task.future = Future()
+            task.future.set_running_or_notify_cancel()
+            threading.Thread(
+                target=lambda: task.future.set_result(run()), name=task.name, daemon=True
+            ).start()
+        else:
+            task.future = self._executor.submit(run)
+        return task
+
+    def post(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the Tk thread. Safe to call from any thread."""
+        self._ui_queue.put((fn, args, kwargs))
+
+    def ui_callback(self, fn):
+        """Wrap fn so that calls from worker threads run on the Tk thread."""
+        def callback(*args, **kwargs):
+            self.post(fn, *args, **kwargs)
+        return callback
+
+    def active_tasks(self):
+        """Return tasks that are queued or running."""
+        with self._lock:
+            self._tasks = [task for task in self._tasks if not task.done()]
+            return list(self._tasks)
+
+    def cancel_all(self):
+        """Cancel every queued or running task."""
+        for task in self.active_tasks():
+            task.cancel()
+
+    def shutdown(self):
+        """Cancel outstanding work and stop the workers."""
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+
+    def _poll(self):
+        while True:
+            try:
+                fn, args, kwargs = self._ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                traceback.print_exc()
+        self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Exposure statistics for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Per-channel histograms and clipping of captures, computed off the UI."""
+
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # JPEG statistics are unavailable
+    Image = None
+
+try:
+    import numpy as np
+    import rawpy
+except ImportError:  # RAW statistics are unavailable
+    rawpy = None
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg")
+RAW_EXTENSIONS = (".cr2", ".cr3", ".nef", ".arw", ".raf", ".orf", ".rw2", ".dng", ".pef")
+
+# Histograms have 256 bins; these bins and below/above count as clipped
+CLIP_LOW = 1
+CLIP_HIGH = 254
+
+# Longest side the image is reduced to before counting
+MAX_SIZE = 1024
+
+# histogram: 256 counts; median: bin 0-255; clipped_*: percent of pixels
+ChannelStats = namedtuple(
+    "ChannelStats", ["name", "histogram", "median", "clipped_low", "clipped_high"]
+)
+# source: "jpeg" or "raw"
+ExposureStats = namedtuple("ExposureStats", ["path", "source", "channels", "pixels"])
+
+
+def _channel_stats(name, histogram):
+    total = sum(histogram)
+    half, running, median = total / 2, 0, 0
+    for value, count in enumerate(histogram):
+        running += count
+        if running >= half:
+            median = value
+            break
+    return ChannelStats(
+        name=name,
+        histogram=list(histogram),
+        median=median,
+        clipped_low=100.0 * sum(histogram[:CLIP_LOW + 1]) / total,
+        clipped_high=100.0 * sum(histogram[CLIP_HIGH:]) / total,
+    )
+
+
+def jpeg_stats(path):
+    """
+    Histogram a JPEG, decoded at reduced size.
+
+    JPEG draft mode lets the decoder skip straight to 1/2, 1/4 or 1/8
+    scale, which is most of the saving; the histogram itself is counted
+    by Pillow in C.
+    """
+    with Image.open(path) as image:
+        image.draft("RGB", (MAX_SIZE, MAX_SIZE))
+        image = image.convert("RGB")
+        image.thumbnail((MAX_SIZE, MAX_SIZE))
+        counts = image.histogram()
+        pixels = image.width * image.height
+    channels = [
+        _channel_stats(name, counts[index * 256:(index + 1) * 256])
+        for index, name in enumerate("RGB")
+    ]
+    return ExposureStats(path, "jpeg", channels, pixels)
+
+
+def raw_stats(path):
+    """
+    Histogram the sensor data of a RAW file, subsampled.
+
+    Uses the linear values before demosaicing, scaled between the black
+    and white levels, so highlights the JPEG rendering hides are counted
+    as clipped only when the sensor itself saturated.
+    """
+    with rawpy.imread(path) as raw:
+        data = raw.raw_image_visible
+        colors = raw.raw_colors_visible
+        step = max(1, max(data.shape) // MAX_SIZE)
+        # An odd step keeps visiting every position of the colour filter
+        step += 1 - step % 2
+        data = data[::step, ::step].astype(np.float32)
+        colors = colors[::step, ::step]
+        black = float(np.mean(raw.black_level_per_channel))
+        white = float(raw.white_level)
+        description = raw.color_desc.decode("ascii", "replace")
+    scaled = np.clip((data - black) / max(white - black, 1.0) * 255.0, 0, 255).astype(np.uint8)
+    channels = []
+    for name in "RGB":
+        indexes = [i for i, c in enumerate(description) if c == name]
+        values = scaled[np.isin(colors, indexes)]
+        if values.size:
+            channels.append(_channel_stats(name, np.bincount(values, minlength=256).tolist()))
+    return ExposureStats(path, "raw", channels, int(scaled.size))
+
+
+def exposure_stats(path):
+    """
+    Compute exposure statistics of an image file.
+
+    Returns:
+        ExposureStats
+
+    Raises:
+        ValueError: If the format is not supported (or its optional
+            library is not installed)
+        OSError: If the file cannot be read
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in JPEG_EXTENSIONS and Image is not None:
+        return jpeg_stats(path)
+    if ext in RAW_EXTENSIONS and rawpy is not None:
+        return raw_stats(path)
+    raise ValueError(f"No exposure statistics for {os.path.basename(path)}")
+
+
+def pick_file(paths):
+    """Choose the file of a capture to analyze: the JPEG if there is one."""
+    for ext_group, available in ((JPEG_EXTENSIONS, Image is not None), (RAW_EXTENSIONS, rawpy is not None)):
+        if not available:
+            continue
+        for path in paths:
+            if os.path.splitext(path)[1].lower() in ext_group:
+                return path
+    return None
+
+
+class ExposureAnalyzer:
+    """
+    Computes exposure statistics of captures in worker processes.
+
+    Decoding a full-size capture takes long enough to matter between
+    intervalometer frames, and holding the GIL for it would slow the
+    capture thread, so it runs in a process pool. Workers are forked,
+    because a spawned worker would re-run the GUI script; where fork is
+    not available a thread pool is used instead.
+    """
+
+    def __init__(self, max_workers=1):
+        if "fork" in multiprocessing.get_all_start_methods():
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("fork")
+            )
+            # Fork the workers now, before pipes to other programs (the
+            # gphoto2 shell, ffmpeg) are open: a worker forked later holds
+            # copies of their write ends, and they never see end of input
+            self._executor.submit(int).result()
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, paths, callback):
+        """
+        Analyze one capture in the background.
+
+        Args:
+            paths: Files of the capture (e.g. a RAW+JPEG pair)
+            callback: Function(ExposureStats or None, error message) called
+                on a pool thread when done
+
+        Returns:
+            Future, or None if none of the files can be analyzed
+        """
+        path = pick_file(paths)
+        if path is None:
+            return None
+        future = self._executor.submit(exposure_stats, path)
+        with self._lock:
+            self._futures.add(future)
+
+        def done(future):
+            with self._lock:
+                self._futures.discard(future)
+            if future.cancelled():
+                return
+            try:
+                callback(future.result(), "")
+            except Exception as e:
+                callback(None, f"{os.path.basename(path)}: {e}")
+
+        future.add_done_callback(done)
+        return future
+
+    def shutdown(self):
+        # Executor.shutdown(cancel_futures=True) needs Python 3.9
+        with self._lock:
+            pending = list(self._futures)
+        for future in pending:
+            future.cancel()
+        self._executor.shutdown(wait=False)
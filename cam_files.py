@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Camera file listing for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module uses gphoto2 command-line tool, which is licensed under GPL-2.0.
+# gphoto2 is a command-line frontend to libgphoto2.
+# For more information, visit: http://www.gphoto.org/
+
+"""Structured records for the files on the camera, with a listing cache."""
+
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from datetime import datetime
+
+from cam_metrics import timed
+from cam_ops import run_gphoto2, card_generation
+
+# One file on the camera. size is in bytes as reported by gphoto2, which
+# rounds to whole KB; mtime is a Unix timestamp or None.
+FileRecord = namedtuple(
+    "FileRecord", ["number", "folder", "name", "size", "mime", "mtime", "width", "height"]
+)
+
+# One page of a query: the records on the page and how many matched in all
+FilePage = namedtuple("FilePage", ["records", "total", "offset", "limit"])
+
+_FOLDER_RE = re.compile(r"^There (?:is|are) .* in folder '(?P<folder>.*)'[.:]?\s*$")
+
+# "#1     IMG_0001.JPG               rd  5233 KB 5184x3456 image/jpeg 1457098375"
+_FILE_RE = re.compile(
+    r"^#(?P<number>\d+)\s+(?P<name>\S+)\s+(?P<perms>\S+)\s+(?P<size>\d+) KB"
+    r"(?:\s+(?P<width>\d+)x(?P<height>\d+))?"
+    r"(?:\s+(?P<mime>[\w.+-]+/[\w.+-]+))?"
+    r"(?:\s+(?P<mtime>\d+))?\s*$"
+)
+
+
+def camera_path(record):
+    """Return the full camera-side path of a FileRecord."""
+    return f"{record.folder.rstrip('/')}/{record.name}"
+
+
+def record_key(record):
+    """Identity of a camera file: folder, name, size and mtime."""
+    return f"{camera_path(record)}|{record.size}|{record.mtime}"
+
+
+def parse_file_listing(stdout):
+    """
+    Parse the output of `gphoto2 --list-files`.
+
+    Args:
+        stdout: Text printed by gphoto2
+
+    Returns:
+        List of FileRecord, in listing order
+    """
+    records = []
+    folder = "/"
+    for line in stdout.splitlines():
+        match = _FOLDER_RE.match(line.strip())
+        if match:
+            folder = match.group("folder")
+            continue
+        match = _FILE_RE.match(line.strip())
+        if not match:
+            continue
+        records.append(FileRecord(
+            number=int(match.group("number")),
+            folder=folder,
+            name=match.group("name"),
+            size=int(match.group("size")) * 1024,
+            mime=match.group("mime"),
+            mtime=int(match.group("mtime")) if match.group("mtime") else None,
+            width=int(match.group("width")) if match.group("width") else None,
+            height=int(match.group("height")) if match.group("height") else None,
+        ))
+    return records
+
+
+@timed("list_camera_files", error=lambda result: result[1])
+def list_camera_files(cancel_event=None, line_callback=None):
+    """
+    List the files on the camera.
+
+    Args:
+        cancel_event: Optional threading.Event that aborts the listing
+        line_callback: Optional function(line) called as the listing comes in
+
+    Returns:
+        Tuple (list of FileRecord, stderr)
+    """
+    stdout, stderr = run_gphoto2(
+        ["--list-files"], cancel_event=cancel_event, line_callback=line_callback
+    )
+    return parse_file_listing(stdout), stderr
+
+
+def format_record(record):
+    """Return a one-line description of a FileRecord."""
+    size = f"{record.size // 1024} KB"
+    when = datetime.fromtimestamp(record.mtime).strftime("%Y-%m-%d %H:%M:%S") if record.mtime else ""
+    return f"{camera_path(record):<50} {size:>10}  {when:<19}  {record.mime or ''}"
+
+
+def _timestamp(value):
+    """Accept a datetime or a Unix timestamp."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return value.timestamp()
+
+
+def _normalize_extensions(extensions):
+    """Turn "jpg, .CR2" or ["jpg", ".cr2"] into (".jpg", ".cr2")."""
+    if not extensions:
+        return None
+    if isinstance(extensions, str):
+        extensions = extensions.replace(",", " ").split()
+    return tuple(sorted("." + ext.lower().lstrip(".") for ext in extensions)) or None
+
+
+class FileListCache:
+    """
+    Keeps the last camera file listing so it can be queried without
+    walking the card again.
+
+    The listing is refreshed on the next query after files were captured
+    or deleted through cam_ops (see cam_ops.card_generation()), or after
+    invalidate(). Files added or removed on the camera itself go unnoticed
+    until then.
+
+    Records are kept sorted by time, so date ranges are found by bisection.
+    The result of each filter is remembered until the next refresh, so
+    paging through it only slices a list.
+    """
+
+    def __init__(self):
+        self._records = None
+        self._times = []
+        self._generation = None
+        self._filtered = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Forget the listing; the next query lists the camera again."""
+        with self._lock:
+            self._records = None
+            self._filtered = {}
+
+    def is_stale(self):
+        """Return True if the next query has to list the camera."""
+        return self._records is None or self._generation != card_generation()
+
+    def records(self, refresh=False, cancel_event=None, progress_callback=None):
+        """
+        Return every file on the camera, oldest first.
+
+        Args:
+            refresh: List the camera even if the cached listing is current
+            cancel_event: Optional threading.Event that aborts the listing
+            progress_callback: Optional function(files_listed) called while
+                listing the camera
+
+        Returns:
+            Tuple (list of FileRecord, stderr); the cached listing is kept
+            if listing the camera fails
+        """
+        with self._lock:
+            if not refresh and not self.is_stale():
+                return self._records, ""
+
+            listed = [0]
+
+            def line_cb(line):
+                if line.startswith("#"):
+                    listed[0] += 1
+                    progress_callback(listed[0])
+
+            generation = card_generation()
+            records, stderr = list_camera_files(
+                cancel_event, line_callback=line_cb if progress_callback else None
+            )
+            if stderr:
+                return self._records or [], stderr
+            records.sort(key=lambda r: (r.mtime is None, r.mtime or 0))
+            self._records = records
+            self._times = [r.mtime for r in records if r.mtime is not None]
+            self._generation = generation
+            self._filtered = {}
+            return records, ""
+
+    def query(self, extensions=None, folder=None, since=None, until=None,
+              offset=0, limit=100, newest_first=False, refresh=False,
+              cancel_event=None, progress_callback=None):
+        """
+        Return one page of the files matching a filter.
+
+        Args:
+            extensions: Extensions to keep, as a list or a string such as
+                "jpg,cr2" (default: all)
+            folder: Only files in this camera folder or below it
+            since: Only files taken at or after this datetime or timestamp
+            until: Only files taken at or before this datetime or timestamp
+            offset: Index of the first matching file to return
+            limit: Most files to return
+            newest_first: Sort newest first instead of oldest first
+            refresh, cancel_event, progress_callback: As for records()
+
+        Returns:
+            Tuple (FilePage, stderr)
+        """
+        records, stderr = self.records(refresh, cancel_event, progress_callback)
+        key = (_normalize_extensions(extensions), folder, _timestamp(since),
+               _timestamp(until), newest_first)
+        with self._lock:
+            matched = self._filtered.get(key)
+            if matched is None:
+                matched = self._filter(records, *key)
+                self._filtered[key] = matched
+        offset = max(0, offset)
+        if matched and offset >= len(matched):
+            # Past the end, e.g. after files were deleted: show the last page
+            offset = (len(matched) - 1) // limit * limit
+        return FilePage(matched[offset:offset + limit], len(matched), offset, limit), stderr
+
+    def _filter(self, records, extensions, folder, since, until, newest_first):
+        if since is not None or until is not None:
+            # Undated files sort last and never match a date range
+            start = bisect_left(self._times, since) if since is not None else 0
+            end = bisect_right(self._times, until) if until is not None else len(self._times)
+            records = records[start:end]
+        if extensions:
+            records = [r for r in records if os.path.splitext(r.name)[1].lower() in extensions]
+        if folder:
+            prefix = folder.rstrip("/") + "/"
+            records = [r for r in records if (r.folder.rstrip("/") + "/").startswith(prefix)]
+        if newest_first:
+            records = list(reversed(records))
+        return records
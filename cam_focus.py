@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Focus assist for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Sharpness metrics for focusing: star half-flux radius and contrast."""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # Focus assist is unavailable
+    np = None
+
+# "hfr": median half-flux radius of the stars in the ROI, in pixels of the
+#     measured image; lower is sharper. For astro.
+# "contrast": variance of the Laplacian over the ROI; higher is sharper.
+#     For daylight subjects.
+FOCUS_METHODS = ("hfr", "contrast")
+
+# value is the metric; stars is the number of stars measured (hfr only)
+FocusResult = namedtuple("FocusResult", ["method", "value", "stars", "time", "seconds"])
+
+
+def to_gray(image, roi_fraction=0.25):
+    """
+    Crop the centre of an image and return it as a float32 array.
+
+    Args:
+        image: PIL Image or 2D/3D array
+        roi_fraction: Width and height of the central region, as a
+            fraction of the image (1.0 = whole image)
+
+    Returns:
+        2D float32 array
+    """
+    if hasattr(image, "crop"):
+        width, height = image.size
+        w, h = max(3, int(width * roi_fraction)), max(3, int(height * roi_fraction))
+        left, top = (width - w) // 2, (height - h) // 2
+        # Crop before converting, so only the ROI is copied
+        return np.asarray(image.crop((left, top, left + w, top + h)).convert("L"), dtype=np.float32)
+    array = np.asarray(image, dtype=np.float32)
+    if array.ndim == 3:
+        array = array.mean(axis=2)
+    height, width = array.shape
+    h, w = max(3, int(height * roi_fraction)), max(3, int(width * roi_fraction))
+    top, left = (height - h) // 2, (width - w) // 2
+    return array[top:top + h, left:left + w]
+
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian of a 2D array."""
+    centre = gray[1:-1, 1:-1]
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4 * centre
+    )
+    return float(laplacian.var())
+
+
+def find_stars(gray, threshold_sigma=5.0, max_stars=50, box=15):
+    """
+    Locate star peaks in a 2D array.
+
+    A star is a pixel at least as bright as its 8 neighbours and more than
+    threshold_sigma noise levels above the background (median, with the
+    noise estimated from the median absolute deviation).
+
+    Returns:
+        Tuple (array of (row, col) peaks, brightest first; background; noise)
+    """
+    background = float(np.median(gray))
+    noise = float(np.median(np.abs(gray - background))) * 1.4826 or 1.0
+    centre = gray[1:-1, 1:-1]
+    peak = centre > background + threshold_sigma * noise
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            if dy or dx:
+                neighbour = gray[1 + dy:gray.shape[0] - 1 + dy, 1 + dx:gray.shape[1] - 1 + dx]
+                # Ties with earlier neighbours pass, so a saturated (flat)
+                # star top still yields one peak
+                if (dy, dx) < (0, 0):
+                    peak &= centre >= neighbour
+                else:
+                    peak &= centre > neighbour
+    rows, cols = np.nonzero(peak)
+    rows, cols = rows + 1, cols + 1
+    # Only stars whose whole box fits in the image
+    half = box // 2
+    inside = (
+        (rows >= half) & (rows < gray.shape[0] - half)
+        & (cols >= half) & (cols < gray.shape[1] - half)
+    )
+    rows, cols = rows[inside], cols[inside]
+    order = np.argsort(gray[rows, cols])[::-1][:max_stars]
+    return np.stack([rows[order], cols[order]], axis=1), background, noise
+
+
+def half_flux_radius(gray, threshold_sigma=5.0, max_stars=50, box=15):
+    """
+    Median half-flux radius of the stars in a 2D array.
+
+    Uses the usual focuser estimate HFR = sum(flux * r) / sum(flux) around
+    each star's centroid. All stars are measured at once on a stack of
+    box x box cut-outs. For a Gaussian star FWHM is about 2 * HFR.
+
+    Returns:
+        Tuple (HFR in pixels or None if no star was found, number of stars)
+    """
+    peaks, background, noise = find_stars(gray, threshold_sigma, max_stars, box)
+    if len(peaks) == 0:
+        return None, 0
+    half = box // 2
+    offsets = np.arange(-half, half + 1)
+    # (stars, box, box) cut-outs through fancy indexing
+    rows = peaks[:, 0, None, None] + offsets[None, :, None]
+    cols = peaks[:, 1, None, None] + offsets[None, None, :]
+    flux = gray[rows, cols] - background
+    # Background noise far from the centre would inflate the radius
+    flux[flux < 2 * noise] = 0
+    total = flux.sum(axis=(1, 2))
+    keep = total > 0
+    flux, total = flux[keep], total[keep]
+    if len(total) == 0:
+        return None, 0
+    ys = offsets[None, :, None].astype(np.float32)
+    xs = offsets[None, None, :].astype(np.float32)
+    cy = (flux * ys).sum(axis=(1, 2)) / total
+    cx = (flux * xs).sum(axis=(1, 2)) / total
+    radius = np.sqrt((ys - cy[:, None, None]) ** 2 + (xs - cx[:, None, None]) ** 2)
+    hfr = (flux * radius).sum(axis=(1, 2)) / total
+    return float(np.median(hfr)), len(hfr)
+
+
+class FocusMeter:
+    """
+    Measures focus on successive frames and keeps the history.
+
+    measure() may be called from any thread (e.g. the live view decoder);
+    the UI reads history() to plot the metric over time.
+    """
+
+    def __init__(self, method="contrast", roi_fraction=0.25, history=300):
+        """
+        Args:
+            method: One of FOCUS_METHODS
+            roi_fraction: Size of the central region measured, as a
+                fraction of the frame
+            history: Number of results kept
+
+        Raises:
+            RuntimeError: If NumPy is not installed
+            ValueError: If method is unknown
+        """
+        if np is None:
+            raise RuntimeError("focus assist needs NumPy (pip install numpy)")
+        if method not in FOCUS_METHODS:
+            raise ValueError(f"Unknown focus method {method!r}, expected one of {FOCUS_METHODS}")
+        self.method = method
+        self.roi_fraction = roi_fraction
+        self._history = deque(maxlen=history)
+        self._lock = threading.Lock()
+
+    def measure(self, image):
+        """
+        Measure one frame and add the result to the history.
+
+        Args:
+            image: PIL Image or array
+
+        Returns:
+            FocusResult (value is None if no star was found)
+        """
+        started = time.perf_counter()
+        gray = to_gray(image, self.roi_fraction)
+        stars = 0
+        if self.method == "hfr":
+            value, stars = half_flux_radius(gray)
+        else:
+            value = laplacian_variance(gray)
+        result = FocusResult(self.method, value, stars, time.time(), time.perf_counter() - started)
+        with self._lock:
+            self._history.append(result)
+        return result
+
+    def history(self):
+        """Return the kept results, oldest first."""
+        with self._lock:
+            return list(self._history)
+
+    def best(self):
+        """Return the sharpest result measured so far, or None."""
+        results = [r for r in self.history() if r.value is not None]
+        if not results:
+            return None
+        if self.method == "hfr":
+            return min(results, key=lambda r: r.value)
+        return max(results, key=lambda r: r.value)
+
+    def clear(self):
+        with self._lock:
+            self._history.clear()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Live view for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module uses gphoto2 command-line tool, which is licensed under GPL-2.0.
+# gphoto2 is a command-line frontend to libgphoto2.
+# For more information, visit: http://www.gphoto.org/
+
+"""Live view: preview frames from the camera, decoded off the Tk thread."""
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+from cam_ops import get_session, parse_saved_files
+from cam_session import GPhotoSession, SessionError
+
+try:
+    from PIL import Image
+except ImportError:  # Frames are counted but cannot be decoded
+    Image = None
+
+# "preview": one `capture-preview` per frame over the persistent session;
+#     other camera operations can run between frames.
+# "movie": a separate `gphoto2 --capture-movie --stdout` stream; faster,
+#     but it has the camera to itself until live view stops.
+LIVEVIEW_MODES = ("preview", "movie")
+
+
+def split_jpeg_frames(buffer):
+    """
+    Split complete JPEG frames off the front of a byte stream.
+
+    Frames are found by their start (FF D8) and end (FF D9) markers, which
+    works for the plain JPEGs cameras send as preview frames.
+
+    Args:
+        buffer: bytes or bytearray received so far
+
+    Returns:
+        Tuple (list of frame bytes, remaining bytes of an incomplete frame)
+    """
+    frames = []
+    start = buffer.find(b"\xff\xd8")
+    while start != -1:
+        end = buffer.find(b"\xff\xd9", start + 2)
+        if end == -1:
+            break
+        frames.append(bytes(buffer[start:end + 2]))
+        start = buffer.find(b"\xff\xd8", end + 2)
+    return frames, bytes(buffer[start:]) if start != -1 else b""
+
+
+class RateMeter:
+    """Events per second over a sliding window."""
+
+    def __init__(self, window=2.0, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self._times = deque()
+
+    def tick(self):
+        now = self.clock()
+        self._times.append(now)
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+
+    def rate(self):
+        now = self.clock()
+        while self._times and now - self._times[0] > self.window:
+            self._times.popleft()
+        if len(self._times) < 2:
+            return 0.0
+        return (len(self._times) - 1) / max(now - self._times[0], 1e-6)
+
+
+class LiveView:
+    """
+    Streams preview frames from the camera.
+
+    A reader thread receives JPEG frames from the camera and a decoder
+    thread turns the newest one into an image of display_size. Each hand
+    over is a single slot, not a queue: a frame that is replaced before
+    it was used is dropped, so a slow decoder or UI always gets the most
+    recent frame instead of falling further behind.
+
+    The UI polls take_frame() on a timer. Decoding needs Pillow; without
+    it frames are still received and counted, and take_frame() returns
+    the raw JPEG bytes.
+    """
+
+    def __init__(self, mode="preview", target_fps=5, display_size=(640, 426),
+                 session=None, status_callback=None, frame_callback=None):
+        """
+        Args:
+            mode: One of LIVEVIEW_MODES
+            target_fps: Frames per second to request (preview mode) and
+                decode (both modes)
+            display_size: (width, height) the frames are scaled to fit
+            session: GPhotoSession to use (default: the active session, or
+                a private one if none is active)
+            status_callback: Function(status_message, color) for errors
+            frame_callback: Optional function(image) called on the decoder
+                thread with each decoded frame, e.g. to measure focus
+        """
+        if mode not in LIVEVIEW_MODES:
+            raise ValueError(f"Unknown live view mode {mode!r}, expected one of {LIVEVIEW_MODES}")
+        self.mode = mode
+        self.target_fps = target_fps
+        self.display_size = display_size
+        self.status_callback = status_callback
+        self.frame_callback = frame_callback
+        self.dropped = 0
+        self._session = session
+        self._own_session = False
+        self._stop = threading.Event()
+        self._cond = threading.Condition()
+        self._raw = None
+        self._frame = None
+        self._process = None
+        self._threads = []
+        self.camera_rate = RateMeter()
+        self.shown_rate = RateMeter()
+
+    def start(self):
+        """Start streaming."""
+        if self.running():
+            return
+        self._stop.clear()
+        self.dropped = 0
+        if self._session is None:
+            self._session = get_session()
+            if self._session is None:
+                self._session = GPhotoSession()
+                self._own_session = True
+        reader = self._read_movie if self.mode == "movie" else self._read_previews
+        self._threads = [
+            threading.Thread(target=reader, name="liveview-reader", daemon=True),
+            threading.Thread(target=self._decode, name="liveview-decoder", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop streaming and wait for the threads to finish."""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.terminate()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=5)
+        self._threads = []
+        if self._own_session:
+            self._session.close()
+            self._session = None
+            self._own_session = False
+
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def set_target_fps(self, fps):
+        self.target_fps = max(0.1, fps)
+
+    def take_frame(self):
+        """
+        Return the newest decoded frame if there is one not yet taken.
+
+        Returns:
+            PIL Image (raw JPEG bytes without Pillow), or None
+        """
+        with self._cond:
+            frame, self._frame = self._frame, None
+        if frame is not None:
+            self.shown_rate.tick()
+        return frame
+
+    def stats(self):
+        """Return target, camera and shown frame rates and the dropped frame count."""
+        return {
+            "target_fps": self.target_fps,
+            "camera_fps": self.camera_rate.rate(),
+            "shown_fps": self.shown_rate.rate(),
+            "dropped": self.dropped,
+        }
+
+    def _put_raw(self, data):
+        self.camera_rate.tick()
+        with self._cond:
+            if self._raw is not None:
+                self.dropped += 1
+            self._raw = data
+            self._cond.notify()
+
+    def _fail(self, message):
+        if not self._stop.is_set() and self.status_callback:
+            self.status_callback(f"Live view stopped: {message}", "red")
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _read_previews(self):
+        temp_dir = tempfile.mkdtemp(prefix="camctrl_liveview_")
+        try:
+            while not self._stop.is_set():
+                started = time.monotonic()
+                try:
+                    stdout, stderr = self._session.shell(["capture-preview"], cwd=temp_dir)
+                except SessionError as e:
+                    self._fail(str(e))
+                    return
+                saved = parse_saved_files(stdout)
+                if stderr or not saved:
+                    self._fail(stderr.strip() or "camera sent no preview")
+                    return
+                path = os.path.join(temp_dir, saved[0])
+                with open(path, "rb") as f:
+                    self._put_raw(f.read())
+                os.remove(path)
+                self._stop.wait(max(0.0, 1.0 / self.target_fps - (time.monotonic() - started)))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _read_movie(self):
+        # The stream needs the camera to itself: close the shell and keep
+        # other operations waiting on the session lock until we are done
+        with self._session.lock:
+            self._session.close()
+            try:
+                self._process = subprocess.Popen(
+                    self._session.command + ["--capture-movie", "--stdout"],
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                )
+            except OSError as e:
+                self._fail(str(e))
+                return
+            # Drained on its own thread, or a chatty gphoto2 fills the pipe
+            # and blocks the stream; the tail is kept for the error message
+            stderr = bytearray()
+
+            def read_stderr():
+                for line in self._process.stderr:
+                    stderr.extend(line)
+                    del stderr[:-4096]
+
+            stderr_thread = threading.Thread(target=read_stderr, name="liveview-stderr", daemon=True)
+            stderr_thread.start()
+            buffer = b""
+            try:
+                while not self._stop.is_set():
+                    chunk = self._process.stdout.read1(65536)
+                    if not chunk:
+                        break
+                    frames, buffer = split_jpeg_frames(buffer + chunk)
+                    for frame in frames:
+                        self._put_raw(frame)
+            finally:
+                process = self._process
+                if process.poll() is None:
+                    process.terminate()
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                stderr_thread.join()
+                process.stdout.close()
+                process.stderr.close()
+                self._process = None
+            if not self._stop.is_set():
+                self._fail(stderr.decode("utf-8", "replace").strip() or "stream ended")
+
+    def _decode(self):
+        next_due = time.monotonic()
+        while True:
+            with self._cond:
+                while self._raw is None and not self._stop.is_set():
+                    self._cond.wait()
+                if self._stop.is_set():
+                    return
+                data, self._raw = self._raw, None
+            frame = data
+            if Image is not None:
+                try:
+                    image = Image.open(io.BytesIO(data))
+                    # Let the JPEG decoder skip detail we would scale away
+                    image.draft("RGB", self.display_size)
+                    image = image.convert("RGB")
+                    image.thumbnail(self.display_size)
+                    frame = image
+                except OSError:
+                    self.dropped += 1
+                    continue
+                if self.frame_callback is not None:
+                    self.frame_callback(frame)
+            with self._cond:
+                if self._frame is not None:
+                    self.dropped += 1
+                self._frame = frame
+            # Decode at most target_fps frames a second
+            next_due = max(next_due + 1.0 / self.target_fps, time.monotonic())
+            self._stop.wait(max(0.0, next_due - time.monotonic()))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Bounded output log for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Thread-safe ring buffer for gphoto2 output, with optional spill to disk."""
+
+import os
+import threading
+from collections import deque
+
+
+class OutputLog:
+    """
+    Collects output text from any thread for periodic display.
+
+    Workers call append(); the UI calls drain() on a timer and inserts the
+    result in one go. Text waiting to be drained is capped at max_lines, so
+    a UI that falls behind loses the oldest lines instead of growing
+    without limit. If spill_path is set, everything appended is also
+    written to that file, so the full log of a long sequence is kept.
+    """
+
+    def __init__(self, max_lines=2000, spill_path=None):
+        """
+        Args:
+            max_lines: Most lines kept waiting for the UI (and shown by it)
+            spill_path: Optional file that receives the complete log
+        """
+        self.max_lines = max_lines
+        self._pending = deque(maxlen=max_lines)
+        self._cleared = False
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._spill = None
+        if spill_path:
+            spill_path = os.path.expanduser(spill_path)
+            os.makedirs(os.path.dirname(os.path.abspath(spill_path)), exist_ok=True)
+            self._spill = open(spill_path, "a", buffering=1, encoding="utf-8")
+
+    def append(self, text):
+        """Add output text. Safe to call from any thread."""
+        if not text:
+            return
+        with self._lock:
+            lines = text.splitlines(keepends=True)
+            overflow = len(self._pending) + len(lines) - self.max_lines
+            if overflow > 0:
+                self._dropped += min(overflow, len(self._pending) + len(lines))
+            self._pending.extend(lines)
+            if self._spill is not None:
+                self._spill.write(text)
+
+    def clear(self):
+        """Drop pending text and tell the UI to clear its display."""
+        with self._lock:
+            self._pending.clear()
+            self._cleared = True
+            self._dropped = 0
+
+    def drain(self):
+        """
+        Take everything appended since the last drain.
+
+        Returns:
+            Tuple (cleared, text, dropped): whether the display must be
+            cleared first, the text to append, and how many lines were
+            discarded because the buffer was full
+        """
+        with self._lock:
+            cleared, self._cleared = self._cleared, False
+            dropped, self._dropped = self._dropped, 0
+            text = "".join(self._pending)
+            self._pending.clear()
+            return cleared, text, dropped
+
+    def close(self):
+        """Close the spill file."""
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Operation metrics for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Timing of camera operations by phase.
+
+Every camera operation (capture_image, set_iso, ...) is timed as a whole
+and split into phases:
+
+    spawn       starting a gphoto2 process
+    claim       a new gphoto2 shell claiming the camera (up to its prompt)
+    command     camera command round trips not covered by another phase
+    exposure    taking a picture that stays on the camera
+    capture     taking a picture and downloading it (exposure + transfer)
+    transfer    downloading files
+    rename      giving downloaded files their final name
+    retry_wait  cleaning up and waiting before a retry
+
+Phase times are exclusive: a process spawned during an exposure counts
+as spawn, not exposure. Finished operations are kept in rolling counters
+(see Metrics) and, if a log is open, written as one JSON line each.
+"""
+
+import functools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PHASES = ("spawn", "claim", "command", "exposure", "capture", "transfer", "rename", "retry_wait")
+
+# Durations kept per series for the quantiles
+WINDOW = 500
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Operation name of phases timed outside any operation
+OTHER = "other"
+
+
+class Operation:
+    """One camera operation being timed; see Metrics.operation()."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = time.time()
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.retries = 0
+        self.error = ""
+
+    def fail(self, error):
+        """Mark the operation failed (the first error is kept)."""
+        if error and not self.error:
+            self.error = str(error).strip()[:500]
+
+    def retry(self):
+        self.retries += 1
+
+
+class _Series:
+    """Count, total and the last WINDOW values of a duration."""
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.values = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.values.append(seconds)
+
+    def quantiles(self):
+        ordered = sorted(self.values)
+        if not ordered:
+            return {}
+        return {q: ordered[int(round(q * (len(ordered) - 1)))] for q in QUANTILES}
+
+
+class Metrics:
+    """
+    Rolling counters of camera operations, with an optional JSONL log.
+
+    Operations and phases are tracked per thread, so operations running on
+    different threads (e.g. a download during a capture) are timed apart.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._log = None
+        self.log_path = None
+        self.operations = {}
+        self.phases = {}
+        self.errors = {}
+        self.retries = {}
+        self.last_time = {}
+
+    def open_log(self, path):
+        """Append finished operations to path, one JSON object per line."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            # Line buffered, so a crash or power cut loses at most one event
+            self._log = open(path, "a", buffering=1, encoding="utf-8")
+            self.log_path = path
+
+    def close_log(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._log = None
+            self.log_path = None
+
+    def current(self):
+        """Return the Operation running on this thread, or None."""
+        return getattr(self._local, "operation", None)
+
+    @contextmanager
+    def operation(self, name):
+        """
+        Time a camera operation; yields its Operation.
+
+        An operation started inside another one on the same thread is
+        part of the outer one, e.g. capture_image() within a time-lapse frame.
+        """
+        outer = self.current()
+        if outer is not None:
+            yield outer
+            return
+        op = Operation(name)
+        self._local.operation = op
+        try:
+            yield op
+        except Exception as e:
+            op.fail(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self._local.operation = None
+            self._finish(op)
+
+    @contextmanager
+    def phase(self, name, nested=True):
+        """
+        Time a phase of the current operation.
+
+        Args:
+            name: One of PHASES
+            nested: If False, the phase is not timed when it runs within
+                another phase, which then keeps the time (for the generic
+                "command" phase)
+        """
+        stack = self._local.__dict__.setdefault("phases", [])
+        if not nested and stack:
+            yield
+            return
+        # [name, seconds taken by phases nested in this one]
+        frame = [name, 0.0]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            self._add_phase(name, elapsed - frame[1])
+
+    def retry(self):
+        """Count a retry of the current operation."""
+        op = self.current()
+        if op is not None:
+            op.retry()
+        else:
+            with self._lock:
+                self.retries[OTHER] = self.retries.get(OTHER, 0) + 1
+
+    def _add_phase(self, name, seconds):
+        op = self.current()
+        if op is not None:
+            op.phases[name] = op.phases.get(name, 0.0) + seconds
+            return
+        with self._lock:
+            self._series(self.phases, (OTHER, name)).add(seconds)
+
+    def _series(self, table, key):
+        series = table.get(key)
+        if series is None:
+            series = table[key] = _Series(self.window)
+        return series
+
+    def _finish(self, op):
+        seconds = time.perf_counter() - op.started
+        event = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(op.wall_time))
+            + f".{int(op.wall_time % 1 * 1000):03d}",
+            "operation": op.name,
+            "ok": not op.error,
+            "seconds": round(seconds, 6),
+            "phases": {name: round(value, 6) for name, value in op.phases.items()},
+            "retries": op.retries,
+        }
+        if op.error:
+            event["error"] = op.error
+        with self._lock:
+            self._series(self.operations, op.name).add(seconds)
+            for name, value in op.phases.items():
+                self._series(self.phases, (op.name, name)).add(value)
+            if op.error:
+                self.errors[op.name] = self.errors.get(op.name, 0) + 1
+            if op.retries:
+                self.retries[op.name] = self.retries.get(op.name, 0) + op.retries
+            self.last_time[op.name] = op.wall_time
+            if self._log is not None:
+                try:
+                    self._log.write(json.dumps(event) + "\n")
+                except (OSError, ValueError):
+                    pass  # A full disk must not stop the capture
+
+    def snapshot(self):
+        """
+        Return the counters as a dictionary.
+
+        Returns:
+            {"operations": {name: {"count", "seconds", "errors", "retries",
+            "p50", "p95", "p99"}}, "phases": {"operation/phase": {"count",
+            "seconds", "p50", "p95", "p99"}}}
+        """
+        with self._lock:
+            operations = {}
+            for name, series in self.operations.items():
+                entry = {
+                    "count": series.count, "seconds": series.total,
+                    "errors": self.errors.get(name, 0), "retries": self.retries.get(name, 0),
+                }
+                entry.update({f"p{int(q * 100)}": v for q, v in series.quantiles().items()})
+                operations[name] = entry
+            phases = {}
+            for (name, phase), series in self.phases.items():
+                entry = {"count": series.count, "seconds": series.total}
+                entry.update({f"p{int(q * 100)}": v for q, v in series.quantiles().items()})
+                phases[f"{name}/{phase}"] = entry
+            return {"operations": operations, "phases": phases}
+
+    def prometheus(self):
+        """Return the counters in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP camctrl_operation_seconds Duration of camera operations.",
+                "# TYPE camctrl_operation_seconds summary",
+            ]
+            for name, series in sorted(self.operations.items()):
+                lines += _summary_lines("camctrl_operation_seconds", {"operation": name}, series)
+            lines += [
+                "# HELP camctrl_phase_seconds Time spent in each phase of camera operations.",
+                "# TYPE camctrl_phase_seconds summary",
+            ]
+            for (name, phase), series in sorted(self.phases.items()):
+                lines += _summary_lines(
+                    "camctrl_phase_seconds", {"operation": name, "phase": phase}, series
+                )
+            lines += [
+                "# HELP camctrl_operation_errors_total Camera operations that failed.",
+                "# TYPE camctrl_operation_errors_total counter",
+            ]
+            for name in sorted(self.operations):
+                lines.append(f"camctrl_operation_errors_total{_labels({'operation': name})} {self.errors.get(name, 0)}")
+            lines += [
+                "# HELP camctrl_retries_total Retries of camera commands, e.g. after USB errors.",
+                "# TYPE camctrl_retries_total counter",
+            ]
+            for name, count in sorted(self.retries.items()):
+                lines.append(f"camctrl_retries_total{_labels({'operation': name})} {count}")
+            lines += [
+                "# HELP camctrl_last_operation_timestamp_seconds When each operation last finished.",
+                "# TYPE camctrl_last_operation_timestamp_seconds gauge",
+            ]
+            for name, value in sorted(self.last_time.items()):
+                lines.append(f"camctrl_last_operation_timestamp_seconds{_labels({'operation': name})} {value:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _summary_lines(metric, labels, series):
+    lines = []
+    for q, value in series.quantiles().items():
+        lines.append(f"{metric}{_labels(dict(labels, quantile=str(q)))} {value:.6f}")
+    lines.append(f"{metric}_sum{_labels(labels)} {series.total:.6f}")
+    lines.append(f"{metric}_count{_labels(labels)} {series.count}")
+    return lines
+
+
+# Shared by all modules
+metrics = Metrics()
+
+
+def operation(name):
+    """Time a camera operation with the shared Metrics; see Metrics.operation()."""
+    return metrics.operation(name)
+
+
+def phase(name, nested=True):
+    """Time a phase with the shared Metrics; see Metrics.phase()."""
+    return metrics.phase(name, nested)
+
+
+def retry():
+    """Count a retry with the shared Metrics."""
+    metrics.retry()
+
+
+def fail(error):
+    """Mark the current operation failed, if one is being timed."""
+    op = metrics.current()
+    if op is not None:
+        op.fail(error)
+
+
+def timed(name, error=None):
+    """
+    Decorator that times every call of a function as operation name.
+
+    Args:
+        name: Operation name
+        error: Optional function(return value) returning an error message,
+            or a false value if the call succeeded
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with metrics.operation(name) as op:
+                result = function(*args, **kwargs)
+                if error is not None:
+                    op.fail(error(result))
+                return result
+        return wrapper
+    return decorate
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = metrics
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = self.registry.prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path.split("?", 1)[0] == "/metrics.json":
+            body = json.dumps(self.registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scraped every few seconds; not worth a line each
+
+
+def start_server(port, host="127.0.0.1", registry=None):
+    """
+    Serve the metrics over HTTP on a background thread.
+
+    /metrics is in the Prometheus text format, /metrics.json is snapshot().
+
+    Args:
+        port: TCP port
+        host: Address to listen on; the default only accepts local connections
+        registry: Metrics to serve (default: the shared one)
+
+    Returns:
+        The ThreadingHTTPServer; call shutdown() to stop it
+
+    Raises:
+        OSError: If the port cannot be opened
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Capture file naming for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Unique capture file names from a template and a sequence counter."""
+
+import os
+import threading
+from datetime import datetime
+
+# Fields available in templates:
+#   {date} 20240131   {time} 213005   {ms} 042 (milliseconds)
+#   {seq}  per-session frame counter, e.g. {seq:04d}
+DEFAULT_TEMPLATE = "{date}_{time}_{ms}_{seq:04d}"
+
+
+class FileNamer:
+    """
+    Hands out file name stems that are unique for the life of the object.
+
+    Names combine a millisecond timestamp with a monotonic sequence number.
+    Every stem handed out is kept in memory per directory, so uniqueness
+    is checked without listing the directory. RAW+JPEG pairs of one frame
+    share a stem and differ only by extension.
+    """
+
+    def __init__(self, template=DEFAULT_TEMPLATE, start_sequence=1):
+        """
+        Args:
+            template: str.format template for the stem, see DEFAULT_TEMPLATE
+            start_sequence: First value of {seq}
+        """
+        self.template = template
+        self.sequence = start_sequence
+        self._used = {}
+        self._lock = threading.Lock()
+        # Fail early on a bad template rather than on the first capture
+        self._format(datetime.now(), self.sequence)
+
+    def next_stem(self, directory, when=None):
+        """
+        Reserve the name of the next frame.
+
+        Args:
+            directory: Directory the frame will be saved in
+            when: datetime of the capture (default: now)
+
+        Returns:
+            File name stem without extension, unique within directory
+        """
+        when = when or datetime.now()
+        with self._lock:
+            used = self._used.setdefault(os.path.abspath(directory), set())
+            stem = self._format(when, self.sequence)
+            self.sequence += 1
+            # Only reachable with a template that has no {seq}
+            base, n = stem, 1
+            while stem in used:
+                stem = f"{base}_{n}"
+                n += 1
+            used.add(stem)
+            return stem
+
+    def next_path(self, directory, ext, when=None):
+        """Return directory/<next stem><ext>."""
+        return os.path.join(directory, self.next_stem(directory, when) + ext)
+
+    def _format(self, when, sequence):
+        return self.template.format(
+            date=when.strftime("%Y%m%d"),
+            time=when.strftime("%H%M%S"),
+            ms=f"{when.microsecond // 1000:03d}",
+            seq=sequence,
+        )
@@ -26,12 +26,91 @@
 """Camera operations module for gphoto2 commands."""
 
 import subprocess
-from datetime import datetime
+from collections import namedtuple
 import os
-import glob
+import threading
 import time
 
+from cam_session import run_once, is_usb_error, gphoto2_command, SessionError
+from cam_sim import simulator_enabled
+from cam_metrics import timed, operation, phase, retry, fail
+from cam_naming import FileNamer
 
+# Session used by every operation in this module, see set_session()
+_session = None
+
+# Hidden directory in the save path that the gphoto2 shell downloads into
+STAGING_DIR = ".camctrl_download"
+
+# Names captures when the caller does not pass its own FileNamer
+_default_namer = FileNamer()
+
+# Bumped whenever this module adds files to or removes files from the
+# camera, so cached listings (cam_files.FileListCache) know they are stale
+_card_generation = 0
+_card_lock = threading.Lock()
+
+
+def _stderr(result):
+    """Error of a function returning (stdout, stderr), for cam_metrics.timed()."""
+    return result[1]
+
+
+def set_session(session):
+    """
+    Route all camera operations through a persistent session.
+
+    Args:
+        session: cam_session.GPhotoSession instance, or None to go back to
+            one gphoto2 process per operation
+    """
+    global _session
+    _session = session
+
+
+def get_session():
+    """Return the active persistent session, or None."""
+    return _session
+
+
+def card_generation():
+    """Return a counter that changes whenever files on the camera change."""
+    return _card_generation
+
+
+def card_changed():
+    """Note that files on the camera were added or removed."""
+    global _card_generation
+    with _card_lock:
+        _card_generation += 1
+
+
+def run_gphoto2(args, cwd=None, timeout=None, cancel_event=None, line_callback=None):
+    """
+    Run gphoto2 with the given options.
+
+    Uses the persistent session when one is set, otherwise starts a new
+    gphoto2 process.
+
+    Args:
+        args: List of gphoto2 options, e.g. ["--get-config", "/main/imgsettings/iso"]
+        cwd: Directory downloaded files are written to (default: process CWD)
+        timeout: Seconds to wait for gphoto2
+        cancel_event: Optional threading.Event that aborts a long operation
+        line_callback: Optional function(line) called with each output line
+            of a long operation, e.g. to report progress
+
+    Returns:
+        Tuple (stdout, stderr)
+    """
+    if _session is not None:
+        return _session.run(args, cwd=cwd, timeout=timeout,
+                            cancel_event=cancel_event, line_callback=line_callback)
+    return run_once(args, cwd=cwd, timeout=timeout,
+                    cancel_event=cancel_event, line_callback=line_callback)
+
+
+@timed("detect_camera", error=_stderr)
 def detect_camera(output_callback=None, status_callback=None):
     """
     Detect connected camera using gphoto2.
@@ -40,13 +119,7 @@ def detect_camera(output_callback=None, status_callback=None):
         output_callback: Function to call with stdout/stderr output
         status_callback: Function(status_message, color) to update status
     """
-    p = subprocess.Popen(
-        ["gphoto2", "--auto-detect"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    stdout, stderr = p.communicate()
+    stdout, stderr = run_gphoto2(["--auto-detect"])
     
     if output_callback:
         output_callback(stdout)
@@ -58,61 +131,158 @@ def detect_camera(output_callback=None, status_callback=None):
     return stdout, stderr
 
 
-def get_camera_settings(shutter_speed_mapping):
+# Config paths read by get_camera_settings()
+SETTINGS_PATHS = {
+    "iso": "/main/imgsettings/iso",
+    "shutter": "/main/capturesettings/shutterspeed",
+    "aperture": "/main/capturesettings/f-number",
+}
+
+SETTINGS_LABELS = {
+    "iso": "ISO",
+    "shutter": "shutter speed",
+    "aperture": "aperture",
+}
+
+# Parsed output of `gphoto2 --get-config`; error is None on success
+ConfigValue = namedtuple(
+    "ConfigValue", ["path", "label", "type", "current", "choices", "readonly", "error"]
+)
+
+
+def parse_config_output(stdout):
+    """
+    Parse the output of one or more `gphoto2 --get-config` calls.
+
+    Args:
+        stdout: Text printed by gphoto2, one block per config entry ending in END
+
+    Returns:
+        List of dictionaries with 'label', 'type', 'current', 'choices' and
+        'readonly' keys, in output order
+    """
+    blocks = []
+    block = None
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line == "END":
+            if block is not None:
+                blocks.append(block)
+            block = None
+            continue
+        key, sep, value = line.partition(": ")
+        if not sep:
+            continue
+        if block is None:
+            block = {"label": None, "type": None, "current": None, "choices": [], "readonly": False}
+        if key == "Label":
+            block["label"] = value
+        elif key == "Type":
+            block["type"] = value
+        elif key == "Current":
+            block["current"] = value.strip()
+        elif key == "Readonly":
+            block["readonly"] = value.strip() == "1"
+        elif key == "Choice":
+            # "Choice: <index> <value>"
+            block["choices"].append(value.split(" ", 1)[-1].strip())
+    return blocks
+
+
+def get_config_values(paths):
+    """
+    Read several camera config entries in a single camera round-trip.
+
+    With a persistent session all entries are read in one session exchange;
+    otherwise a single gphoto2 process is run with one --get-config per path.
+
+    Args:
+        paths: List of config paths, e.g. ["/main/imgsettings/iso", "/main/status/batterylevel"]
+
+    Returns:
+        Dictionary mapping each path to a ConfigValue
+    """
+    paths = list(paths)
+    if not paths:
+        return {}
+    if _session is not None:
+        replies = [
+            (_first_block(stdout), stderr)
+            for stdout, stderr in _session.run_batch([["--get-config", path] for path in paths])
+        ]
+        return _config_values(paths, replies)
+
+    args = []
+    for path in paths:
+        args += ["--get-config", path]
+    stdout, stderr = run_gphoto2(args)
+    blocks = parse_config_output(stdout)
+    if len(blocks) == len(paths) and not stderr:
+        return _config_values(paths, [(block, "") for block in blocks])
+    # Some entry failed, so blocks can no longer be matched to paths by
+    # position; read each path on its own to attribute the error
+    replies = []
+    for path in paths:
+        stdout, stderr = run_gphoto2(["--get-config", path])
+        replies.append((_first_block(stdout), stderr))
+    return _config_values(paths, replies)
+
+
+def _first_block(stdout):
+    blocks = parse_config_output(stdout)
+    return blocks[0] if blocks else None
+
+
+def _config_values(paths, replies):
+    """Build ConfigValue results from (parsed block, stderr) pairs."""
+    values = {}
+    for path, (block, stderr) in zip(paths, replies):
+        if stderr or block is None or block["current"] is None:
+            error = (stderr or "no value returned").strip()
+            values[path] = ConfigValue(path, None, None, None, [], False, error)
+        else:
+            values[path] = ConfigValue(
+                path, block["label"], block["type"], block["current"],
+                block["choices"], block["readonly"], None,
+            )
+    return values
+
+
+@timed("get_camera_settings", error=lambda settings: "; ".join(settings["errors"]))
+def get_camera_settings(shutter_speed_mapping, extra_fields=None):
     """
     Get current camera settings (ISO, shutter speed, aperture).
-    
+
+    All values are read in a single camera round-trip, see get_config_values().
+
     Args:
         shutter_speed_mapping: Dictionary mapping camera values to display values
-    
+        extra_fields: Optional dictionary of additional fields to read in the
+            same round-trip, mapping result key to config path, e.g.
+            {"battery": "/main/status/batterylevel"}
+
     Returns:
-        Dictionary with 'iso', 'shutter', 'aperture' and 'errors' keys
+        Dictionary with 'iso', 'shutter', 'aperture' and 'errors' keys, plus
+        one key per extra field
     """
     settings = {"iso": None, "shutter": None, "aperture": None, "errors": []}
+    fields = dict(SETTINGS_PATHS)
+    for key, path in (extra_fields or {}).items():
+        settings[key] = None
+        fields[key] = path
     
     try:
-        # ISO
-        iso_process = subprocess.Popen(
-            ["gphoto2", "--get-config", "/main/imgsettings/iso"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        iso_stdout, iso_stderr = iso_process.communicate()
-        if iso_stderr:
-            settings["errors"].append(f"Error retrieving ISO: {iso_stderr.strip()}")
-        else:
-            iso_value = iso_stdout.split("Current: ")[1].split("\n")[0].strip()
-            settings["iso"] = iso_value
-
-        # Shutter
-        shutter_process = subprocess.Popen(
-            ["gphoto2", "--get-config", "/main/capturesettings/shutterspeed"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        shutter_stdout, shutter_stderr = shutter_process.communicate()
-        if shutter_stderr:
-            settings["errors"].append(f"Error retrieving shutter speed: {shutter_stderr.strip()}")
-        else:
-            shutter_value = shutter_stdout.split("Current: ")[1].split("\n")[0].strip()
-            display = shutter_speed_mapping.get(shutter_value, shutter_value)
-            settings["shutter"] = {"value": shutter_value, "display": display}
-
-        # Aperture
-        aperture_process = subprocess.Popen(
-            ["gphoto2", "--get-config", "/main/capturesettings/f-number"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        aperture_stdout, aperture_stderr = aperture_process.communicate()
-        if aperture_stderr:
-            settings["errors"].append(f"Error retrieving aperture: {aperture_stderr.strip()}")
-        else:
-            aperture_value = aperture_stdout.split("Current: ")[1].split("\n")[0].strip()
-            settings["aperture"] = aperture_value
+        values = get_config_values(list(fields.values()))
+        for key, path in fields.items():
+            value = values[path]
+            if value.error:
+                label = SETTINGS_LABELS.get(key, key)
+                settings["errors"].append(f"Error retrieving {label}: {value.error}")
+            elif key == "shutter":
+                display = shutter_speed_mapping.get(value.current, value.current)
+                settings["shutter"] = {"value": value.current, "display": display}
+            else:
+                settings[key] = value.current
     except Exception as e:
         settings["errors"].append(f"Error updating camera settings: {str(e)}")
     
@@ -128,13 +298,10 @@ def set_iso(value, status_callback=None, update_callback=None):
         status_callback: Function(status_message, color) to update status
         update_callback: Function to call after setting (to refresh display)
     """
-    p = subprocess.Popen(
-        ["gphoto2", "--set-config", f"/main/imgsettings/iso={value}"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    stdout, stderr = p.communicate()
+    # Timed on its own: the display refresh below is a separate operation
+    with operation("set_iso"):
+        stdout, stderr = run_gphoto2(["--set-config", f"/main/imgsettings/iso={value}"])
+        fail(stderr)
     
     if stderr:
         if status_callback:
@@ -158,13 +325,9 @@ def set_shutter_speed(value, status_callback=None, update_callback=None):
         status_callback: Function(status_message, color) to update status
         update_callback: Function to call after setting (to refresh display)
     """
-    p = subprocess.Popen(
-        ["gphoto2", "--set-config", f"/main/capturesettings/shutterspeed={value}"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    stdout, stderr = p.communicate()
+    with operation("set_shutter_speed"):
+        stdout, stderr = run_gphoto2(["--set-config", f"/main/capturesettings/shutterspeed={value}"])
+        fail(stderr)
     
     if stderr:
         if status_callback:
@@ -188,13 +351,9 @@ def set_aperture(value, status_callback=None, update_callback=None):
         status_callback: Function(status_message, color) to update status
         update_callback: Function to call after setting (to refresh display)
     """
-    p = subprocess.Popen(
-        ["gphoto2", "--set-config", f"/main/capturesettings/f-number={value}"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    stdout, stderr = p.communicate()
+    with operation("set_aperture"):
+        stdout, stderr = run_gphoto2(["--set-config", f"/main/capturesettings/f-number={value}"])
+        fail(stderr)
     
     if stderr:
         if status_callback:
@@ -211,8 +370,12 @@ def set_aperture(value, status_callback=None, update_callback=None):
 
 def kill_camera_processes():
     """Kill processes that might be blocking the camera."""
-    processes_to_kill = ["gphoto2", "PTPCamera"]
     killed = []
+    if simulator_enabled():
+        # Nothing real holds the simulated camera, and a gphoto2 that
+        # another program runs on a real camera must be left alone
+        return killed
+    processes_to_kill = ["gphoto2", "PTPCamera"]
     
     for proc_name in processes_to_kill:
         try:
@@ -231,15 +394,19 @@ def kill_camera_processes():
     return killed
 
 
-def capture_image(save_path, file_extensions, status_callback=None, output_callback=None):
+@timed("capture_image", error=lambda files: "" if files else "no files captured")
+def capture_image(save_path, file_extensions, status_callback=None, output_callback=None,
+                  namer=None):
     """
     Capture image and download from camera.
     
     Args:
         save_path: Directory to save captured images
-        file_extensions: List of file extensions to look for
+        file_extensions: List of known file extensions, used to spell the
+            extension of saved files (e.g. ".JPG" from the camera becomes ".jpg")
         status_callback: Function(status_message, color) to update status
         output_callback: Function(output_text) to display gphoto2 output
+        namer: cam_naming.FileNamer giving the file name (default: module-wide namer)
     
     Returns:
         List of saved file paths, or empty list on error
@@ -247,7 +414,7 @@ def capture_image(save_path, file_extensions, status_callback=None, output_callb
     if status_callback:
         status_callback("Processing, please wait...", "blue")
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    stem = (namer or _default_namer).next_stem(save_path)
     
     if output_callback:
         output_callback("")  # Clear output
@@ -257,30 +424,28 @@ def capture_image(save_path, file_extensions, status_callback=None, output_callb
     retry_delay = 3  # seconds
     
     for attempt in range(max_retries):
-        p = subprocess.Popen(
-            ["gphoto2", "--capture-image-and-download"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-        stdout, stderr = p.communicate()
+        with phase("capture"):
+            if _session is not None:
+                # The shell downloads into its local directory under the camera
+                # file name; moved to save_path under the new name below
+                stdout, stderr = _session.run(
+                    ["--capture-image-and-download"], cwd=staging_dir(save_path)
+                )
+            else:
+                # %C is the file suffix, so RAW+JPEG pairs share the stem
+                stdout, stderr = run_gphoto2([
+                    "--capture-image-and-download",
+                    "--force-overwrite",
+                    "--filename", os.path.join(save_path, f"{stem}.%C"),
+                ])
+        card_changed()
         
         if output_callback:
             output_callback(stdout)
             output_callback(stderr)
         
         # Check for USB claim error (in English or Portuguese)
-        usb_error = (
-            stderr and (
-                "Could not claim" in stderr or 
-                "Não foi possível contactar" in stderr or
-                "Error (-53" in stderr or
-                "Erro (-53" in stderr or
-                "Could not claim the USB device" in stderr
-            )
-        )
-        
-        if usb_error:
+        if is_usb_error(stderr):
             if attempt < max_retries - 1:
                 # Try to kill blocking processes
                 if status_callback:
@@ -289,23 +454,29 @@ def capture_image(save_path, file_extensions, status_callback=None, output_callb
                         "orange"
                     )
                 
-                killed = kill_camera_processes()
+                retry()
+                with phase("retry_wait"):
+                    # The session's own gphoto2 shell is among the processes
+                    # killed below; close it cleanly so it reopens on retry
+                    if _session is not None:
+                        _session.close()
+                    killed = kill_camera_processes()
                 
-                # Try to reset camera connection
-                try:
-                    reset_process = subprocess.Popen(
-                        ["gphoto2", "--reset"],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        timeout=5
-                    )
-                    reset_process.communicate()
-                except:
-                    pass  # Reset failed, continue anyway
+                    # Try to reset camera connection
+                    try:
+                        reset_process = subprocess.Popen(
+                            gphoto2_command() + ["--reset"],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            text=True,
+                            timeout=5
+                        )
+                        reset_process.communicate()
+                    except:
+                        pass  # Reset failed, continue anyway
                 
-                # Wait before retry
-                time.sleep(retry_delay)
+                    # Wait before retry
+                    time.sleep(retry_delay)
                 continue
             else:
                 if status_callback:
@@ -313,23 +484,21 @@ def capture_image(save_path, file_extensions, status_callback=None, output_callb
                         "Error: Camera USB connection failed. Try: 1) Unplug/replug camera 2) Press camera shutter button 3) Close Image Capture/Photos apps 4) Restart application",
                         "red"
                     )
+                fail(stderr)
                 return []
         elif stderr:
             if status_callback:
                 status_callback(f"Error: {stderr.strip()}", "red")
+            fail(stderr)
             return []
         else:
             break  # Success, exit retry loop
     
-    files_renamed = []
     try:
-        for ext in file_extensions:
-            files = glob.glob(f"*{ext}")
-            if files:
-                latest_file = max(files, key=os.path.getctime)
-                new_filename = os.path.join(save_path, f"{timestamp}{ext}")
-                os.rename(latest_file, new_filename)
-                files_renamed.append(new_filename)
+        files_renamed = rename_saved_files(
+            stdout, save_path, stem, file_extensions,
+            download_dir=staging_dir(save_path) if _session is not None else None,
+        )
     except Exception as e:
         if status_callback:
             status_callback(f"Error renaming files: {str(e)}", "red")
@@ -348,24 +517,234 @@ def capture_image(save_path, file_extensions, status_callback=None, output_callb
     return files_renamed
 
 
-def list_files(output_callback=None, status_callback=None):
+def staging_dir(save_path):
+    """
+    Return the directory in save_path that the gphoto2 shell downloads into.
+
+    The shell saves files under their camera names and overwrites existing
+    files, so downloading straight into save_path would replace a file of
+    the same name there (e.g. an IMG_0001.JPG from before a card swap).
+    Files are renamed out of it as soon as they arrive; the empty directory
+    is kept, so the shell's local directory does not change per download.
+    Being inside save_path, the rename stays on one filesystem.
+    """
+    path = os.path.join(save_path, STAGING_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def rename_saved_files(stdout, save_path, stem, file_extensions, download_dir=None):
+    """
+    Give the files gphoto2 downloaded their final name in save_path.
+
+    gphoto2 reports every file it wrote, so there is no need to search
+    for them; they are only renamed.
+
+    Args:
+        stdout: gphoto2 output with "Saving file as" lines
+        save_path: Directory the files are saved to
+        stem: New file name without extension
+        file_extensions: Known extensions, used to spell the new extension
+        download_dir: Directory gphoto2 downloaded the files to, if not
+            save_path (see staging_dir())
+
+    Returns:
+        List of renamed file paths
+    """
+    return rename_files(
+        [os.path.join(download_dir or save_path, saved) for saved in parse_saved_files(stdout)],
+        save_path, stem, file_extensions,
+    )
+
+
+def rename_files(paths, save_path, stem, file_extensions):
+    """
+    Move downloaded files to save_path as stem plus their extension.
+
+    Args:
+        paths: Local paths of the downloaded files
+        save_path: Directory the files are saved to
+        stem: New file name without extension
+        file_extensions: Known extensions, used to spell the new extension
+            (e.g. ".JPG" from the camera becomes ".jpg")
+
+    Returns:
+        List of renamed file paths
+    """
+    files_renamed = []
+    known_extensions = {ext.lower(): ext for ext in file_extensions}
+    with phase("rename"):
+        for path in paths:
+            ext = os.path.splitext(path)[1]
+            new_filename = os.path.join(save_path, f"{stem}{known_extensions.get(ext.lower(), ext)}")
+            if path != new_filename:
+                os.replace(path, new_filename)
+            files_renamed.append(new_filename)
+    return files_renamed
+
+
+def parse_camera_paths(stdout):
+    """
+    Get the camera-side paths of new files from gphoto2 capture output.
+
+    Args:
+        stdout: Output of --capture-image, e.g. containing
+            "New file is in location /store_00010001/DCIM/100CANON/IMG_0001.JPG on the camera"
+
+    Returns:
+        List of camera file paths
+    """
+    paths = []
+    for line in stdout.splitlines():
+        if "New file is in location " in line:
+            path = line.split("New file is in location ", 1)[1]
+            paths.append(path.rsplit(" on the camera", 1)[0].strip())
+    return paths
+
+
+def parse_saved_files(stdout):
+    """
+    Get the local file names gphoto2 wrote from its download output.
+
+    Args:
+        stdout: gphoto2 output containing lines like "Saving file as capt0000.jpg"
+
+    Returns:
+        List of file names, as printed by gphoto2
+    """
+    files = []
+    for line in stdout.splitlines():
+        if "Saving file as " in line:
+            files.append(line.split("Saving file as ", 1)[1].strip())
+    return files
+
+
+@timed("trigger_capture", error=lambda paths: "" if paths else "no picture taken")
+def trigger_capture(status_callback=None, output_callback=None, session=None):
+    """
+    Take a picture and leave it on the camera (card or SDRAM).
+
+    Unlike capture_image(), nothing is transferred, so the next exposure can
+    be triggered while earlier files are downloaded with download_camera_file().
+
+    Args:
+        status_callback: Function(status_message, color) to update status
+        output_callback: Function(output_text) to display gphoto2 output
+        session: GPhotoSession to use (default: the active session, if any)
+
+    Returns:
+        List of camera file paths of the new picture, or empty list on error
+    """
+    with phase("exposure"):
+        if session is not None:
+            stdout, stderr = session.run(["--capture-image"])
+        else:
+            stdout, stderr = run_gphoto2(["--capture-image"])
+    card_changed()
+    
+    if output_callback:
+        output_callback(stdout)
+        output_callback(stderr)
+    
+    if stderr:
+        if status_callback:
+            status_callback(f"Error: {stderr.strip()}", "red")
+        fail(stderr)
+        return []
+    
+    return parse_camera_paths(stdout)
+
+
+@timed("download_camera_file", error=_stderr)
+def download_camera_file(camera_path, dest_dir, session=None, thumbnail=False):
+    """
+    Download one file from the camera into a local directory.
+
+    Uses the gphoto2 shell `get` command, so it needs a persistent session.
+    The file keeps its camera name.
+
+    Args:
+        camera_path: Camera-side path, as returned by trigger_capture()
+        dest_dir: Local directory to save to
+        session: GPhotoSession to use (default: the active session)
+        thumbnail: Download the file's embedded thumbnail instead (a small
+            JPEG named thumb_<name>.jpg)
+
+    Returns:
+        Tuple (local file path or None, stderr)
+    """
+    session = session or _session
+    if session is None:
+        return None, "Error: downloading single files needs a persistent session"
+    
+    dest_dir = os.path.abspath(dest_dir)
+    try:
+        command = "get-thumbnail" if thumbnail else "get"
+        with phase("transfer"):
+            stdout, stderr = session.shell([f"{command} {camera_path}"], cwd=dest_dir)
+    except SessionError as e:
+        return None, f"Error: {e}"
+    saved = parse_saved_files(stdout)
+    if stderr or not saved:
+        return None, stderr or f"Error: {camera_path} was not downloaded"
+    return os.path.join(dest_dir, saved[0]), ""
+
+
+@timed("delete_camera_file", error=lambda stderr: stderr)
+def delete_camera_file(camera_path, session=None):
+    """
+    Delete one file from the camera.
+
+    Uses the gphoto2 shell `delete` command, so it needs a persistent session.
+
+    Args:
+        camera_path: Camera-side path of the file
+        session: GPhotoSession to use (default: the active session)
+
+    Returns:
+        stderr, empty on success
+    """
+    session = session or _session
+    if session is None:
+        return "Error: deleting single files needs a persistent session"
+    
+    try:
+        _, stderr = session.shell([f"delete {camera_path}"])
+    except SessionError as e:
+        return f"Error: {e}"
+    finally:
+        card_changed()
+    return stderr
+
+
+@timed("list_files", error=_stderr)
+def list_files(output_callback=None, status_callback=None, cancel_event=None,
+               progress_callback=None):
     """
     List files on camera.
     
     Args:
         output_callback: Function to call with output text
         status_callback: Function(status_message, color) to update status
+        cancel_event: Optional threading.Event that aborts the listing
+        progress_callback: Optional function(files_listed) called as the
+            listing comes in
     """
     if output_callback:
         output_callback("")  # Clear output
     
-    p = subprocess.Popen(
-        ["gphoto2", "--list-files"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
+    listed = [0]
+    
+    def line_cb(line):
+        if line.startswith("#"):
+            listed[0] += 1
+            if progress_callback:
+                progress_callback(listed[0])
+    
+    stdout, stderr = run_gphoto2(
+        ["--list-files"], cancel_event=cancel_event,
+        line_callback=line_cb if progress_callback else None,
     )
-    stdout, stderr = p.communicate()
     
     if output_callback:
         output_callback(stdout)
@@ -378,24 +757,39 @@ def list_files(output_callback=None, status_callback=None):
     return stdout, stderr
 
 
-def download_files(output_callback=None, status_callback=None):
+@timed("download_files", error=_stderr)
+def download_files(output_callback=None, status_callback=None, cancel_event=None,
+                   progress_callback=None, save_path=None):
     """
     Download all files from camera.
     
+    Every call transfers the whole card; see cam_sync.sync_camera() for an
+    incremental copy.
+    
     Args:
         output_callback: Function to call with output text
         status_callback: Function(status_message, color) to update status
+        cancel_event: Optional threading.Event that aborts the download
+        progress_callback: Optional function(files_downloaded) called after
+            each file
+        save_path: Directory to download into (default: current directory)
     """
     if output_callback:
         output_callback("")  # Clear output
     
-    p = subprocess.Popen(
-        ["gphoto2", "--get-all-files"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        text=True,
-    )
-    stdout, stderr = p.communicate()
+    downloaded = [0]
+    
+    def line_cb(line):
+        if "Saving file as " in line:
+            downloaded[0] += 1
+            if progress_callback:
+                progress_callback(downloaded[0])
+    
+    with phase("transfer"):
+        stdout, stderr = run_gphoto2(
+            ["--get-all-files"], cwd=save_path, cancel_event=cancel_event,
+            line_callback=line_cb if progress_callback else None,
+        )
     
     if output_callback:
         output_callback(stdout)
@@ -409,4 +803,3 @@ def download_files(output_callback=None, status_callback=None):
             status_callback("all files downloaded", "green")
     
     return stdout, stderr
-
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Pipelined capture and download for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Capture pipeline: trigger exposures while earlier frames download."""
+
+import queue
+import threading
+import time
+
+from cam_metrics import operation
+from cam_ops import (
+    get_session, trigger_capture, download_camera_file, rename_files, staging_dir,
+)
+from cam_naming import FileNamer
+from cam_session import GPhotoSession
+
+
+def percentile(values, pct):
+    """Return the pct percentile (0-100) of values by nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+
+
+class StageStats:
+    """Collects per-stage durations and summarizes them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.durations.setdefault(stage, []).append(seconds)
+
+    def summary(self):
+        """
+        Returns:
+            Dictionary mapping stage name to a dictionary with 'count',
+            'mean', 'min', 'p50', 'p95' and 'max' in seconds
+        """
+        with self._lock:
+            result = {}
+            for stage, values in self.durations.items():
+                result[stage] = {
+                    "count": len(values),
+                    "mean": sum(values) / len(values),
+                    "min": min(values),
+                    "p50": percentile(values, 50),
+                    "p95": percentile(values, 95),
+                    "max": max(values),
+                }
+            return result
+
+    def format(self):
+        """Return the summary as readable lines, one per stage."""
+        lines = []
+        for stage, s in self.summary().items():
+            lines.append(
+                f"{stage:<10} n={s['count']:<4} mean={s['mean'] * 1000:8.1f}ms "
+                f"p50={s['p50'] * 1000:8.1f}ms p95={s['p95'] * 1000:8.1f}ms "
+                f"max={s['max'] * 1000:8.1f}ms"
+            )
+        return "\n".join(lines)
+
+
+class CapturePipeline:
+    """
+    Two-stage capture: the caller triggers exposures, a background thread
+    downloads and files away the results.
+
+    Exposures are left on the camera by trigger_capture() and their camera
+    paths go through a bounded queue to the download thread. Both stages
+    share one gphoto2 session, whose lock serializes USB commands: a
+    download runs whenever the camera is not busy taking the next picture
+    (e.g. while the intervalometer waits), and a full queue makes capture()
+    block until the downloader catches up.
+
+    Stages timed in `stats`: trigger (exposure until the camera reports the
+    file), queue (waiting for the downloader), download (USB transfer) and
+    file (moving to the final name).
+    """
+
+    def __init__(self, save_path, queue_size=4, session=None, namer=None, file_extensions=(),
+                 status_callback=None, output_callback=None, saved_callback=None):
+        """
+        Args:
+            save_path: Directory to save downloaded images
+            queue_size: Frames that may wait for download before capture() blocks
+            session: GPhotoSession to use (default: the active session, or a
+                private one if none is active)
+            namer: cam_naming.FileNamer giving the file names
+            file_extensions: Known extensions, used to spell saved file names
+            status_callback: Function(status_message, color) to update status
+            output_callback: Function(output_text) to display gphoto2 output
+            saved_callback: Optional function(paths) called on the download
+                thread with the saved files of each frame
+        """
+        self.save_path = save_path
+        self.status_callback = status_callback
+        self.output_callback = output_callback
+        self.saved_callback = saved_callback
+        self.namer = namer or FileNamer()
+        self.file_extensions = file_extensions
+        self.session = session or get_session()
+        self._own_session = self.session is None
+        if self._own_session:
+            self.session = GPhotoSession()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = StageStats()
+        self.saved_files = []
+        self.errors = []
+        self._thread = None
+        self._downloads_allowed = threading.Event()
+        self._downloads_allowed.set()
+
+    def start(self):
+        """Start the download thread."""
+        self._thread = threading.Thread(target=self._download_worker, daemon=True)
+        self._thread.start()
+
+    def pause_downloads(self):
+        """Hold queued downloads so triggers get the USB link to themselves."""
+        self._downloads_allowed.clear()
+
+    def resume_downloads(self):
+        """Let the download thread continue."""
+        self._downloads_allowed.set()
+
+    def capture(self):
+        """
+        Trigger one exposure and queue its files for download.
+
+        Returns:
+            List of camera file paths, or empty list on error
+        """
+        stem = self.namer.next_stem(self.save_path)
+        started = time.monotonic()
+        camera_paths = trigger_capture(
+            self.status_callback, self.output_callback, session=self.session
+        )
+        self.stats.add("trigger", time.monotonic() - started)
+        if camera_paths and not self._put((stem, camera_paths, time.monotonic())):
+            error = "the download thread has stopped; frame left on the camera"
+            self.errors.append(error)
+            if self.status_callback:
+                self.status_callback(f"Error: {error}", "red")
+        return camera_paths
+
+    def stop(self):
+        """
+        Wait for all queued frames to be downloaded and stop the thread.
+
+        Returns:
+            List of saved file paths
+        """
+        if self._thread is not None:
+            self.resume_downloads()
+            self._put(None)
+            self._thread.join()
+            self._thread = None
+        if self._own_session:
+            self.session.close()
+        return self.saved_files
+
+    def _put(self, item):
+        """
+        Queue an item for the download thread, waiting while the queue is full.
+
+        Returns:
+            False if the download thread is no longer running
+        """
+        while self._thread is None or self._thread.is_alive():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _download_worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._download_frame(*item)
+            except Exception as e:
+                # One bad frame must not stop the downloads of the next ones
+                self.errors.append(str(e))
+                if self.status_callback:
+                    self.status_callback(f"Error saving frame {item[0]}: {e}", "red")
+
+    def _download_frame(self, stem, camera_paths, queued):
+        self._downloads_allowed.wait()
+        self.stats.add("queue", time.monotonic() - queued)
+        frame_files = []
+        for camera_path in camera_paths:
+            with operation("pipeline_download") as op:
+                started = time.monotonic()
+                # Downloaded under its camera name, so not straight into
+                # save_path, where it could replace a file of that name
+                local_path, stderr = download_camera_file(
+                    camera_path, staging_dir(self.save_path), self.session
+                )
+                self.stats.add("download", time.monotonic() - started)
+                if not local_path:
+                    op.fail(stderr)
+                    self.errors.append(stderr)
+                    if self.status_callback:
+                        self.status_callback(f"Error downloading {camera_path}: {stderr.strip()}", "red")
+                    continue
+
+                started = time.monotonic()
+                try:
+                    [dest_path] = rename_files(
+                        [local_path], self.save_path, stem, self.file_extensions
+                    )
+                except OSError as e:
+                    op.fail(e)
+                    self.errors.append(str(e))
+                    if self.status_callback:
+                        self.status_callback(f"Error saving {camera_path}: {e}", "red")
+                    continue
+                self.stats.add("file", time.monotonic() - started)
+            self.saved_files.append(dest_path)
+            frame_files.append(dest_path)
+            if self.status_callback:
+                self.status_callback(f"Image saved: {dest_path}", "green")
+        if frame_files and self.saved_callback:
+            self.saved_callback(frame_files)
+
+
+def burst_capture(count, save_path, session=None, namer=None, file_extensions=(),
+                  status_callback=None, output_callback=None, cancel_event=None):
+    """
+    Take count frames back to back as fast as the camera and USB link allow.
+
+    Frames are triggered one after another over a single session and stay
+    on the camera. Downloads run asynchronously on a CapturePipeline; they
+    are held while the burst runs, so no transfer delays a trigger, and
+    drained after the last frame.
+
+    Args:
+        count: Number of frames
+        save_path: Directory to save downloaded images
+        session: GPhotoSession to use (default: the active session)
+        namer: cam_naming.FileNamer giving the file names
+        file_extensions: Known extensions, used to spell saved file names
+        status_callback: Function(status_message, color) to update status
+        output_callback: Function(output_text) to display gphoto2 output
+        cancel_event: Optional threading.Event that stops the burst early;
+            frames already taken are still downloaded
+
+    Returns:
+        Dictionary with 'frames' (frames triggered), 'seconds' (first trigger
+        to last frame reported), 'fps', 'latency' (trigger latency summary,
+        see StageStats.summary), 'files' (saved paths) and 'stats' (the
+        pipeline's StageStats)
+    """
+    # Queue sized for the whole burst so triggering never waits for USB transfers
+    pipeline = CapturePipeline(
+        save_path, queue_size=max(count, 1), session=session, namer=namer,
+        file_extensions=file_extensions, status_callback=status_callback, output_callback=output_callback,
+    )
+    pipeline.pause_downloads()
+    pipeline.start()
+    frames = 0
+    started = time.monotonic()
+    for index in range(count):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        if status_callback:
+            status_callback(f"Burst: frame {index + 1}/{count}", "blue")
+        if not pipeline.capture():
+            break
+        frames += 1
+    seconds = time.monotonic() - started
+
+    if status_callback:
+        status_callback(f"Burst: downloading {frames} frame(s)...", "blue")
+    files = pipeline.stop()
+    return {
+        "frames": frames,
+        "seconds": seconds,
+        "fps": frames / seconds if seconds > 0 else 0.0,
+        "latency": pipeline.stats.summary().get("trigger"),
+        "files": files,
+        "stats": pipeline.stats,
+    }
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Time-lapse video rendering for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module uses the ffmpeg command-line tool to encode video.
+# For more information, visit: https://ffmpeg.org/
+
+"""Time-lapse video from captured stills, streamed to ffmpeg frame by frame."""
+
+import os
+import subprocess
+import threading
+import time
+from collections import deque, namedtuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # ffmpeg decodes and scales the JPEGs itself
+    Image = ImageOps = None
+
+from cam_exposure import JPEG_EXTENSIONS
+
+# output: video file; error: message or ""
+RenderStats = namedtuple(
+    "RenderStats", ["frames", "skipped", "seconds", "fps", "output", "error"]
+)
+
+
+def jpeg_complete(path):
+    """Return True if a JPEG file ends with its end-of-image marker."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            # Some cameras pad the file after the marker
+            return b"\xff\xd9" in f.read().rstrip(b"\x00")
+    except OSError:
+        return False
+
+
+def iter_frames(directory, extensions=JPEG_EXTENSIONS, since=None, follow_event=None, poll=1.0):
+    """
+    Yield the images in a directory in capture order.
+
+    Files are ordered by modification time, then name. Each file yielded
+    is remembered by inode and mtime rather than by name, and a rename
+    keeps both, so a capture is never yielded twice and a final name that
+    sorts before frames already yielded is not skipped. When following,
+    a file is only taken once two polls in a row saw it under the same
+    name, so captures are not yielded under the download name they have
+    until they are renamed. Subdirectories are not searched.
+
+    Args:
+        directory: Directory the frames are saved to
+        extensions: Extensions of the frames
+        since: Optional time.time() value; older files are left out
+        follow_event: Optional threading.Event. If given, keep polling for
+            new files until it is set, then yield the remaining ones and
+            stop (for rendering while capturing)
+        poll: Seconds between polls when following
+
+    Yields:
+        File paths
+    """
+    since = since or 0.0
+    seen = set()
+    # Files found by the last poll but not yet yielded, identity -> name
+    pending = {}
+    while True:
+        # Read the flag before listing, so files saved just before it was
+        # set are still picked up by this last pass
+        finished = follow_event is None or follow_event.is_set()
+        entries = []
+        try:
+            for entry in os.scandir(directory):
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    identity = (entry.inode(), stat.st_mtime_ns)
+                except OSError:
+                    # Renamed or deleted since the directory was listed
+                    continue
+                if stat.st_mtime >= since and identity not in seen:
+                    entries.append((stat.st_mtime, entry.name, identity))
+        except OSError:
+            pass
+        previous, pending = pending, {}
+        held = False
+        for mtime, name, identity in sorted(entries):
+            path = os.path.join(directory, name)
+            if not finished:
+                # A file still being written or renamed, and every file
+                # after it, is picked up by a later poll
+                held = held or previous.get(identity) != name or (
+                    name.lower().endswith(JPEG_EXTENSIONS) and not jpeg_complete(path)
+                )
+                if held:
+                    pending[identity] = name
+                    continue
+            seen.add(identity)
+            yield path
+        if finished:
+            return
+        follow_event.wait(poll)
+
+
+def even_size(size):
+    """Round a (width, height) down to even numbers, as yuv420p video needs."""
+    return (max(2, int(size[0]) // 2 * 2), max(2, int(size[1]) // 2 * 2))
+
+
+def load_video_frame(path, size):
+    """
+    Decode a JPEG at video size and letterbox it to exactly size.
+
+    Returns:
+        RGB bytes of size[0] x size[1] pixels
+    """
+    with Image.open(path) as image:
+        # Let the JPEG decoder skip straight to about the video size
+        image.draft("RGB", size)
+        image = ImageOps.pad(image.convert("RGB"), size, color=(0, 0, 0))
+        return image.tobytes()
+
+
+class TimeLapseRenderer:
+    """
+    Encodes a sequence of stills into a video with ffmpeg.
+
+    Frames are decoded, scaled and written to ffmpeg's stdin one at a time,
+    so memory stays at about one frame and the pipe buffer however long
+    the sequence. With Pillow the JPEGs are decoded at reduced size
+    (draft mode), which is much faster than decoding them at full size;
+    without it the JPEG files are piped to ffmpeg as they are and scaled
+    there.
+    """
+
+    def __init__(self, output_path, fps=24, size=(1920, 1080), ffmpeg="ffmpeg", crf=20):
+        """
+        Args:
+            output_path: Video file to write (.mp4)
+            fps: Frames per second of the video
+            size: (width, height) of the video
+            ffmpeg: ffmpeg executable
+            crf: x264 quality, lower is better (18-28 is usual)
+        """
+        self.output_path = output_path
+        self.fps = fps
+        self.size = even_size(size)
+        self.ffmpeg = ffmpeg
+        self.crf = crf
+
+    def command(self):
+        """Return the ffmpeg command line."""
+        width, height = self.size
+        if Image is not None:
+            source = [
+                "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+                "-r", str(self.fps), "-i", "-",
+            ]
+            scale = []
+        else:
+            source = ["-f", "image2pipe", "-c:v", "mjpeg", "-r", str(self.fps), "-i", "-"]
+            scale = [
+                "-vf",
+                f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+            ]
+        return (
+            [self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y"]
+            + source + scale
+            + ["-c:v", "libx264", "-preset", "medium", "-crf", str(self.crf),
+               "-pix_fmt", "yuv420p", self.output_path]
+        )
+
+    def render(self, frames, cancel_event=None, progress_callback=None):
+        """
+        Encode frames into the video.
+
+        Args:
+            frames: Iterable of image paths in order, e.g. iter_frames()
+            cancel_event: Optional threading.Event; the video is finished
+                with the frames encoded so far
+            progress_callback: Optional function(frames encoded, path)
+
+        Returns:
+            RenderStats
+        """
+        started = time.monotonic()
+        try:
+            process = subprocess.Popen(
+                self.command(), stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            return RenderStats(0, 0, 0.0, 0.0, None, f"cannot run {self.ffmpeg}: {e}")
+
+        # ffmpeg must not block on a full stderr pipe; keep its last lines
+        errors = deque(maxlen=20)
+        reader = threading.Thread(
+            target=lambda: errors.extend(
+                line.decode("utf-8", "replace").rstrip() for line in process.stderr
+            ),
+            name="ffmpeg-stderr", daemon=True,
+        )
+        reader.start()
+
+        count = skipped = 0
+        error = ""
+        try:
+            for path in frames:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                try:
+                    if Image is not None:
+                        data = load_video_frame(path, self.size)
+                    else:
+                        with open(path, "rb") as f:
+                            data = f.read()
+                except OSError:
+                    skipped += 1
+                    continue
+                # Blocks while ffmpeg is busy, which is what bounds memory
+                process.stdin.write(data)
+                count += 1
+                if progress_callback:
+                    progress_callback(count, path)
+        except BrokenPipeError:
+            error = "ffmpeg stopped"
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+            process.wait()
+            reader.join(timeout=5)
+
+        seconds = time.monotonic() - started
+        if process.returncode != 0:
+            error = " ".join(errors) or error or f"ffmpeg exited with code {process.returncode}"
+        elif count == 0:
+            error = "no frames to render"
+        output = None if error else self.output_path
+        return RenderStats(count, skipped, seconds, count / seconds if seconds else 0.0, output, error)
+
+
+def format_stats(stats):
+    """Return a log line describing a RenderStats."""
+    if stats.error:
+        return f"Render failed after {stats.frames} frame(s): {stats.error}"
+    return (
+        f"Rendered {stats.frames} frame(s) ({stats.skipped} skipped) in {stats.seconds:.1f}s "
+        f"({stats.fps:.1f} frames/s) to {stats.output}"
+    )
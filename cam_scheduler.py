@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Intervalometer scheduling for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Fixed-cadence frame scheduler built on monotonic clock deadlines."""
+
+import time
+from collections import namedtuple
+from datetime import datetime
+
+# What to do when a frame takes longer than the interval:
+#   skip     - drop the missed slots and wait for the next slot on the grid
+#   catch_up - fire the missed slots back to back until back on the grid
+#   stretch  - fire the next frame immediately and restart the grid from it
+OVERRUN_POLICIES = ("skip", "catch_up", "stretch")
+
+# Timing of one frame. planned/started/finished are seconds since the start
+# of the sequence on the monotonic clock; wall_time is the datetime at start.
+FrameTiming = namedtuple(
+    "FrameTiming", ["index", "planned", "started", "finished", "wall_time", "overrun", "skipped"]
+)
+
+
+class IntervalScheduler:
+    """
+    Runs an action at a fixed cadence, independent of how long it takes.
+
+    Frame deadlines are computed from the sequence start on a monotonic
+    clock (start + n * interval), so capture, download and rename time do
+    not add up into drift the way capture-then-sleep does.
+    """
+
+    def __init__(self, interval, count, policy="skip", log_callback=None,
+                 clock=time.monotonic):
+        """
+        Args:
+            interval: Seconds between the starts of consecutive frames
+            count: Number of frames to take
+            policy: Overrun policy, one of OVERRUN_POLICIES
+            log_callback: Function(message) called with one line per frame
+                and per overrun
+            clock: Monotonic clock function, replaceable for testing
+        """
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy: {policy}")
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self.interval = float(interval)
+        self.count = int(count)
+        self.policy = policy
+        self.log_callback = log_callback
+        self.clock = clock
+        self.timings = []
+        self.overruns = 0
+
+    def run(self, action, stop_event=None):
+        """
+        Run the sequence, blocking until it finishes or is stopped.
+
+        Args:
+            action: Function(frame_index) taking one frame; returning False
+                ends the sequence early (e.g. on a camera error)
+            stop_event: Optional threading.Event that aborts the wait between frames
+
+        Returns:
+            List of FrameTiming, one per frame taken
+        """
+        self.timings = []
+        self.overruns = 0
+        origin = self.clock()
+        start = origin  # Grid anchor; moves only with the stretch policy
+        slot = 0  # Grid slot of the next frame
+        skipped = 0
+
+        for index in range(self.count):
+            planned = start + slot * self.interval
+            if not self._wait_until(planned, stop_event):
+                break
+
+            started = self.clock()
+            wall_time = datetime.now()
+            keep_going = action(index)
+            finished = self.clock()
+
+            next_planned = start + (slot + 1) * self.interval
+            overrun = finished > next_planned
+            timing = FrameTiming(
+                index, planned - origin, started - origin, finished - origin,
+                wall_time, overrun, skipped,
+            )
+            self.timings.append(timing)
+            self._log(
+                f"Frame {index + 1}/{self.count}: planned +{timing.planned:.3f}s, "
+                f"started +{timing.started:.3f}s (late {timing.started - timing.planned:+.3f}s), "
+                f"took {finished - started:.3f}s at {wall_time.strftime('%H:%M:%S.%f')[:-3]}"
+            )
+
+            if keep_going is False:
+                break
+
+            skipped = 0
+            if not overrun:
+                slot += 1
+                continue
+
+            self.overruns += 1
+            late = finished - next_planned
+            if self.policy == "skip":
+                # Next slot on the grid that is still in the future
+                next_slot = int((finished - start) // self.interval) + 1
+                skipped = next_slot - slot - 1
+                slot = next_slot
+                detail = f"skipping {skipped} slot(s)"
+            elif self.policy == "catch_up":
+                slot += 1
+                detail = "catching up"
+            else:
+                start = finished
+                slot = 0
+                detail = "stretching cadence"
+            self._log(
+                f"Overrun on frame {index + 1}: finished {late:.3f}s after the next "
+                f"frame was due ({self.interval:.3f}s interval); {detail}"
+            )
+
+        return self.timings
+
+    def _wait_until(self, deadline, stop_event):
+        """Sleep until the deadline; return False if stop_event was set."""
+        while True:
+            remaining = deadline - self.clock()
+            if stop_event is not None and stop_event.is_set():
+                return False
+            if remaining <= 0:
+                return True
+            if stop_event is not None:
+                if stop_event.wait(remaining):
+                    return False
+            else:
+                time.sleep(remaining)
+
+    def _log(self, message):
+        if self.log_callback:
+            self.log_callback(message)
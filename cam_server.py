@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# HTTP and WebSocket control API for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""
+Control a camera over the network, e.g. a rig on a Raspberry Pi in the field.
+
+A small asyncio HTTP server (standard library only) with a JSON API:
+
+    GET    /api/settings              ISO, shutter speed and aperture
+    POST   /api/settings              {"iso": "800", "shutter": "1/125", "aperture": "5.6"}
+    POST   /api/capture               {"count": 1}; returns the saved files
+    GET    /api/intervalometer        {"running": ..., "frames_taken": ...}
+    POST   /api/intervalometer        {"interval": 30, "frames": 600, "bulb": null,
+                                       "pipelined": null, "policy": null}
+    DELETE /api/intervalometer        stop after the current frame
+    GET    /api/files                 files on the camera card
+    GET    /api/files/download?path=  one camera file (&thumbnail=1 for its thumbnail)
+    GET    /captures/<name>           a saved capture
+    GET    /api/events                WebSocket of status, output and saved-file events
+
+Events are pushed to every WebSocket client as JSON text messages, e.g.
+{"type": "status", "message": "...", "color": "green", "time": ...}. Each
+client has a bounded queue: when a client reads too slowly its oldest
+events are dropped (and a {"type": "dropped", "count": n} event tells it
+so), so a slow or stalled client never holds up the camera.
+
+Camera commands run one at a time on a worker thread; while the
+intervalometer runs, other camera commands get 409 Conflict.
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import mimetypes
+import os
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from cam_cli import HeadlessCamera
+from cam_config import load_config, apply_simulator_config, apply_metrics_config
+from cam_files import list_camera_files, camera_path
+from cam_ops import get_camera_settings, download_camera_file, set_session, get_session
+from cam_scheduler import OVERRUN_POLICIES
+from cam_session import GPhotoSession, SessionError
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Events kept for each WebSocket client that has not read them yet
+EVENT_QUEUE_SIZE = 256
+
+# Largest request head, request body and incoming WebSocket message
+MAX_HEAD = 16 * 1024
+MAX_BODY = 64 * 1024
+
+# Bytes read from disk at a time when sending a file
+FILE_CHUNK = 256 * 1024
+
+# WebSocket opcodes
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+# Returned by a request handler to send a file; remove_dir, if set, is a
+# temporary directory deleted once it has been sent
+FileReply = namedtuple("FileReply", ["path", "remove_dir"])
+
+
+class HTTPError(Exception):
+    """Ends a request with an error status and a JSON {"error": message}."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class CameraBusy(Exception):
+    """A camera command was refused because the intervalometer runs."""
+
+
+class ServerCamera(HeadlessCamera):
+    """HeadlessCamera that also publishes its callbacks as events."""
+
+    def __init__(self, config, save_path, publish, verbose=False):
+        """
+        Args:
+            config: Configuration dictionary from load_config()
+            save_path: Directory captures are saved to
+            publish: Thread-safe function(event dictionary)
+            verbose: Also print the gphoto2 output
+        """
+        self.publish = publish
+        super().__init__(config, save_path, verbose)
+
+    def status(self, message, color=None):
+        super().status(message, color)
+        if message:
+            self.publish({"type": "status", "message": message, "color": color})
+
+    def output(self, text):
+        super().output(text)
+        if text and text.strip():
+            self.publish({"type": "output", "text": text})
+
+    def saved(self, files):
+        if files:
+            self.publish({
+                "type": "saved",
+                "files": [os.path.relpath(path, self.save_path) for path in files],
+            })
+
+    def intervalometer(self, interval, frames, **kwargs):
+        self.publish({"type": "intervalometer", "state": "started", "interval": interval, "frames": frames})
+        try:
+            return super().intervalometer(interval, frames, **kwargs)
+        finally:
+            self.publish({
+                "type": "intervalometer",
+                "state": "stopped" if self.stop_event.is_set() else "finished",
+                "frames_taken": self.frames_taken,
+            })
+
+
+class EventClient:
+    """One WebSocket client: a bounded queue of events not sent yet."""
+
+    def __init__(self, size=EVENT_QUEUE_SIZE):
+        self.queue = asyncio.Queue(size)
+        self.dropped = 0
+
+    def put(self, event):
+        """Queue an event, dropping the oldest one if the client is behind."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+def websocket_frame(payload, opcode=OP_TEXT):
+    """Return a final, unmasked WebSocket frame (server to client)."""
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+
+async def read_websocket_frame(reader):
+    """
+    Read one WebSocket frame from a client.
+
+    Returns:
+        Tuple (opcode, unmasked payload)
+
+    Raises:
+        HTTPError: If the frame is larger than MAX_BODY
+    """
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    if length > MAX_BODY:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "message too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return first & 0x0F, payload
+
+
+def _text_field(body, name):
+    """Return an optional string field of a request body, checked for shell safety."""
+    value = body.get(name)
+    if value is None or value == "":
+        return None
+    value = str(value)
+    if any(c in value for c in "\r\n\0") or len(value) > 255:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"invalid {name}")
+    return value
+
+
+def _number_field(body, name, kind, required=False, minimum=None):
+    value = body.get(name)
+    if value is None:
+        if required:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} is required")
+        return None
+    try:
+        value = kind(value)
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be a number")
+    if minimum is not None and value < minimum:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be at least {minimum}")
+    return value
+
+
+class ControlServer:
+    """
+    The HTTP and WebSocket server around one ServerCamera.
+
+    Camera callbacks may come from any thread; publish() hands them to the
+    event loop, which copies them into each client's queue without waiting.
+    """
+
+    def __init__(self, config, save_path, token=None, verbose=False):
+        """
+        Args:
+            config: Configuration dictionary from load_config()
+            save_path: Directory captures are saved to and served from
+            token: If set, every request must carry it, as an
+                "Authorization: Bearer <token>" header or a ?token= parameter
+            verbose: Also print the gphoto2 output
+        """
+        self.save_path = save_path
+        self.token = token
+        self.camera = ServerCamera(config, save_path, self.publish, verbose)
+        self.clients = set()
+        # Open WebSocket connections: {task: writer}
+        self._event_connections = {}
+        self.loop = None
+        # Camera commands from requests run here, one at a time
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="camera")
+        self.routes = {
+            ("GET", "/api/settings"): self.get_settings,
+            ("POST", "/api/settings"): self.set_settings,
+            ("POST", "/api/capture"): self.capture,
+            ("GET", "/api/intervalometer"): self.intervalometer_state,
+            ("POST", "/api/intervalometer"): self.start_intervalometer,
+            ("DELETE", "/api/intervalometer"): self.stop_intervalometer,
+            ("GET", "/api/files"): self.list_files,
+            ("GET", "/api/files/download"): self.download_file,
+        }
+
+    def publish(self, event):
+        """Send an event to every WebSocket client; callable from any thread."""
+        event.setdefault("time", time.time())
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._broadcast, event)
+
+    def _broadcast(self, event):
+        for client in self.clients:
+            client.put(event)
+
+    async def serve(self, host, port, stop_event=None):
+        """
+        Serve until stop_event is set (default: forever).
+
+        Raises:
+            OSError: If the port cannot be bound
+        """
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEAD)
+        self.camera.status(f"Serving the camera on http://{host}:{port}/", "green")
+        try:
+            async with server:
+                if stop_event is None:
+                    await server.serve_forever()
+                else:
+                    await stop_event.wait()
+        finally:
+            # Let the WebSocket handlers end on their own rather than be
+            # cancelled; abort, as a stalled client would never take the rest
+            for writer in self._event_connections.values():
+                writer.transport.abort()
+            if self._event_connections:
+                await asyncio.wait(list(self._event_connections), timeout=5)
+            # Finish the current frame before the session is closed
+            self.camera.stop(wait=False)
+            await self.loop.run_in_executor(None, self.camera.wait)
+            self.executor.shutdown(wait=True)
+
+    async def run_camera(self, function, *args, **kwargs):
+        """Run a camera command on the camera thread and return its result."""
+        def call():
+            if self.camera.busy():
+                raise CameraBusy()
+            return function(*args, **kwargs)
+
+        try:
+            return await self.loop.run_in_executor(self.executor, call)
+        except CameraBusy:
+            raise HTTPError(HTTPStatus.CONFLICT, "the intervalometer is running; stop it first")
+        except SessionError as e:
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, str(e))
+
+    async def handle_connection(self, reader, writer):
+        """Serve one request; the connection is closed afterwards."""
+        try:
+            try:
+                method, path, query, headers = await self._read_head(reader)
+                self._check_token(query, headers)
+                if path == "/api/events":
+                    await self.serve_events(reader, writer, headers)
+                    return
+                if method == "GET" and path.startswith("/captures/"):
+                    await self.send_capture(writer, unquote(path[len("/captures/"):]))
+                    return
+                handler = self.routes.get((method, path))
+                if handler is None:
+                    if any(route_path == path for _, route_path in self.routes):
+                        raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} not allowed on {path}")
+                    raise HTTPError(HTTPStatus.NOT_FOUND, f"no such endpoint {path}")
+                body = await self._read_body(reader, headers)
+                status, result = await handler(query, body)
+                if isinstance(result, FileReply):
+                    await self.send_file(writer, result.path, result.remove_dir)
+                else:
+                    await self._send_json(writer, status, result)
+            except HTTPError as e:
+                await self._send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_head(self, reader):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "request head too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return method.upper(), url.path, query, headers
+
+    async def _read_body(self, reader, headers):
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length")
+        if length > MAX_BODY:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "request body too large")
+        if not length:
+            return {}
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "the body must be JSON")
+        if not isinstance(body, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "the body must be a JSON object")
+        return body
+
+    def _check_token(self, query, headers):
+        if not self.token:
+            return
+        supplied = query.get("token", "")
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            supplied = authorization[7:].strip()
+        if not hmac.compare_digest(supplied.encode(), self.token.encode()):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "missing or wrong token")
+
+    async def _send_json(self, writer, status, data):
+        body = json.dumps(data).encode()
+        writer.write(self._head(status, "application/json", len(body)) + body)
+        await writer.drain()
+
+    def _head(self, status, content_type, length, extra=""):
+        status = HTTPStatus(status)
+        return (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\nContent-Length: {length}\r\n"
+            f"{extra}Connection: close\r\n\r\n"
+        ).encode("latin-1")
+
+    async def send_file(self, writer, path, remove_dir=None):
+        """Send a file in chunks, reading it off the event loop."""
+        try:
+            f = open(path, "rb")
+        except OSError:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "file not found")
+        try:
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                name = os.path.basename(path).replace('"', "")
+                writer.write(self._head(
+                    HTTPStatus.OK, content_type, size,
+                    f'Content-Disposition: attachment; filename="{name}"\r\n',
+                ))
+                while True:
+                    chunk = await self.loop.run_in_executor(None, f.read, FILE_CHUNK)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+        finally:
+            if remove_dir:
+                shutil.rmtree(remove_dir, ignore_errors=True)
+
+    async def send_capture(self, writer, name):
+        """Send a file from the save path; names outside it are refused."""
+        root = os.path.realpath(self.save_path)
+        path = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            raise HTTPError(HTTPStatus.NOT_FOUND, "file not found")
+        await self.send_file(writer, path)
+
+    async def serve_events(self, reader, writer, headers):
+        """Upgrade to a WebSocket and push events until the client leaves."""
+        key = headers.get("sec-websocket-key")
+        if headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "expected a WebSocket upgrade")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        await writer.drain()
+
+        client = EventClient()
+        client.put({
+            "type": "hello", "time": time.time(), "running": self.camera.busy(),
+            "frames_taken": self.camera.frames_taken,
+        })
+        self.clients.add(client)
+        self._event_connections[asyncio.current_task()] = writer
+        sender = asyncio.create_task(self._send_events(client, writer))
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                # Single writes, so they cannot split a frame of the sender
+                if opcode == OP_CLOSE:
+                    writer.write(websocket_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    writer.write(websocket_frame(payload, OP_PONG))
+                # Messages from the client are not used
+        except HTTPError:
+            writer.write(websocket_frame(struct.pack("!H", 1009), OP_CLOSE))
+        finally:
+            self.clients.discard(client)
+            self._event_connections.pop(asyncio.current_task(), None)
+            sender.cancel()
+
+    async def _send_events(self, client, writer):
+        try:
+            while True:
+                event = await client.queue.get()
+                if client.dropped:
+                    dropped, client.dropped = client.dropped, 0
+                    writer.write(websocket_frame(json.dumps({"type": "dropped", "count": dropped}).encode()))
+                writer.write(websocket_frame(json.dumps(event).encode()))
+                # Only this client waits on a slow connection; events for
+                # it pile up in its bounded queue meanwhile
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def get_settings(self, query, body):
+        settings = await self.run_camera(get_camera_settings, self.camera.shutter_speed_mapping)
+        status = HTTPStatus.BAD_GATEWAY if settings["errors"] and not settings["iso"] else HTTPStatus.OK
+        return status, settings
+
+    async def set_settings(self, query, body):
+        values = [_text_field(body, name) for name in ("iso", "shutter", "aperture")]
+        if not any(values):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "give iso, shutter and/or aperture")
+        ok = await self.run_camera(self.camera.set, *values)
+        if not ok:
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, "the camera refused a setting; see the status events")
+        return HTTPStatus.OK, {"ok": True}
+
+    async def capture(self, query, body):
+        count = _number_field(body, "count", int, minimum=1) or 1
+
+        def capture():
+            # Cleared on the camera thread once run_camera() has checked that
+            # no intervalometer is running, so its pending stop is kept
+            self.camera.stop_event.clear()
+            return self.camera.capture(count)
+
+        files = await self.run_camera(capture)
+        result = {
+            "frames": self.camera.frames_taken,
+            "files": [os.path.relpath(path, self.save_path) for path in files],
+        }
+        return (HTTPStatus.OK if self.camera.frames_taken == count else HTTPStatus.BAD_GATEWAY), result
+
+    async def intervalometer_state(self, query, body):
+        return HTTPStatus.OK, {"running": self.camera.busy(), "frames_taken": self.camera.frames_taken}
+
+    async def start_intervalometer(self, query, body):
+        interval = _number_field(body, "interval", float, required=True, minimum=0.1)
+        frames = _number_field(body, "frames", int, required=True, minimum=1)
+        bulb = _number_field(body, "bulb", float, minimum=0.1)
+        if bulb and bulb >= interval:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "the interval must be longer than the bulb exposure")
+        policy = body.get("policy")
+        if policy is not None and policy not in OVERRUN_POLICIES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"policy must be one of {', '.join(OVERRUN_POLICIES)}")
+        pipelined = body.get("pipelined")
+        await self.run_camera(
+            self.camera.start_intervalometer, interval, frames,
+            bulb_seconds=bulb, pipelined=None if pipelined is None else bool(pipelined), policy=policy,
+        )
+        return HTTPStatus.ACCEPTED, {"running": True, "frames_taken": 0}
+
+    async def stop_intervalometer(self, query, body):
+        running = self.camera.busy()
+        self.camera.stop(wait=False)
+        return HTTPStatus.OK, {"running": running, "stopping": running}
+
+    async def list_files(self, query, body):
+        records, stderr = await self.run_camera(list_camera_files)
+        if stderr and not records:
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, stderr.strip())
+        files = [dict(record._asdict(), path=camera_path(record)) for record in records]
+        return HTTPStatus.OK, {"files": files}
+
+    async def download_file(self, query, body):
+        path = _text_field(query, "path")
+        if not path or not path.startswith("/"):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "path must be a camera file path from /api/files")
+        directory = tempfile.mkdtemp(prefix="camctrl-download-")
+        try:
+            local_path, stderr = await self.run_camera(
+                download_camera_file, path, directory, thumbnail=query.get("thumbnail") == "1",
+            )
+        except HTTPError:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        if not local_path:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, stderr.strip())
+        return HTTPStatus.OK, FileReply(local_path, directory)
+
+
+def main(argv=None):
+    config = load_config()
+    parser = argparse.ArgumentParser(description="Serve the camera over HTTP and WebSocket.")
+    parser.add_argument("--host", default=config["server_host"],
+                        help="address to listen on; 0.0.0.0 for the whole network (default from config.py)")
+    parser.add_argument("--port", type=int, default=config["server_port"])
+    parser.add_argument("--token", default=config["server_token"],
+                        help="require this token with every request (default from config.py)")
+    parser.add_argument("--dir", default=os.path.join(os.getcwd(), "captures"),
+                        help="directory captures are saved to (default ./captures)")
+    parser.add_argument("--verbose", "-v", action="store_true", help="print the gphoto2 output")
+    args = parser.parse_args(argv)
+
+    apply_simulator_config(config)
+    apply_metrics_config(config)
+    # Single file downloads need a gphoto2 shell, so the server always keeps one
+    set_session(GPhotoSession())
+    server = ControlServer(config, os.path.expanduser(args.dir), args.token, args.verbose)
+
+    async def run():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop_event.set)
+        await server.serve(args.host, args.port, stop_event)
+
+    try:
+        asyncio.run(run())
+    except OSError as e:
+        print(f"Error: cannot serve on {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        get_session().close()
+        set_session(None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Persistent gphoto2 session for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module uses gphoto2 command-line tool, which is licensed under GPL-2.0.
+# gphoto2 is a command-line frontend to libgphoto2.
+# For more information, visit: http://www.gphoto.org/
+
+"""Long-lived gphoto2 --shell session shared by camera operations."""
+
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+
+from cam_metrics import phase, retry
+from cam_sim import simulator_command, simulator_enabled
+
+# Command line options that have a direct equivalent in the gphoto2 shell,
+# mapped to (shell command, takes an argument)
+SHELL_ACTIONS = {
+    "--get-config": ("get-config", True),
+    "--set-config": ("set-config", True),
+    "--set-config-index": ("set-config-index", True),
+    "--set-config-value": ("set-config-value", True),
+    "--capture-image": ("capture-image", False),
+    "--capture-image-and-download": ("capture-image-and-download", False),
+    "--capture-preview": ("capture-preview", False),
+    "--summary": ("summary", False),
+}
+
+# stderr fragments meaning the USB link to the camera is gone or claimed
+USB_ERROR_MARKERS = (
+    "Could not claim",
+    "Não foi possível contactar",
+    "Error (-53",
+    "Erro (-53",
+    "Error (-52",
+    "Error (-7",
+    "Could not find the requested device",
+)
+
+_PROMPT_RE = re.compile(rb"gphoto2: \{[^\n]*\}[^\n]*> ?$")
+
+
+class SessionError(Exception):
+    """Raised when the gphoto2 shell cannot be started or stops responding."""
+
+
+class CommandLost(SessionError):
+    """
+    Raised when the shell fails after a command was sent.
+
+    The command may have run (a picture may have been taken), so it must
+    not be sent again. The shell has been closed, as its reply could
+    otherwise be read as the answer to the next command.
+    """
+
+
+def is_usb_error(stderr):
+    """Return True if gphoto2 stderr output reports a lost or busy USB link."""
+    return bool(stderr) and any(marker in stderr for marker in USB_ERROR_MARKERS)
+
+
+def gphoto2_command():
+    """
+    Return the gphoto2 executable as a list.
+
+    This is the camera simulator (cam_sim.py) instead when the
+    CAMCTRL_SIMULATOR environment variable is set.
+    """
+    if simulator_enabled():
+        return simulator_command()
+    return ["gphoto2"]
+
+
+def to_shell_commands(args):
+    """
+    Translate gphoto2 command line options into gphoto2 shell commands.
+
+    Args:
+        args: List of gphoto2 options, e.g. ["--get-config", "/main/imgsettings/iso"]
+
+    Returns:
+        List of shell command lines, or None if any option has no shell equivalent
+    """
+    commands = []
+    i = 0
+    while i < len(args):
+        action = SHELL_ACTIONS.get(args[i])
+        if action is None:
+            return None
+        name, takes_arg = action
+        if takes_arg:
+            if i + 1 >= len(args):
+                return None
+            commands.append(f"{name} {args[i + 1]}")
+            i += 2
+        else:
+            commands.append(name)
+            i += 1
+    return commands
+
+
+def run_once(args, command=None, cwd=None, timeout=None, cancel_event=None, line_callback=None):
+    """
+    Run a single gphoto2 process and wait for it to finish.
+
+    Args:
+        args: List of gphoto2 options
+        command: gphoto2 executable as a list (default gphoto2_command())
+        cwd: Working directory for the process (downloads land here)
+        timeout: Seconds to wait before killing the process
+        cancel_event: Optional threading.Event; setting it kills the process
+        line_callback: Optional function(line) called with each stdout line
+            as it is printed, e.g. to report progress
+
+    Returns:
+        Tuple (stdout, stderr)
+    """
+    with phase("spawn"):
+        p = subprocess.Popen(
+            list(command or gphoto2_command()) + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            cwd=cwd,
+        )
+    # The process claims the camera and runs the command; the two cannot
+    # be told apart from outside
+    with phase("command", nested=False):
+        return _wait_process(p, timeout, cancel_event, line_callback)
+
+
+def _wait_process(p, timeout, cancel_event, line_callback):
+    """Collect the output of a run_once() process; see run_once()."""
+    if cancel_event is None and line_callback is None:
+        try:
+            return p.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            p.kill()
+            stdout, stderr = p.communicate()
+            return stdout, (stderr or "") + f"Error: gphoto2 timed out after {timeout}s\n"
+
+    stdout_lines = []
+    stderr_parts = []
+
+    def read_stdout():
+        for line in p.stdout:
+            stdout_lines.append(line)
+            if line_callback:
+                line_callback(line)
+
+    def read_stderr():
+        stderr_parts.append(p.stderr.read())
+
+    readers = [
+        threading.Thread(target=read_stdout, daemon=True),
+        threading.Thread(target=read_stderr, daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    error = ""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while p.poll() is None:
+        if cancel_event is not None and cancel_event.wait(0.1):
+            p.kill()
+            error = "Error: cancelled\n"
+        elif cancel_event is None:
+            time.sleep(0.1)
+        if deadline is not None and time.monotonic() > deadline:
+            p.kill()
+            error = f"Error: gphoto2 timed out after {timeout}s\n"
+    p.wait()
+    for reader in readers:
+        reader.join()
+    return "".join(stdout_lines), "".join(stderr_parts) + error
+
+
+class GPhotoSession:
+    """
+    Keeps one `gphoto2 --shell` process open and sends commands over it.
+
+    The camera is claimed and the PTP session opened once, instead of on
+    every operation. Options without a shell equivalent (--auto-detect,
+    --list-files, ...) are run as a one-shot process after the shell is
+    closed, since only one process can claim the camera at a time; the
+    shell is reopened on the next command. A dead process or a USB error
+    closes the shell and the command is retried on a fresh one.
+    """
+
+    def __init__(self, command=None, timeout=300, start_timeout=15, max_reconnects=1):
+        """
+        Args:
+            command: gphoto2 executable as a list (default gphoto2_command())
+            timeout: Seconds to wait for a command to complete
+            start_timeout: Seconds to wait for the shell prompt on startup
+            max_reconnects: Times a command is retried on a fresh shell
+        """
+        self.command = list(command or gphoto2_command())
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.max_reconnects = max_reconnects
+        # Held for the whole of a command; reentrant so callers can group
+        # several commands into one atomic exchange with `with session.lock:`
+        self.lock = threading.RLock()
+        self._proc = None
+        self._local_dir = None
+        self.reconnects = 0
+
+    def is_open(self):
+        """Return True if the shell process is running."""
+        return self._proc is not None and self._proc.poll() is None
+
+    def open(self):
+        """Start the shell process and wait for its first prompt."""
+        with self.lock:
+            if self.is_open():
+                return
+            self.close()
+            try:
+                # --force-overwrite: an existing local file would otherwise
+                # make gphoto2 prompt on stdin, which carries our commands
+                with phase("spawn"):
+                    self._proc = subprocess.Popen(
+                        self.command + ["--force-overwrite", "--shell"],
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        bufsize=0,
+                    )
+            except OSError as e:
+                self._proc = None
+                raise SessionError(f"Could not start gphoto2 shell: {e}")
+            self._local_dir = None
+            try:
+                with phase("claim"):
+                    _, stderr = self._read_reply(self.start_timeout)
+            except SessionError:
+                self.close()
+                raise
+            if is_usb_error(stderr):
+                self.close()
+                raise SessionError(stderr.strip())
+
+    def close(self):
+        """Stop the shell process, releasing the camera."""
+        with self.lock:
+            proc, self._proc = self._proc, None
+            if proc is None:
+                return
+            if proc.poll() is None:
+                try:
+                    proc.stdin.write(b"exit\n")
+                    proc.stdin.flush()
+                    proc.wait(timeout=2)
+                except (OSError, subprocess.TimeoutExpired):
+                    proc.kill()
+                    proc.wait()
+            for stream in (proc.stdin, proc.stdout, proc.stderr):
+                try:
+                    stream.close()
+                except OSError:
+                    pass
+
+    def run(self, args, cwd=None, timeout=None, cancel_event=None, line_callback=None):
+        """
+        Run gphoto2 options through the session.
+
+        Args:
+            args: List of gphoto2 options, as for the command line
+            cwd: Local directory that downloaded files are written to
+            timeout: Seconds to wait (default: session timeout)
+            cancel_event, line_callback: See run_once(); only used for
+                options that run as a one-shot process
+
+        Returns:
+            Tuple (stdout, stderr), like Popen.communicate()
+        """
+        commands = to_shell_commands(args)
+        with self.lock:
+            if commands is None:
+                self.close()
+                return run_once(args, self.command, cwd=cwd, timeout=timeout,
+                                cancel_event=cancel_event, line_callback=line_callback)
+            try:
+                return self.shell(commands, cwd=cwd, timeout=timeout)
+            except CommandLost as e:
+                return "", str(e)
+            except SessionError:
+                # Shell unusable (not installed, camera gone); fall back
+                # to a one-shot process so the caller still gets an answer
+                self.close()
+                return run_once(args, self.command, cwd=cwd, timeout=timeout)
+
+    def run_batch(self, arg_groups, cwd=None, timeout=None):
+        """
+        Run several gphoto2 option groups in one session exchange.
+
+        Unlike run(), the reply of every group is returned separately, so an
+        error in one group cannot be confused with the output of another.
+
+        Args:
+            arg_groups: List of gphoto2 option lists
+            cwd: Local directory that downloaded files are written to
+            timeout: Seconds to wait for each command
+
+        Returns:
+            List of (stdout, stderr) tuples, one per group
+        """
+        command_groups = [to_shell_commands(args) for args in arg_groups]
+        with self.lock:
+            if any(commands is None for commands in command_groups):
+                return [self.run(args, cwd=cwd, timeout=timeout) for args in arg_groups]
+            flat = [line for commands in command_groups for line in commands]
+            try:
+                replies = self.shell(flat, cwd=cwd, timeout=timeout, split=True)
+            except CommandLost as e:
+                return [("", str(e))] * len(arg_groups)
+            except SessionError:
+                self.close()
+                return [run_once(args, self.command, cwd=cwd, timeout=timeout) for args in arg_groups]
+            results = []
+            for commands in command_groups:
+                group, replies = replies[:len(commands)], replies[len(commands):]
+                results.append((
+                    "".join(out for out, _ in group),
+                    "".join(err for _, err in group),
+                ))
+            return results
+
+    def shell(self, commands, cwd=None, timeout=None, split=False):
+        """
+        Send shell command lines and collect their combined output.
+
+        Reconnects and retries when the shell could not be started, or
+        when the camera answered with a USB error. A command whose reply
+        did not come is never sent again.
+
+        Args:
+            commands: List of gphoto2 shell command lines
+            cwd: Local directory that downloaded files are written to
+            timeout: Seconds to wait for each command
+            split: Return one (stdout, stderr) tuple per command line
+
+        Returns:
+            Tuple (stdout, stderr), or a list of them if split is True
+
+        Raises:
+            CommandLost: If the shell failed after a command was sent
+            SessionError: If the shell cannot be (re)started
+        """
+        with self.lock:
+            attempt = 0
+            while True:
+                try:
+                    self.open()
+                    if cwd is not None:
+                        self._set_local_dir(cwd, timeout)
+                    replies = self._exchange(commands, timeout)
+                except CommandLost:
+                    self.close()
+                    raise
+                except SessionError:
+                    if attempt >= self.max_reconnects:
+                        self.close()
+                        raise
+                    replies = None
+                if replies is not None:
+                    stderr = "".join(err for _, err in replies)
+                    if not is_usb_error(stderr) or attempt >= self.max_reconnects:
+                        if split:
+                            return replies
+                        return "".join(out for out, _ in replies), stderr
+                attempt += 1
+                self.reconnects += 1
+                retry()
+                self.close()
+
+    def _set_local_dir(self, path, timeout):
+        path = os.path.abspath(path)
+        if path != self._local_dir:
+            [(_, stderr)] = self._exchange([f"lcd {path}"], timeout)
+            if stderr:
+                raise SessionError(stderr.strip())
+            self._local_dir = path
+
+    def _exchange(self, commands, timeout):
+        """Send command lines one by one; return a (stdout, stderr) per line."""
+        replies = []
+        for line in commands:
+            try:
+                self._proc.stdin.write(line.encode("utf-8") + b"\n")
+                self._proc.stdin.flush()
+            except (OSError, AttributeError) as e:
+                # Safe to retry only if no line of this batch has run yet
+                error = CommandLost if replies else SessionError
+                raise error(f"gphoto2 shell closed: {e}")
+            try:
+                with phase("command", nested=False):
+                    stdout, stderr = self._read_reply(timeout or self.timeout)
+            except SessionError as e:
+                raise CommandLost(f"{line}: {e}")
+            replies.append((_strip_echo(stdout, line), stderr))
+        return replies
+
+    def _read_reply(self, timeout):
+        """Read until the next prompt; return (stdout, stderr) text before it."""
+        proc = self._proc
+        out_fd = proc.stdout.fileno()
+        err_fd = proc.stderr.fileno()
+        out = bytearray()
+        err = bytearray()
+        deadline = time.monotonic() + timeout
+        fds = [out_fd, err_fd]
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SessionError(f"gphoto2 shell did not answer within {timeout}s")
+            ready, _, _ = select.select(fds, [], [], remaining)
+            if err_fd in ready:
+                chunk = os.read(err_fd, 65536)
+                if chunk:
+                    err.extend(chunk)
+                else:
+                    # stderr stays readable at EOF; stop polling it
+                    fds.remove(err_fd)
+            if out_fd in ready:
+                chunk = os.read(out_fd, 65536)
+                if not chunk:
+                    raise SessionError("gphoto2 shell exited")
+                out.extend(chunk)
+                match = _PROMPT_RE.search(out)
+                if match:
+                    del out[match.start():]
+                    break
+        # gphoto2 writes errors before printing the next prompt, so anything
+        # still pending on stderr belongs to this reply
+        while select.select([err_fd], [], [], 0)[0]:
+            chunk = os.read(err_fd, 65536)
+            if not chunk:
+                break
+            err.extend(chunk)
+        return (
+            out.decode("utf-8", "replace").replace("\r", ""),
+            err.decode("utf-8", "replace").replace("\r", ""),
+        )
+
+
+def _strip_echo(stdout, line):
+    """Drop the command line echoed back by readline, if present."""
+    first, sep, rest = stdout.partition("\n")
+    if first.strip() == line.strip():
+        return rest
+    return stdout
@@ -0,0 +1,856 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Simulated camera for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+#
+# This module imitates the output of the gphoto2 command-line tool.
+# For more information on gphoto2, visit: http://www.gphoto.org/
+
+"""
+Stand-in for the gphoto2 command line tool, backed by a virtual camera.
+
+Run as a script it accepts the gphoto2 options CamCtrl uses, one-shot or
+with --shell, and prints what gphoto2 would. It is selected by setting
+CAMCTRL_SIMULATOR (or `simulator` in config.py), to "1" for the defaults
+or to comma separated options, e.g.
+
+    CAMCTRL_SIMULATOR="latency=0.05,mbps=20,usb_errors=0.1,seed=7" python camCtrl.py
+
+See DEFAULT_OPTIONS for the options. The camera settings and the virtual
+memory card are kept under the `dir` option, so they persist between
+gphoto2 processes like on a real camera; delete that directory to start
+over with a fresh card.
+"""
+
+import base64
+import io
+import json
+import os
+import random
+import signal
+import struct
+import sys
+import tempfile
+import time
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:  # Every picture is the same small grey JPEG
+    Image = ImageDraw = None
+
+# Environment variable that selects the simulator instead of gphoto2
+SIMULATOR_ENV = "CAMCTRL_SIMULATOR"
+
+DEFAULT_OPTIONS = {
+    # Directory holding the camera state and the virtual memory card
+    "dir": os.path.join(tempfile.gettempdir(), "camctrl-sim"),
+    # Seconds to claim the camera and open the PTP session, once per process
+    "startup": 0.3,
+    # Seconds of USB round trip added to every camera command
+    "latency": 0.02,
+    # Seconds a capture takes on top of the exposure time
+    "capture": 0.3,
+    # Transfer rate of downloads in MB/s
+    "mbps": 30.0,
+    # Size of the JPEG of each capture in KB
+    "jpeg_kb": 6000,
+    # Size of the RAW of each capture in KB; 0 captures JPEG only
+    "raw_kb": 0,
+    # Number of pictures on a new virtual card
+    "files": 20,
+    # Probability (0-1) that a camera command fails with a USB error
+    "usb_errors": 0.0,
+    # Seed of the USB error sequence, which is the same on every run
+    "seed": 0,
+}
+
+MODEL = "CamCtrl Simulator"
+PORT = "usb:001,004"
+
+# Folder captures are stored in on the virtual card
+CARD_FOLDER = "/store_00010001/DCIM/100CANON"
+
+# Size of the pictures drawn; files are padded to jpeg_kb
+IMAGE_SIZE = (1200, 800)
+PREVIEW_SIZE = (640, 424)
+THUMBNAIL_SIZE = (160, 120)
+
+USB_BUSY_ERROR = (
+    "*** Error ***\n"
+    "An error occurred in the io-library ('Could not claim the USB device'): "
+    "Could not claim interface 0 (Device or resource busy). Make sure no other "
+    "program or kernel module is using the device and you have read/write "
+    "access to the device.\n"
+    "*** Error (-53: 'Could not claim the USB device') ***\n"
+)
+
+# Shown when Pillow is not installed: a 16x16 grey JPEG
+BASE_JPEG = base64.b64decode(
+    "/9j/4AAQSkZJRgABAQAAAQABAAD/2wBDABALDA4MChAODQ4SERATGCgaGBYWGDEjJR0oOjM9PDkzODdASFxO"
+    "QERXRTc4UG1RV19iZ2hnPk1xeXBkeFxlZ2P/2wBDARESEhgVGC8aGi9jQjhCY2NjY2NjY2NjY2NjY2NjY2Nj"
+    "Y2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2NjY2P/wAARCAAQABADASIAAhEBAxEB/8QAFQABAQAAAAAAAAAA"
+    "AAAAAAAAAAb/xAAUEAEAAAAAAAAAAAAAAAAAAAAA/8QAFAEBAAAAAAAAAAAAAAAAAAAAAP/EABQRAQAAAAAA"
+    "AAAAAAAAAAAAAAD/2gAMAwEAAhEDEQA/AJMAH//Z"
+)
+
+# Start of a RAW file; the rest is zeros
+RAW_HEADER = b"II*\x00\x10\x00\x00\x00CR\x02\x00"
+
+SHUTTER_CHOICES = [
+    "30.0000s", "25.0000s", "20.0000s", "15.0000s", "10.0000s", "8.0000s", "6.0000s",
+    "5.0000s", "4.0000s", "3.0000s", "2.0000s", "1.5000s", "1.0000s", "0.5000s",
+    "0.3333s", "0.2500s", "0.2000s", "0.1666s", "0.1250s", "0.1000s", "0.0666s",
+    "0.0500s", "0.0333s", "0.0250s", "0.0166s", "0.0111s", "0.0100s", "0.0080s",
+    "0.0063s", "0.0050s", "0.0040s", "0.0031s", "0.0025s", "0.0020s", "0.0016s",
+    "0.0013s", "0.0010s", "0.0008s", "0.0006s", "0.0005s", "0.0004s", "0.0003s",
+    "0.0002s", "bulb",
+]
+
+# path: (label, type, choices, default value, read only)
+CONFIG_TREE = {
+    "/main/imgsettings/iso": (
+        "ISO Speed", "RADIO",
+        ["Auto", "100", "200", "400", "800", "1600", "3200", "6400", "12800"], "400", False,
+    ),
+    "/main/capturesettings/shutterspeed": (
+        "Shutter Speed", "RADIO", SHUTTER_CHOICES, "0.0080s", False,
+    ),
+    "/main/capturesettings/f-number": (
+        "F-Number", "RADIO",
+        ["f/1.4", "f/1.8", "f/2.8", "f/3.5", "f/4", "f/4.8", "f/5.6", "f/6.7",
+         "f/8", "f/11", "f/13", "f/16", "f/22"],
+        "f/5.6", False,
+    ),
+    "/main/settings/capturetarget": (
+        "Capture Target", "RADIO", ["Internal RAM", "Memory card"], "Memory card", False,
+    ),
+    "/main/actions/bulb": ("Bulb Mode", "TOGGLE", [], "0", False),
+    "/main/actions/eosremoterelease": (
+        "Canon EOS Remote Release", "RADIO",
+        ["None", "Press Half", "Press Full", "Release Half", "Release Full", "Immediate"],
+        "None", False,
+    ),
+    "/main/status/cameramodel": ("Camera Model", "TEXT", [], MODEL, True),
+    "/main/status/batterylevel": ("Battery Level", "TEXT", [], "100%", True),
+}
+
+
+class SimError(Exception):
+    """A command failed; the message is what gphoto2 prints on stderr."""
+
+
+def parse_options(text):
+    """
+    Parse the value of CAMCTRL_SIMULATOR.
+
+    Args:
+        text: "1" (or "true", "on", "yes") for the defaults, or options such
+            as "latency=0.05,usb_errors=0.1"
+
+    Returns:
+        Dictionary with every key of DEFAULT_OPTIONS
+
+    Raises:
+        ValueError: If an option is unknown or its value is invalid
+    """
+    options = dict(DEFAULT_OPTIONS)
+    text = (text or "").strip()
+    if text.lower() in ("", "1", "true", "on", "yes"):
+        return options
+    for item in text.split(","):
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if not sep or key not in DEFAULT_OPTIONS:
+            raise ValueError(f"Unknown simulator option {item.strip()!r}, expected one of {sorted(DEFAULT_OPTIONS)}")
+        kind = type(DEFAULT_OPTIONS[key])
+        try:
+            options[key] = kind(value.strip())
+        except ValueError:
+            raise ValueError(f"Invalid value for simulator option {key}: {value.strip()!r}")
+    return options
+
+
+def simulator_enabled():
+    """Return True if CAMCTRL_SIMULATOR selects the simulator."""
+    return os.environ.get(SIMULATOR_ENV, "").strip().lower() not in ("", "0", "false", "off", "no")
+
+
+def simulator_command():
+    """Return the command line that runs the simulator in place of gphoto2."""
+    return [sys.executable, os.path.abspath(__file__)]
+
+
+def exposure_seconds(value):
+    """
+    Read a shutter speed as seconds: "0.0040s", "1/250", '30"' or "30".
+
+    Returns:
+        Seconds, or None for "bulb" and unreadable values
+    """
+    value = value.strip().rstrip('"s')
+    try:
+        if "/" in value:
+            numerator, denominator = value.split("/", 1)
+            return float(numerator) / float(denominator)
+        return float(value)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def pad_jpeg(data, size):
+    """
+    Pad JPEG data to about size bytes.
+
+    The padding goes into APP15 segments right after the start-of-image
+    marker, so the file stays a valid JPEG that still ends in its
+    end-of-image marker.
+    """
+    missing = size - len(data)
+    segments = []
+    while missing >= 4:
+        # The length field counts itself but not the marker
+        length = min(missing - 2, 65535)
+        if 0 < missing - 2 - length < 4:
+            length -= 4
+        segments.append(b"\xff\xef" + struct.pack(">H", length) + bytes(length - 2))
+        missing -= length + 2
+    return data[:2] + b"".join(segments) + data[2:]
+
+
+def render_image(number, size, seed=0):
+    """
+    Draw picture number `number`: a star field on a noisy sky.
+
+    The stars drift a little from picture to picture, as with an
+    untracked mount, so alignment and live stacking have something to do.
+
+    Returns:
+        JPEG data
+    """
+    if Image is None:
+        return BASE_JPEG
+    width, height = size
+    sky = Image.effect_noise(size, 10).point(lambda v: max(0, v - 112))
+    draw = ImageDraw.Draw(sky)
+    stars = random.Random(seed)
+    dx, dy = number % 40, (number // 2) % 20
+    for _ in range(width * height // 4000):
+        x, y = stars.uniform(0, width) + dx, stars.uniform(0, height) + dy
+        radius = stars.choice((0.8, 1.2, 1.8, 2.5))
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=stars.randint(90, 255))
+    out = io.BytesIO()
+    sky.convert("RGB").save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class Camera:
+    """
+    The virtual camera: settings, a memory card and the USB claim.
+
+    The state is kept in files under options["dir"]: state.json holds the
+    settings and counters, card/ the pictures on the card (small JPEGs;
+    the sizes listed and downloaded are jpeg_kb and raw_kb), and claim the
+    pid of the process that has the camera. Like a real camera only one
+    process can claim it at a time; the others get USB error -53.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.root = options["dir"]
+        self.card_root = os.path.join(self.root, "card")
+        self.card_dir = os.path.join(self.card_root, CARD_FOLDER.lstrip("/"))
+        self.state_path = os.path.join(self.root, "state.json")
+        self.claim_path = os.path.join(self.root, "claim")
+        self.claimed = False
+        # Camera paths of files added since the last wait-event
+        self.events = []
+        self.bulb_opened = None
+        # time.monotonic() a closed bulb exposure is stored on the card at
+        self.bulb_stored = None
+        # capture-image-and-download names files capt0000... per process
+        self.capt_number = 0
+        os.makedirs(self.root, exist_ok=True)
+        self.state = self._load_state()
+        if not os.path.isdir(self.card_dir):
+            self._fill_card()
+
+    def _load_state(self):
+        state = {"config": {}, "next_number": 1, "commands": 0}
+        try:
+            with open(self.state_path) as f:
+                state.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return state
+
+    def _save_state(self):
+        temp = f"{self.state_path}.{os.getpid()}"
+        with open(temp, "w") as f:
+            json.dump(self.state, f)
+        os.replace(temp, self.state_path)
+
+    def _fill_card(self):
+        os.makedirs(self.card_dir, exist_ok=True)
+        count = self.options["files"]
+        now = time.time()
+        for index in range(count):
+            for path in self._store_capture():
+                mtime = now - (count - index) * 60
+                os.utime(self.local_card_path(path), (mtime, mtime))
+        self._save_state()
+
+    # --- USB link -------------------------------------------------------
+
+    def claim(self):
+        """
+        Claim the camera for this process, as gphoto2 does on first use.
+
+        Raises:
+            SimError: If another live process has the camera
+        """
+        if self.claimed:
+            return
+        try:
+            with open(self.claim_path) as f:
+                owner = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            owner = 0
+        if owner and owner != os.getpid() and _pid_alive(owner):
+            raise SimError(USB_BUSY_ERROR)
+        with open(self.claim_path, "w") as f:
+            f.write(str(os.getpid()))
+        self.claimed = True
+        time.sleep(self.options["startup"])
+
+    def release(self):
+        """Release the camera, if this process has it."""
+        if not self.claimed:
+            return
+        self.claimed = False
+        try:
+            with open(self.claim_path) as f:
+                if f.read().strip() != str(os.getpid()):
+                    return
+            os.remove(self.claim_path)
+        except OSError:
+            pass
+
+    def command(self):
+        """
+        Account for one camera command: claim, USB latency, injected errors.
+
+        Raises:
+            SimError: With a USB error, at the configured rate
+        """
+        self.claim()
+        time.sleep(self.options["latency"])
+        self.state["commands"] += 1
+        self._save_state()
+        rate = self.options["usb_errors"]
+        if rate > 0:
+            # Seeded by the command count, so the sequence of failures is
+            # the same on every run whichever processes sent the commands
+            if random.Random(f"{self.options['seed']}:{self.state['commands']}").random() < rate:
+                raise SimError(USB_BUSY_ERROR)
+
+    # --- Settings -------------------------------------------------------
+
+    def _config_path(self, name):
+        if name in CONFIG_TREE:
+            return name
+        for path in CONFIG_TREE:
+            if path.rsplit("/", 1)[1] == name.strip("/"):
+                return path
+        raise SimError(f"*** Error: {name} not found in configuration tree. ***\n")
+
+    def config_value(self, path):
+        return self.state["config"].get(path, CONFIG_TREE[path][3])
+
+    def get_config(self, name):
+        """Return the --get-config output for a config entry."""
+        self.command()
+        path = self._config_path(name)
+        label, kind, choices, _, readonly = CONFIG_TREE[path]
+        lines = [
+            f"Label: {label}",
+            f"Readonly: {int(readonly)}",
+            f"Type: {kind}",
+            f"Current: {self.config_value(path)}",
+        ]
+        lines += [f"Choice: {index} {choice}" for index, choice in enumerate(choices)]
+        lines.append("END")
+        return "\n".join(lines) + "\n"
+
+    def set_config(self, assignment, by_index=False):
+        """Apply a --set-config (or --set-config-index) "name=value"."""
+        self.command()
+        name, sep, value = assignment.partition("=")
+        if not sep:
+            raise SimError(f"*** Error: '{assignment}' is not of the form name=value. ***\n")
+        path = self._config_path(name)
+        _, kind, choices, _, readonly = CONFIG_TREE[path]
+        if readonly:
+            raise SimError(f"*** Error: '{path}' is read only. ***\n")
+        value = value.strip()
+        if by_index:
+            try:
+                value = choices[int(value)]
+            except (ValueError, IndexError):
+                raise SimError(f"Index {value} out of range.\n*** Error (-2: 'Bad parameters') ***\n")
+        elif kind == "RADIO":
+            value = self._match_choice(path, value, choices)
+        elif kind == "TOGGLE":
+            value = "1" if value.lower() in ("1", "on", "true") else "0"
+        self.state["config"][path] = value
+        self._save_state()
+        self._config_action(path, value)
+        return ""
+
+    @staticmethod
+    def _match_choice(path, value, choices):
+        if value in choices:
+            return value
+        if path.endswith("/f-number") and f"f/{value}" in choices:
+            return f"f/{value}"
+        if path.endswith("/shutterspeed"):
+            # Accept the display forms CamCtrl uses, e.g. "1/250" or '30"'
+            seconds = exposure_seconds(value)
+            for choice in choices:
+                other = exposure_seconds(choice)
+                if seconds and other and abs(other - seconds) <= other * 0.03:
+                    return choice
+        raise SimError(f"Choice {value} not found within list of choices.\n*** Error (-2: 'Bad parameters') ***\n")
+
+    def _config_action(self, path, value):
+        """Open or close the shutter for the bulb controls."""
+        if path.endswith("/bulb"):
+            opening, closing = value == "1", value == "0"
+        elif path.endswith("/eosremoterelease"):
+            opening, closing = value == "Press Full", value == "Release Full"
+        else:
+            return
+        if opening and self.bulb_opened is None:
+            self.bulb_opened = time.monotonic()
+        elif closing and self.bulb_opened is not None:
+            # The close is acknowledged at once; the file follows later
+            self.bulb_opened = None
+            self.bulb_stored = time.monotonic() + self.options["capture"]
+
+    def _store_bulb_capture(self):
+        if self.bulb_stored is not None:
+            time.sleep(max(0.0, self.bulb_stored - time.monotonic()))
+            self.bulb_stored = None
+            self.events += self._store_capture()
+
+    # --- Card -----------------------------------------------------------
+
+    def local_card_path(self, camera_path):
+        """Return the file of the virtual card holding a camera path."""
+        return os.path.join(self.card_root, camera_path.lstrip("/"))
+
+    def _capture_names(self, stem):
+        names = [f"{stem}.JPG"]
+        if self.options["raw_kb"] > 0:
+            names.insert(0, f"{stem}.CR2")
+        return names
+
+    def _store_capture(self):
+        """Write a new picture to the card; return its camera paths."""
+        number = self.state["next_number"]
+        self.state["next_number"] = number % 9999 + 1
+        paths = []
+        for name in self._capture_names(f"IMG_{number:04d}"):
+            path = f"{CARD_FOLDER}/{name}"
+            with open(self.local_card_path(path), "wb") as f:
+                if name.endswith(".JPG"):
+                    f.write(render_image(number, IMAGE_SIZE, self.options["seed"]))
+                else:
+                    f.write(RAW_HEADER)
+            paths.append(path)
+        self._save_state()
+        return paths
+
+    def _expose(self):
+        """Wait for the exposure set on the camera plus the capture time."""
+        seconds = exposure_seconds(self.config_value("/main/capturesettings/shutterspeed"))
+        time.sleep((seconds or 0) + self.options["capture"])
+
+    def file_size(self, camera_path):
+        """Size a card file has when downloaded."""
+        if camera_path.upper().endswith(".JPG"):
+            return max(self.options["jpeg_kb"] * 1024, os.path.getsize(self.local_card_path(camera_path)))
+        return max(self.options["raw_kb"] * 1024, len(RAW_HEADER))
+
+    def capture(self):
+        """Take a picture onto the card (capture-image)."""
+        self.command()
+        self._expose()
+        paths = self._store_capture()
+        return "".join(f"New file is in location {path} on the camera\n" for path in paths)
+
+    def capture_and_download(self, local_dir, local_name):
+        """
+        Take a picture into camera RAM and download it (capture-image-and-download).
+
+        Args:
+            local_dir: Directory relative local names are in
+            local_name: Function(camera file name) giving the local name
+
+        Returns:
+            stdout text
+        """
+        self.command()
+        self._expose()
+        out = []
+        for path in self._store_capture():
+            ext = os.path.splitext(path)[1].lower()
+            ram_path = f"/capt{self.capt_number:04d}{ext}"
+            self.capt_number += 1
+            out.append(f"New file is in location {ram_path} on the camera\n")
+            local = local_name(ram_path.lstrip("/"))
+            self._transfer(path, os.path.join(local_dir, local))
+            os.remove(self.local_card_path(path))
+            out.append(f"Saving file as {local}\n")
+            out.append(f"Deleting file {ram_path} on the camera\n")
+        return "".join(out)
+
+    def _transfer(self, camera_path, local_path, thumbnail=False):
+        """Write a card file to local_path, taking as long as the USB transfer."""
+        source = self.local_card_path(camera_path)
+        if not os.path.exists(source):
+            raise SimError(f"*** Error: File '{camera_path}' does not exist. ***\n*** Error (-108: 'File not found') ***\n")
+        started = time.monotonic()
+        if thumbnail:
+            data = BASE_JPEG
+            if Image is not None:
+                with Image.open(source) as image:
+                    image.thumbnail(THUMBNAIL_SIZE)
+                    out = io.BytesIO()
+                    image.save(out, "JPEG", quality=80)
+                    data = out.getvalue()
+        elif camera_path.upper().endswith(".JPG"):
+            with open(source, "rb") as f:
+                data = pad_jpeg(f.read(), self.file_size(camera_path))
+        else:
+            data = RAW_HEADER + bytes(self.file_size(camera_path) - len(RAW_HEADER))
+        with open(local_path, "wb") as f:
+            f.write(data)
+        remaining = len(data) / (self.options["mbps"] * 1e6) - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def download(self, camera_path, local_dir, thumbnail=False, name=None):
+        """Download one card file (get / get-thumbnail); return stdout text."""
+        self.command()
+        base = os.path.basename(camera_path)
+        if name is None:
+            name = f"thumb_{os.path.splitext(base)[0]}.jpg" if thumbnail else base
+        self._transfer(camera_path, os.path.join(local_dir, name), thumbnail)
+        return f"Saving file as {name}\n"
+
+    def delete(self, camera_path):
+        """Delete one card file."""
+        self.command()
+        try:
+            os.remove(self.local_card_path(camera_path))
+        except OSError:
+            raise SimError(f"*** Error: File '{camera_path}' does not exist. ***\n*** Error (-108: 'File not found') ***\n")
+        return ""
+
+    def card_files(self):
+        """Return [(folder, [file names])] for every folder on the card, in order."""
+        folders = []
+        for directory, dirs, files in os.walk(self.card_root):
+            dirs.sort()
+            folder = "/" + os.path.relpath(directory, self.card_root).replace(os.sep, "/")
+            folders.append((folder.rstrip("/.") or "/", sorted(files)))
+        return folders
+
+    def list_files(self, line_callback):
+        """Print the --list-files listing line by line."""
+        self.command()
+        for folder, names in self.card_files():
+            if not names:
+                line_callback(f"There is no file in folder '{folder}'.\n")
+                continue
+            if len(names) == 1:
+                line_callback(f"There is 1 file in folder '{folder}':\n")
+            else:
+                line_callback(f"There are {len(names)} files in folder '{folder}':\n")
+            for number, name in enumerate(names, 1):
+                path = f"{folder}/{name}"
+                kb = (self.file_size(path) + 1023) // 1024
+                mime = "image/jpeg" if name.upper().endswith(".JPG") else "image/x-canon-cr2"
+                mtime = int(os.path.getmtime(self.local_card_path(path)))
+                line_callback(f"#{number:<5} {name:<27} rd {kb:5d} KB {mime} {mtime}\n")
+                # Listing goes file by file over USB too
+                time.sleep(self.options["latency"] / 10)
+
+    def wait_event_and_download(self, argument, local_dir, line_callback):
+        """
+        Download files added by a bulb exposure (wait-event-and-download).
+
+        Args:
+            argument: "FILEADDED" to wait for the first new file, or a time
+                ("2s", "500ms") to download whatever arrives within it
+        """
+        self.command()
+        argument = argument.strip()
+        deadline = None
+        if argument.endswith("ms"):
+            deadline = time.monotonic() + float(argument[:-2]) / 1000
+        elif argument.endswith("s"):
+            deadline = time.monotonic() + float(argument[:-1])
+        self._store_bulb_capture()
+        while self.events:
+            path = self.events.pop(0)
+            line_callback(self.download(path, local_dir))
+            if deadline is None:
+                break
+        if deadline is not None:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    def preview(self, size=PREVIEW_SIZE):
+        """Return one live view frame as JPEG data."""
+        self.claim()
+        return render_image(int(time.monotonic() * 10), size, self.options["seed"])
+
+    def summary(self):
+        self.command()
+        return (
+            "Camera summary:\n"
+            f"Manufacturer: CamCtrl\nModel: {MODEL}\n"
+            f"Serial Number: {self.options['seed']:012d}\n"
+            f"Battery Level: {self.config_value('/main/status/batterylevel')}\n"
+        )
+
+
+def local_filename(pattern, camera_name, number):
+    """
+    Expand a gphoto2 --filename pattern.
+
+    %C is the suffix and %f the name without suffix of the camera file,
+    %n the file number and %% a percent sign.
+    """
+    stem, suffix = os.path.splitext(camera_name)
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == "%" and i + 1 < len(pattern):
+            field = pattern[i + 1]
+            out.append({"C": suffix.lstrip("."), "f": stem, "n": str(number), "%": "%"}.get(field, "%" + field))
+            i += 2
+        else:
+            out.append(pattern[i])
+            i += 1
+    return "".join(out)
+
+
+def run_command_line(camera, args, out, err):
+    """
+    Run gphoto2 command line options in order, like one gphoto2 process.
+
+    Returns:
+        Exit status
+    """
+    filename = None
+    if "--filename" in args:
+        index = args.index("--filename")
+        if index + 1 < len(args):
+            filename = args[index + 1]
+    flags = {"--force-overwrite", "--keep", "--quiet", "--stdout"}
+    # Options that take a value but perform no action
+    settings = {"--filename", "--port", "--camera"}
+    counter = [0]
+
+    def local_name(camera_name):
+        counter[0] += 1
+        if filename is None:
+            return camera_name
+        return local_filename(filename, camera_name, counter[0])
+
+    def write(text):
+        out.write(text)
+        out.flush()
+
+    i = 0
+    try:
+        while i < len(args):
+            option = args[i]
+            value = args[i + 1] if i + 1 < len(args) else None
+            takes_value = option in settings or option in (
+                "--get-config", "--set-config", "--set-config-index", "--set-config-value",
+            )
+            if takes_value and value is None:
+                raise SimError(f"gphoto2: option '{option}' requires an argument\n")
+            if option in flags or option in settings:
+                pass
+            elif option == "--auto-detect":
+                write(f"{'Model':<31}{'Port':<48}\n{'-' * 58}\n{MODEL:<31}{PORT}\n")
+            elif option == "--reset":
+                time.sleep(camera.options["latency"])
+            elif option == "--get-config":
+                write(camera.get_config(value))
+            elif option in ("--set-config", "--set-config-value"):
+                camera.set_config(value)
+            elif option == "--set-config-index":
+                camera.set_config(value, by_index=True)
+            elif option == "--summary":
+                write(camera.summary())
+            elif option == "--capture-image":
+                write(camera.capture())
+            elif option == "--capture-image-and-download":
+                write(camera.capture_and_download(os.getcwd(), local_name))
+            elif option == "--capture-preview":
+                name = local_name("capture_preview.jpg")
+                camera.command()
+                with open(name, "wb") as f:
+                    f.write(camera.preview())
+                write(f"Saving file as {name}\n")
+            elif option == "--capture-movie":
+                camera.claim()
+                if "--stdout" not in args:
+                    raise SimError("*** Error: the simulator streams movies to --stdout only. ***\n")
+                period = 1 / 30
+                while True:
+                    started = time.monotonic()
+                    out.buffer.write(camera.preview())
+                    out.buffer.flush()
+                    time.sleep(max(0.0, period - (time.monotonic() - started)))
+            elif option == "--list-files":
+                camera.list_files(write)
+            elif option == "--get-all-files":
+                for folder, names in camera.card_files():
+                    for name in names:
+                        write(camera.download(f"{folder}/{name}", os.getcwd(), name=local_name(name)))
+            else:
+                raise SimError(f"gphoto2: unrecognized option '{option}'\n")
+            i += 2 if takes_value else 1
+    except SimError as e:
+        err.write(str(e))
+        err.flush()
+        return 1
+    except BrokenPipeError:
+        return 1
+    return 0
+
+
+def run_shell(camera, stdin, out, err):
+    """
+    Answer gphoto2 --shell commands on stdin until exit or end of input.
+
+    Errors go to stderr before the next prompt, as with gphoto2.
+    """
+    local_dir = os.getcwd()
+
+    def write(text):
+        out.write(text)
+
+    try:
+        camera.claim()
+    except SimError as e:
+        # Reported with the first prompt; commands try to claim again
+        err.write(str(e))
+        err.flush()
+
+    while True:
+        out.write(f"gphoto2: {{{local_dir}}} /> ")
+        out.flush()
+        line = stdin.readline()
+        if not line:
+            break
+        name, _, argument = line.strip().partition(" ")
+        argument = argument.strip()
+        try:
+            if not name:
+                continue
+            if name in ("exit", "quit", "q"):
+                break
+            if name == "lcd":
+                path = os.path.abspath(os.path.join(local_dir, os.path.expanduser(argument or "~")))
+                if not os.path.isdir(path):
+                    raise SimError(f"*** Error: Could not change to local directory '{path}'. ***\n")
+                local_dir = path
+                write(f"Local directory now '{local_dir}'.\n")
+            elif name == "get-config":
+                write(camera.get_config(argument))
+            elif name in ("set-config", "set-config-value"):
+                camera.set_config(argument)
+            elif name == "set-config-index":
+                camera.set_config(argument, by_index=True)
+            elif name == "summary":
+                write(camera.summary())
+            elif name == "capture-image":
+                write(camera.capture())
+            elif name == "capture-image-and-download":
+                write(camera.capture_and_download(local_dir, lambda camera_name: camera_name))
+            elif name == "capture-preview":
+                camera.command()
+                with open(os.path.join(local_dir, "capture_preview.jpg"), "wb") as f:
+                    f.write(camera.preview())
+                write("Saving file as capture_preview.jpg\n")
+            elif name == "get":
+                write(camera.download(argument, local_dir))
+            elif name == "get-thumbnail":
+                write(camera.download(argument, local_dir, thumbnail=True))
+            elif name == "delete":
+                camera.delete(argument)
+            elif name == "wait-event-and-download":
+                camera.wait_event_and_download(argument or "FILEADDED", local_dir, write)
+            else:
+                raise SimError(f"*** Error: Invalid command '{name}'. ***\n")
+        except SimError as e:
+            err.write(str(e))
+            err.flush()
+        except (OSError, ValueError) as e:
+            err.write(f"*** Error: {e} ***\n")
+            err.flush()
+    return 0
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    try:
+        options = parse_options(os.environ.get(SIMULATOR_ENV, ""))
+    except ValueError as e:
+        sys.stderr.write(f"*** Error: {e} ***\n")
+        return 1
+    # Release the claim when stopped, e.g. when live view ends the movie stream
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    camera = Camera(options)
+    try:
+        if "--shell" in args:
+            return run_shell(camera, sys.stdin, sys.stdout, sys.stderr)
+        return run_command_line(camera, args, sys.stdout, sys.stderr)
+    finally:
+        camera.release()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
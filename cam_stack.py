@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Live stacking for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Live stacking: folds each new frame into a running integration."""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:  # Live stacking is unavailable
+    np = None
+
+from cam_calib import load_frame
+from cam_exposure import JPEG_EXTENSIONS, RAW_EXTENSIONS
+
+# "mean": average of the frames, the usual integration
+# "sum": total of the frames, e.g. for star trails in the saved stack
+STACK_MODES = ("mean", "sum")
+
+# Side of the central square used to measure the shift between frames
+ALIGN_SIZE = 1024
+
+# frames: frames in the stack; rejected: frames left out; shift: (dy, dx)
+# of the last frame; preview: uint8 array (H, W[, 3]) or None; path: file
+# the stack was saved to (final result only); error: message or ""
+StackResult = namedtuple(
+    "StackResult", ["frames", "rejected", "shift", "preview", "path", "error", "seconds"]
+)
+
+
+def pick_stack_file(paths):
+    """
+    Choose the file of a capture to stack: the JPEG if there is one.
+
+    JPEGs are stacked as they come out of the camera; shifting RAW data
+    would have to keep the colour filter pattern in step, so it is only
+    used when there is no JPEG.
+    """
+    for group in (JPEG_EXTENSIONS, (".npy",), RAW_EXTENSIONS):
+        for path in paths:
+            if os.path.splitext(path)[1].lower() in group:
+                return path
+    return None
+
+
+def _gray_center(frame, size=ALIGN_SIZE):
+    if frame.ndim == 3:
+        height, width = frame.shape[:2]
+    else:
+        height, width = frame.shape
+    h, w = min(size, height), min(size, width)
+    top, left = (height - h) // 2, (width - w) // 2
+    crop = frame[top:top + h, left:left + w]
+    if crop.ndim == 3:
+        crop = crop.mean(axis=2)
+    return crop - crop.mean()
+
+
+def phase_shift(reference, image):
+    """
+    Measure the translation between two 2D arrays by phase correlation.
+
+    Returns:
+        (dy, dx) in whole pixels that moves image onto reference
+    """
+    product = np.fft.rfft2(reference) * np.conj(np.fft.rfft2(image))
+    product /= np.abs(product) + 1e-12
+    correlation = np.fft.irfft2(product, s=reference.shape)
+    peak = np.unravel_index(int(np.argmax(correlation)), correlation.shape)
+    return tuple(int(p if p <= n // 2 else p - n) for p, n in zip(peak, correlation.shape))
+
+
+def add_shifted(total, count, frame, dy, dx):
+    """
+    Add frame, moved by (dy, dx), into total, and count the pixels covered.
+
+    Pixels moved off the edge are dropped, so no extra array is allocated.
+    """
+    height, width = frame.shape[:2]
+    src_y = slice(max(0, -dy), height - max(0, dy))
+    dst_y = slice(max(0, dy), height - max(0, -dy))
+    src_x = slice(max(0, -dx), width - max(0, dx))
+    dst_x = slice(max(0, dx), width - max(0, -dx))
+    total[dst_y, dst_x] += frame[src_y, src_x]
+    count[dst_y, dst_x] += 1
+
+
+def stretch_preview(total, count, size):
+    """
+    Return a downsampled, auto-stretched uint8 view of a stack.
+
+    The mean is taken at every step-th pixel only, then stretched between
+    its 1st and 99.9th percentiles with a gamma, which brings up the faint
+    detail the integration is for.
+    """
+    height, width = total.shape[:2]
+    step = max(1, -(-height // size[1]), -(-width // size[0]))
+    sample = total[::step, ::step]
+    covered = count[::step, ::step]
+    if sample.ndim == 3:
+        covered = covered[:, :, None]
+    mean = np.where(covered > 0, sample / np.maximum(covered, 1), 0)
+    low, high = np.percentile(mean, (1, 99.9))
+    scaled = np.clip((mean - low) / max(high - low, 1e-6), 0, 1) ** (1 / 2.2)
+    return (scaled * 255).astype(np.uint8)
+
+
+class Stack:
+    """
+    A running stack: a float32 total and a per-pixel frame count.
+
+    Memory is the total and the count plus the frame being added; frames
+    are not kept.
+    """
+
+    def __init__(self, mode="mean", align=True, max_shift=0.25):
+        """
+        Args:
+            mode: One of STACK_MODES
+            align: Correct translation between frames
+            max_shift: Largest shift accepted, as a fraction of the
+                alignment square; frames that moved further are rejected
+        """
+        if mode not in STACK_MODES:
+            raise ValueError(f"Unknown stack mode {mode!r}, expected one of {STACK_MODES}")
+        self.mode = mode
+        self.align = align
+        self.max_shift = max_shift
+        self.total = None
+        self.count = None
+        self.reference = None
+        self.frames = 0
+        self.rejected = 0
+
+    def add(self, frame):
+        """
+        Fold one float32 frame into the stack.
+
+        Returns:
+            (dy, dx) the frame was moved by
+
+        Raises:
+            ValueError: If the frame does not match the stack or moved too far
+        """
+        if self.total is None:
+            self.total = np.zeros(frame.shape, dtype=np.float32)
+            self.count = np.zeros(frame.shape[:2], dtype=np.uint16)
+            if self.align:
+                self.reference = _gray_center(frame)
+        elif frame.shape != self.total.shape:
+            raise ValueError(f"frame is {frame.shape}, the stack {self.total.shape}")
+        dy = dx = 0
+        if self.align and self.frames:
+            dy, dx = phase_shift(self.reference, _gray_center(frame))
+            if frame.ndim == 2:
+                # Keep a RAW colour filter pattern in step
+                dy, dx = dy - dy % 2, dx - dx % 2
+            limit = self.max_shift * min(self.reference.shape)
+            if abs(dy) > limit or abs(dx) > limit:
+                raise ValueError(f"moved {dy},{dx} px, too far to align")
+        add_shifted(self.total, self.count, frame, dy, dx)
+        self.frames += 1
+        return dy, dx
+
+    def result(self):
+        """Return the stacked image: the mean or the sum of the frames."""
+        covered = self.count if self.total.ndim == 2 else self.count[:, :, None]
+        mean = np.where(covered > 0, self.total / np.maximum(covered, 1), 0).astype(np.float32)
+        if self.mode == "sum":
+            # Edge pixels covered by fewer frames are scaled up to match
+            return mean * self.frames
+        return mean
+
+
+def _stack_loop(requests, results, mode, align, preview_size):
+    """Body of the stacking process: frames in, previews out."""
+    stack = Stack(mode, align)
+    shift = (0, 0)
+    while True:
+        request = requests.get()
+        if request[0] == "stop":
+            save_path, path, error = request[1], None, ""
+            if save_path and stack.frames:
+                try:
+                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                    np.save(save_path, stack.result())
+                    path = save_path
+                except OSError as e:
+                    error = f"saving the stack: {e}"
+            results.put(("done", StackResult(stack.frames, stack.rejected, shift, None, path, error, 0.0)))
+            return
+        started = time.perf_counter()
+        frame_path = request[1]
+        try:
+            shift = stack.add(load_frame(frame_path))
+            preview, error = stretch_preview(stack.total, stack.count, preview_size), ""
+        except (OSError, ValueError) as e:
+            stack.rejected += 1
+            preview, error = None, f"{os.path.basename(frame_path)}: {e}"
+        results.put(("frame", StackResult(
+            stack.frames, stack.rejected, shift, preview, None, error,
+            time.perf_counter() - started,
+        )))
+
+
+class LiveStacker:
+    """
+    Stacks captures in a separate process as they arrive.
+
+    submit() only queues the file name, so the capture thread is never
+    held up by decoding or aligning; results, with a preview of the stack
+    so far, come back through result_callback. Like ExposureAnalyzer the
+    process is forked, and a thread is used where fork is not available.
+    """
+
+    def __init__(self, mode="mean", align=True, preview_size=(480, 320), result_callback=None):
+        """
+        Args:
+            mode: One of STACK_MODES
+            align: Correct translation between frames
+            preview_size: (width, height) the preview is reduced to fit
+            result_callback: Function(StackResult) called on a listener
+                thread after each frame and once more after stop()
+
+        Raises:
+            RuntimeError: If NumPy is not installed
+            ValueError: If mode is unknown
+        """
+        if np is None:
+            raise RuntimeError("live stacking needs NumPy (pip install numpy)")
+        if mode not in STACK_MODES:
+            raise ValueError(f"Unknown stack mode {mode!r}, expected one of {STACK_MODES}")
+        self.result_callback = result_callback
+        if "fork" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("fork")
+            self._requests, self._results = context.Queue(), context.Queue()
+            self._worker = context.Process(
+                target=_stack_loop, name="live-stack", daemon=True,
+                args=(self._requests, self._results, mode, align, preview_size),
+            )
+        else:
+            self._requests, self._results = queue.Queue(), queue.Queue()
+            self._worker = threading.Thread(
+                target=_stack_loop, name="live-stack", daemon=True,
+                args=(self._requests, self._results, mode, align, preview_size),
+            )
+        self._listener = threading.Thread(target=self._listen, name="live-stack-results", daemon=True)
+        self._final = None
+
+    def start(self):
+        self._worker.start()
+        self._listener.start()
+
+    def submit(self, paths):
+        """Queue the files of one capture (e.g. a RAW+JPEG pair)."""
+        path = pick_stack_file(paths)
+        if path is not None:
+            self._requests.put(("frame", path))
+
+    def stop(self, save_path=None):
+        """
+        Stack the queued frames, optionally save the stack, and stop.
+
+        Args:
+            save_path: .npy file to save the stacked image to, or None
+
+        Returns:
+            Final StackResult
+        """
+        self._requests.put(("stop", save_path))
+        self._listener.join()
+        self._worker.join(timeout=10)
+        return self._final
+
+    def _listen(self):
+        while True:
+            try:
+                kind, result = self._results.get(timeout=1)
+            except queue.Empty:
+                if self._worker.is_alive():
+                    continue
+                kind, result = "done", StackResult(0, 0, (0, 0), None, None, "stacking stopped", 0.0)
+            if kind == "done":
+                self._final = result
+            if self.result_callback:
+                self.result_callback(result)
+            if kind == "done":
+                return
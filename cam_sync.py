@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Incremental camera-to-disk sync for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Download only the camera files that are not on disk yet, verified."""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cam_ops import get_session, download_camera_file
+from cam_files import list_camera_files, camera_path, record_key
+from cam_session import GPhotoSession
+
+# Kept in save_path; one JSON object per downloaded file, appended as each
+# file completes, so an interrupted sync resumes where it stopped
+MANIFEST_NAME = ".camctrl_sync.jsonl"
+
+# Files are downloaded here first and moved into place when verified
+PARTIAL_DIR = ".camctrl_partial"
+
+# gphoto2 lists sizes in whole KB, so a file may differ by up to this much
+SIZE_TOLERANCE = 1024
+
+_HASH_CHUNK = 1024 * 1024
+
+
+class SyncManifest:
+    """Record of camera files already copied to a directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        self.entries = {}
+        self._local_paths = set()
+        self.lock = threading.RLock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line of an interrupted sync
+                self.entries[entry["key"]] = entry
+                self._local_paths.add(entry["local"])
+
+    def is_synced(self, record):
+        """Return True if the file was downloaded and is still on disk."""
+        entry = self.entries.get(record_key(record))
+        return entry is not None and os.path.exists(os.path.join(self.directory, entry["local"]))
+
+    def local_name(self, record):
+        """
+        Choose where a camera file goes, relative to the directory.
+
+        Files are grouped by their camera folder (e.g. 100CANON/IMG_0001.JPG).
+        A name already used by a different camera file (e.g. after the card
+        was formatted) gets a numeric suffix rather than overwriting it.
+        """
+        with self.lock:
+            return self._local_name(record)
+
+    def _local_name(self, record):
+        entry = self.entries.get(record_key(record))
+        if entry is not None:
+            return entry["local"]
+        folder = os.path.basename(record.folder.rstrip("/")) or "camera"
+        local = os.path.join(folder, record.name)
+        stem, ext = os.path.splitext(local)
+        n = 1
+        while local in self._local_paths or os.path.exists(os.path.join(self.directory, local)):
+            local = f"{stem}_{n}{ext}"
+            n += 1
+        return local
+
+    def add(self, record, local, **extra):
+        """Record a completed download and append it to the manifest file."""
+        entry = {
+            "key": record_key(record),
+            "folder": record.folder,
+            "name": record.name,
+            "size": record.size,
+            "mtime": record.mtime,
+            "local": local,
+        }
+        entry.update(extra)
+        with self.lock:
+            self.entries[entry["key"]] = entry
+            self._local_paths.add(local)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        return entry
+
+
+class VerifyError(Exception):
+    """A downloaded file failed its size or integrity check."""
+
+
+def hash_file(path):
+    """
+    Return the SHA-256 hex digest and size of a file, and fsync it.
+
+    The file is read once; flushing it to disk here means a later rename
+    cannot leave a complete-looking but empty file after a crash.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb+") as f:
+        while True:
+            chunk = f.read(_HASH_CHUNK)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+        os.fsync(f.fileno())
+    return digest.hexdigest(), size
+
+
+def check_file(path, record):
+    """
+    Verify a downloaded file against its camera listing.
+
+    Checks the size and, for JPEGs, that the end-of-image marker is there
+    (a truncated transfer loses it).
+
+    Returns:
+        Tuple (sha256 hex digest, size in bytes)
+
+    Raises:
+        VerifyError: If the file is truncated or the wrong size
+    """
+    sha256, size = hash_file(path)
+    if record.size is not None and abs(size - record.size) >= SIZE_TOLERANCE:
+        raise VerifyError(f"size {size} bytes, camera lists {record.size // 1024} KB")
+    if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+        with open(path, "rb") as f:
+            f.seek(max(0, size - 4096))
+            # Some cameras pad the file after the marker
+            if b"\xff\xd9" not in f.read().rstrip(b"\x00\xff") + b"\xff":
+                raise VerifyError("JPEG end marker missing, file is truncated")
+    return sha256, size
+
+
+def verify_synced(save_path, status_callback=None, output_callback=None):
+    """
+    Re-hash synced files and compare them with the manifest.
+
+    Args:
+        save_path: Directory that was synced into
+        status_callback: Function(status_message, color) to update status
+        output_callback: Function(output_text) to report bad files
+
+    Returns:
+        List of (local path, problem) for files that are missing or changed
+    """
+    manifest = SyncManifest(save_path)
+    problems = []
+    for entry in manifest.entries.values():
+        path = os.path.join(save_path, entry["local"])
+        if not os.path.exists(path):
+            problems.append((path, "missing"))
+        elif "sha256" in entry and hash_file(path)[0] != entry["sha256"]:
+            problems.append((path, "checksum mismatch"))
+    if output_callback:
+        for path, problem in problems:
+            output_callback(f"{path}: {problem}\n")
+    if status_callback:
+        if problems:
+            status_callback(f"Verify: {len(problems)} of {len(manifest.entries)} file(s) bad", "red")
+        else:
+            status_callback(f"Verify: all {len(manifest.entries)} file(s) match", "green")
+    return problems
+
+
+def sync_camera(save_path, status_callback=None, output_callback=None,
+                progress_callback=None, cancel_event=None, session=None, workers=2,
+                records=None):
+    """
+    Copy new camera files to save_path, skipping ones copied before.
+
+    PTP transfers one file at a time, so files are read from the camera in
+    turn on the calling thread. Each finished transfer is handed to a pool
+    of `workers` threads that hash, check and fsync it and move it into
+    place, while the next file is already coming over USB. Files that fail
+    the check are left out of the manifest and fetched again next time.
+
+    Args:
+        save_path: Directory to sync into
+        status_callback: Function(status_message, color) to update status
+        output_callback: Function(output_text) to display progress
+        progress_callback: Optional function(done, total) after each file
+        cancel_event: Optional threading.Event that stops the sync between files
+        session: GPhotoSession to use (default: the active session, or a
+            private one if none is active)
+        workers: Threads verifying and writing files
+        records: FileRecords to copy (default: every file on the camera)
+
+    Returns:
+        Dictionary with 'downloaded' (local paths), 'skipped' (count),
+        'failed' (list of (camera path, error)), 'cancelled', 'bytes' and
+        'seconds' (transfer total), and 'mb_per_s'
+    """
+    result = {
+        "downloaded": [], "skipped": 0, "failed": [], "cancelled": False,
+        "bytes": 0, "seconds": 0.0, "mb_per_s": 0.0,
+    }
+
+    if records is None:
+        if status_callback:
+            status_callback("Listing camera files...", "blue")
+        records, stderr = list_camera_files(cancel_event)
+        if stderr:
+            if status_callback:
+                status_callback(f"Error: {stderr.strip()}", "red")
+            result["failed"].append(("", stderr.strip()))
+            return result
+
+    os.makedirs(save_path, exist_ok=True)
+    manifest = SyncManifest(save_path)
+    pending = [record for record in records if not manifest.is_synced(record)]
+    result["skipped"] = len(records) - len(pending)
+    if output_callback:
+        output_callback(
+            f"{len(records)} file(s) on camera, {result['skipped']} already synced, "
+            f"{len(pending)} to download\n"
+        )
+
+    # Leftovers of an interrupted transfer are incomplete; start them over
+    partial_dir = os.path.join(save_path, PARTIAL_DIR)
+    shutil.rmtree(partial_dir, ignore_errors=True)
+    os.makedirs(partial_dir, exist_ok=True)
+
+    lock = threading.Lock()
+    done = [0]
+    # Bounds the transferred files waiting for a verify worker
+    slots = threading.BoundedSemaphore(max(1, workers) * 2)
+
+    def failed(source, error):
+        with lock:
+            result["failed"].append((source, error))
+        if output_callback:
+            output_callback(f"Failed {source}: {error}\n")
+
+    def finish(record, partial):
+        source = camera_path(record)
+        try:
+            sha256, size = check_file(partial, record)
+            with manifest.lock:
+                local = manifest.local_name(record)
+                target = os.path.join(save_path, local)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(partial, target)
+                manifest.add(record, local, sha256=sha256)
+        except (VerifyError, OSError) as e:
+            failed(source, str(e))
+            return
+        finally:
+            shutil.rmtree(os.path.dirname(partial), ignore_errors=True)
+            slots.release()
+        with lock:
+            result["downloaded"].append(target)
+            result["bytes"] += size
+            done[0] += 1
+            count = done[0]
+        if output_callback:
+            output_callback(f"{source} -> {target}\n")
+        if progress_callback:
+            progress_callback(count, len(pending))
+
+    own_session = session is None and get_session() is None
+    session = session or get_session() or GPhotoSession()
+    start = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for index, record in enumerate(pending):
+                if cancel_event is not None and cancel_event.is_set():
+                    result["cancelled"] = True
+                    break
+                if status_callback:
+                    status_callback(f"Syncing {index + 1}/{len(pending)}: {record.name}", "blue")
+                source = camera_path(record)
+                # One directory per file: names repeat across camera folders
+                file_dir = os.path.join(partial_dir, str(index))
+                os.makedirs(file_dir, exist_ok=True)
+                slots.acquire()
+                partial, stderr = download_camera_file(source, file_dir, session)
+                if not partial:
+                    slots.release()
+                    failed(source, stderr.strip())
+                    continue
+                pool.submit(finish, record, partial)
+    finally:
+        if own_session:
+            session.close()
+        shutil.rmtree(partial_dir, ignore_errors=True)
+
+    result["seconds"] = time.monotonic() - start
+    if result["seconds"] > 0:
+        result["mb_per_s"] = result["bytes"] / result["seconds"] / 1e6
+    rate = f"{result['bytes'] / 1e6:.1f} MB at {result['mb_per_s']:.1f} MB/s"
+
+    if status_callback:
+        if result["cancelled"]:
+            status_callback(
+                f"Sync cancelled: {len(result['downloaded'])} file(s) downloaded, {rate}", "orange"
+            )
+        elif result["failed"]:
+            status_callback(
+                f"Sync finished with {len(result['failed'])} error(s): "
+                f"{len(result['downloaded'])} downloaded ({rate}), "
+                f"{result['skipped']} already synced",
+                "red",
+            )
+        else:
+            status_callback(
+                f"Sync done: {len(result['downloaded'])} downloaded ({rate}), "
+                f"{result['skipped']} already synced",
+                "green",
+            )
+    return result
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Camera thumbnails for CamCtrl
+#
+# Copyright (C) 2024 CamCtrl Contributors
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+"""Embedded thumbnails of camera files, kept in an on-disk LRU cache."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from cam_ops import get_session, download_camera_file
+from cam_files import camera_path, record_key
+from cam_session import GPhotoSession
+
+
+def default_cache_dir():
+    """Return ~/.cache/camctrl/thumbs, honouring XDG_CACHE_HOME."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "camctrl", "thumbs")
+
+
+class ThumbnailCache:
+    """
+    Thumbnails on disk, keyed by camera file identity.
+
+    The key covers folder, name, size and mtime, so a reused file name on
+    a reformatted card does not show a stale thumbnail. Each file's mtime
+    is bumped when it is read; once the cache grows past max_bytes, the
+    least recently used thumbnails are deleted. Entries are kept in least
+    recently used order with a running total, so trimming only looks at
+    the thumbnails it deletes.
+    """
+
+    def __init__(self, directory=None, max_bytes=200 * 1024 * 1024):
+        """
+        Args:
+            directory: Cache directory (default: default_cache_dir())
+            max_bytes: Size the cache is trimmed to
+        """
+        self.directory = os.path.expanduser(directory or default_cache_dir())
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        # path -> size, least recently used first
+        self._sizes = OrderedDict()
+        self._total = 0
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".jpg") and entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(entries):
+            self._sizes[path] = size
+            self._total += size
+
+    def path_for(self, record):
+        """Return where the thumbnail of a FileRecord is cached."""
+        digest = hashlib.sha1(record_key(record).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".jpg")
+
+    def get(self, record):
+        """Return the cached thumbnail path of a FileRecord, or None."""
+        path = self.path_for(record)
+        with self._lock:
+            if path not in self._sizes:
+                return None
+            try:
+                os.utime(path)
+            except OSError:
+                self._total -= self._sizes.pop(path)
+                return None
+            self._sizes.move_to_end(path)
+        return path
+
+    def put(self, record, source):
+        """
+        Move a downloaded thumbnail into the cache.
+
+        Returns:
+            Cached path
+
+        Raises:
+            OSError: If the file could not be moved
+        """
+        path = self.path_for(record)
+        # shutil.move falls back to copying when source is on another
+        # filesystem (e.g. /tmp on tmpfs), where os.replace fails
+        shutil.move(source, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total += size - self._sizes.pop(path, 0)
+            self._sizes[path] = size
+            self._trim()
+        return path
+
+    def clear(self):
+        """Delete every cached thumbnail."""
+        with self._lock:
+            for path in self._sizes:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._sizes = OrderedDict()
+            self._total = 0
+
+    def _trim(self):
+        # Keep the thumbnail just added, even if it alone is over the limit
+        while self._total > self.max_bytes and len(self._sizes) > 1:
+            path, size = self._sizes.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def fetch_thumbnails(records, cache, thumb_callback=None, status_callback=None,
+                     cancel_event=None, session=None):
+    """
+    Get the thumbnails of camera files, from the cache where possible.
+
+    Args:
+        records: FileRecords to get thumbnails for
+        cache: ThumbnailCache
+        thumb_callback: Optional function(record, path) called as each
+            thumbnail becomes available (path is None if it failed)
+        status_callback: Function(status_message, color) to update status
+        cancel_event: Optional threading.Event that stops between files
+        session: GPhotoSession to use (default: the active session, or a
+            private one if none is active)
+
+    Returns:
+        Dictionary mapping camera path to local thumbnail path, for the
+        thumbnails that could be fetched
+    """
+    thumbs = {}
+    missing = []
+    for record in records:
+        path = cache.get(record)
+        if path:
+            thumbs[camera_path(record)] = path
+            if thumb_callback:
+                thumb_callback(record, path)
+        else:
+            missing.append(record)
+
+    if not missing:
+        return thumbs
+
+    own_session = session is None and get_session() is None
+    session = session or get_session() or GPhotoSession()
+    # Inside the cache directory, so put() is a rename on the same filesystem
+    temp_dir = tempfile.mkdtemp(prefix="camctrl_thumbs_", dir=cache.directory)
+    failed = 0
+    try:
+        for index, record in enumerate(missing):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            if status_callback:
+                status_callback(f"Fetching thumbnails... {index + 1}/{len(missing)}", "blue")
+            local, _ = download_camera_file(camera_path(record), temp_dir, session, thumbnail=True)
+            path = None
+            if local:
+                try:
+                    path = cache.put(record, local)
+                except OSError as e:
+                    if status_callback:
+                        status_callback(f"Could not cache thumbnail of {record.name}: {e}", "orange")
+            if path:
+                thumbs[camera_path(record)] = path
+            else:
+                failed += 1
+            if thumb_callback:
+                thumb_callback(record, path)
+    finally:
+        if own_session:
+            session.close()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if status_callback:
+        if failed:
+            status_callback(f"{failed} thumbnail(s) could not be fetched", "orange")
+        else:
+            status_callback(f"{len(thumbs)} thumbnail(s) ready", "green")
+    return thumbs
@@ -57,6 +57,115 @@ shutter_speed_mapping = {
 # Pro/Astro: .tif, .tiff, .fits, .fit
 file_extensions = [".jpg", ".nef", ".cr2", ".arw", ".raf", ".orf", ".rw2", ".dng", ".3fr", ".pef", ".tif", ".tiff", ".fits", ".fit"]
 
+# Keep one gphoto2 shell open for all camera operations instead of starting
+# a new gphoto2 process (USB claim + PTP session) for every click or frame.
+# Set to False if another application needs to share the camera.
+persistent_session = True
+
+# Intervalometer: the delay is the time between the starts of two frames.
+# What to do when a frame (capture + download) takes longer than the delay:
+#   "skip"     - drop the missed frames and continue on the original cadence
+#   "catch_up" - take the missed frames back to back, then continue
+#   "stretch"  - take the next frame immediately and restart the cadence
+intervalometer_overrun_policy = "skip"
+
+# Pipelined intervalometer capture: frames stay on the camera card while the
+# next exposure is taken, and are downloaded in the background between
+# exposures. Useful for short delays with large RAW files. Always uses a
+# gphoto2 shell session, even if persistent_session is False.
+pipelined_capture = False
+
+# Name of captured files, without extension. Fields:
+#   {date} 20240131  {time} 213005  {ms} milliseconds, e.g. 042
+#   {seq}  frame counter of this session, e.g. {seq:04d} -> 0001
+# RAW+JPEG pairs share the name. Names are unique within a session even for
+# bursts and sub-second intervals.
+capture_filename_template = "{date}_{time}_{ms}_{seq:04d}"
+
+# CLI Output tab: number of lines kept on screen and how often (in ms) new
+# output is shown. Older lines are dropped from the screen; set
+# output_log_file to a path (e.g. "~/camctrl.log") to keep the full log.
+output_log_max_lines = 2000
+output_log_flush_ms = 200
+output_log_file = None
+
+# CLI Output tab: number of camera files shown per page by "List files"
+file_list_page_size = 100
+
+# Card browser: where thumbnails are cached (None: ~/.cache/camctrl/thumbs)
+# and how many MB the cache may use before the least recently viewed go
+thumbnail_cache_dir = None
+thumbnail_cache_mb = 200
+
+# Live view source: "preview" takes one preview frame at a time over the
+# persistent session, so settings can be changed while it runs; "movie"
+# streams the camera's movie feed, which is faster but blocks other
+# camera operations until live view is stopped.
+liveview_mode = "preview"
+# Frames per second requested from the camera and shown
+liveview_fps = 5
+
+# Focus assist metric: "hfr" (half-flux radius of stars, lower is sharper)
+# or "contrast" (Laplacian variance, higher is sharper), measured over the
+# central focus_roi fraction of each live view frame and capture
+focus_method = "hfr"
+focus_roi = 0.25
+
+# Show a histogram and the clipped highlights/shadows of each capture in
+# the Capture panel (computed in a background process; needs Pillow for
+# JPEG, or rawpy for RAW-only captures)
+exposure_stats = True
+
+# Bulb exposures: default exposure time in seconds, and the gphoto2 shell
+# commands that open and close the shutter. "set-config bulb=1"/"=0" works
+# for most cameras; Canon EOS bodies need
+# "set-config eosremoterelease=Press Full" / "set-config eosremoterelease=Release Full".
+bulb_seconds = 60
+bulb_open_command = "set-config bulb=1"
+bulb_close_command = "set-config bulb=0"
+
+# Calibration tab: how bias, dark and flat frames are combined into masters.
+# "median" is robust with few frames; "sigma_clip" averages the values within
+# calibration_sigma deviations of the median, which is less noisy with many
+# frames and still rejects satellite trails and cosmic rays. Needs NumPy.
+calibration_method = "median"
+calibration_sigma = 3.0
+
+# Intervalometer "Live stack": how frames are integrated ("mean", or "sum"
+# e.g. for star trails) and whether each frame is shifted to line up with
+# the first one (for an untracked mount or drift). Needs NumPy.
+live_stack_mode = "mean"
+live_stack_align = True
+
+# Time-lapse video ("Render video"): frames per second, (width, height) and
+# the ffmpeg executable used to encode it (H.264 .mp4). Captures are
+# letterboxed to the size.
+video_fps = 24
+video_size = (1920, 1080)
+ffmpeg_path = "ffmpeg"
+
+# Use a simulated camera instead of gphoto2, to try CamCtrl out or measure
+# it without a camera. True for the defaults, or options such as
+# "latency=0.05,mbps=20,raw_kb=25000,usb_errors=0.1" (see cam_sim.py).
+# The CAMCTRL_SIMULATOR environment variable takes precedence.
+simulator = False
+
+# Timing of camera operations (cam_metrics.py): a JSONL file that gets one
+# line per operation, with the time of each phase (process start, USB
+# claim, exposure, transfer, rename, retries), and a local port serving the
+# totals in Prometheus text format at http://127.0.0.1:<port>/metrics.
+# None turns either off.
+metrics_log = None
+metrics_port = None
+
+# Network control (cam_server.py): address and port of the HTTP/WebSocket
+# API, and a token every request must carry (None: no token). Use
+# server_host = "0.0.0.0" to reach the camera from other machines, and set
+# a token when you do.
+server_host = "127.0.0.1"
+server_port = 8765
+server_token = None
+
 # Add more configuration options here in the future
 # Example:
 # default_iso = 400
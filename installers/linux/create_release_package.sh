@@ -37,6 +37,27 @@ mkdir -p "$MINIMAL_DIR"
 # Copy essential files
 cp "$PROJECT_ROOT/camCtrl.py" "$MINIMAL_DIR/"
 cp "$PROJECT_ROOT/cam_ops.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_session.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_scheduler.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_pipeline.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_naming.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_dispatch.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_log.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_files.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_sync.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_thumbs.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_liveview.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_focus.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_exposure.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_bulb.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_calib.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_stack.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_render.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_sim.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_metrics.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_config.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_cli.py" "$MINIMAL_DIR/"
+cp "$PROJECT_ROOT/cam_server.py" "$MINIMAL_DIR/"
 cp "$PROJECT_ROOT/config.py" "$MINIMAL_DIR/"
 
 # Copy installer scripts
@@ -103,6 +103,27 @@ if [ "$STANDALONE" = true ]; then
     # Download core application files
     download_file "camCtrl.py" "$PROJECT_ROOT/camCtrl.py"
     download_file "cam_ops.py" "$PROJECT_ROOT/cam_ops.py"
+    download_file "cam_session.py" "$PROJECT_ROOT/cam_session.py"
+    download_file "cam_scheduler.py" "$PROJECT_ROOT/cam_scheduler.py"
+    download_file "cam_pipeline.py" "$PROJECT_ROOT/cam_pipeline.py"
+    download_file "cam_naming.py" "$PROJECT_ROOT/cam_naming.py"
+    download_file "cam_dispatch.py" "$PROJECT_ROOT/cam_dispatch.py"
+    download_file "cam_log.py" "$PROJECT_ROOT/cam_log.py"
+    download_file "cam_files.py" "$PROJECT_ROOT/cam_files.py"
+    download_file "cam_sync.py" "$PROJECT_ROOT/cam_sync.py"
+    download_file "cam_thumbs.py" "$PROJECT_ROOT/cam_thumbs.py"
+    download_file "cam_liveview.py" "$PROJECT_ROOT/cam_liveview.py"
+    download_file "cam_focus.py" "$PROJECT_ROOT/cam_focus.py"
+    download_file "cam_exposure.py" "$PROJECT_ROOT/cam_exposure.py"
+    download_file "cam_bulb.py" "$PROJECT_ROOT/cam_bulb.py"
+    download_file "cam_calib.py" "$PROJECT_ROOT/cam_calib.py"
+    download_file "cam_stack.py" "$PROJECT_ROOT/cam_stack.py"
+    download_file "cam_render.py" "$PROJECT_ROOT/cam_render.py"
+    download_file "cam_sim.py" "$PROJECT_ROOT/cam_sim.py"
+    download_file "cam_metrics.py" "$PROJECT_ROOT/cam_metrics.py"
+    download_file "cam_config.py" "$PROJECT_ROOT/cam_config.py"
+    download_file "cam_cli.py" "$PROJECT_ROOT/cam_cli.py"
+    download_file "cam_server.py" "$PROJECT_ROOT/cam_server.py"
     download_file "config.py" "$PROJECT_ROOT/config.py"
     
     # Download icon files
@@ -178,6 +199,27 @@ sudo chown "$USER:$USER" "$INSTALL_DIR" 2>/dev/null || true
 echo -e "${BLUE}Installing application files...${NC}"
 cp "$PROJECT_ROOT/camCtrl.py" "$INSTALL_DIR/"
 cp "$PROJECT_ROOT/cam_ops.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_session.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_scheduler.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_pipeline.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_naming.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_dispatch.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_log.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_files.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_sync.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_thumbs.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_liveview.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_focus.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_exposure.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_bulb.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_calib.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_stack.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_render.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_sim.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_metrics.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_config.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_cli.py" "$INSTALL_DIR/"
+cp "$PROJECT_ROOT/cam_server.py" "$INSTALL_DIR/"
 cp "$PROJECT_ROOT/config.py" "$INSTALL_DIR/"
 
 # Create Python virtual environment
@@ -213,10 +255,27 @@ exec python3 camCtrl.py "\$@"
 EOF
 chmod +x "$LAUNCHER_SCRIPT"
 
+# Headless launcher (no window); runs in the caller's directory
+CLI_LAUNCHER_SCRIPT="$INSTALL_DIR/${APP_NAME}-cli"
+cat > "$CLI_LAUNCHER_SCRIPT" << EOF
+#!/bin/bash
+# CamCtrl headless launcher script
+
+source "$VENV_DIR/bin/activate"
+
+if [ -d "$LIB_DIR/lib" ]; then
+    export LD_LIBRARY_PATH="$LIB_DIR/lib:\${LD_LIBRARY_PATH}"
+fi
+
+exec python3 "$INSTALL_DIR/cam_cli.py" "\$@"
+EOF
+chmod +x "$CLI_LAUNCHER_SCRIPT"
+
 # Create symlink in bin directory
 echo -e "${BLUE}Creating command symlink...${NC}"
 mkdir -p "$BIN_DIR"
 ln -sf "$LAUNCHER_SCRIPT" "$BIN_DIR/${APP_NAME}"
+ln -sf "$CLI_LAUNCHER_SCRIPT" "$BIN_DIR/${APP_NAME}-cli"
 
 # Install icons
 echo -e "${BLUE}Installing application icon...${NC}"
@@ -46,6 +46,7 @@ fi
 echo -e "This will remove CamCtrl from:"
 echo -e "  - ${RED}$INSTALL_DIR${NC}"
 echo -e "  - ${RED}$BIN_DIR/${APP_NAME}${NC}"
+echo -e "  - ${RED}$BIN_DIR/${APP_NAME}-cli${NC}"
 echo -e "  - ${RED}$DESKTOP_DIR/${APP_NAME}.desktop${NC}"
 echo ""
 read -p "Are you sure you want to uninstall? (y/N): " -n 1 -r
@@ -68,6 +69,10 @@ if [ -L "$BIN_DIR/${APP_NAME}" ] || [ -f "$BIN_DIR/${APP_NAME}" ]; then
     rm -f "$BIN_DIR/${APP_NAME}"
     echo -e "${GREEN}✓ Removed launcher${NC}"
 fi
+if [ -L "$BIN_DIR/${APP_NAME}-cli" ] || [ -f "$BIN_DIR/${APP_NAME}-cli" ]; then
+    rm -f "$BIN_DIR/${APP_NAME}-cli"
+    echo -e "${GREEN}✓ Removed headless launcher${NC}"
+fi
 
 # Remove desktop entry
 echo -e "${BLUE}Removing desktop entry...${NC}"